@@ -11,37 +11,13 @@ from rasterio.transform import Affine
 from datetime import datetime, timedelta
 import calendar
 from tqdm import tqdm
-
-def calculate_daily_wap(precipitation_data, a=0.9, max_n=44):
-    """
-    计算加权平均降水 (WAP)，严格遵循Lu (2009)公式
-    
-    参数：
-    precipitation_data: 3D数组 (days, height, width)，日降水数据（mm）
-    a: 衰减系数（默认0.9）
-    max_n: 最大回溯天数（默认44）
-    
-    返回：
-    daily_wap: 3D数组，每日WAP值
-    """
-    days, height, width = precipitation_data.shape
-    daily_wap = np.zeros_like(precipitation_data, dtype=np.float32)
-    
-    # 生成权重：从当前日向过去衰减 [a^0, a^1, ..., a^44]
-    weights = (1 - a) * (a ** np.arange(max_n + 1))  # 权重存储
-    
-    for day in range(days):
-        n_back = min(day, max_n)
-        # 取最近n_back+1天的数据（时间顺序：从旧到新）
-        window_data = precipitation_data[day - n_back : day + 1]  # 形状 (n_back+1, H, W)
-        # 对齐权重：最后n_back+1个权重（a^0最新，a^n_back最旧）
-        daily_wap[day] = np.sum(weights[:n_back + 1][::-1][:, None, None] * window_data, axis=0)
-    
-    return daily_wap
-
+from wap_kernels import calculate_daily_wap
 
 
 if __name__ == "__main__":
+    # WAP 的计算实现："numpy" 或 "numba"（需要安装 numba，结果一致）
+    backend = "numpy"
+
     # 1. 读取数据
     input_dir = r"P:\climate data\ERA5_land_total_precipitation_clipped"
     output_dir = r"P:\climate data\WAP_results_nob"
@@ -67,7 +43,7 @@ if __name__ == "__main__":
     
     # 2. 计算WAP（跨年连续计算）
     print("计算WAP...")
-    wap_result = calculate_daily_wap(precip_stack)
+    wap_result = calculate_daily_wap(precip_stack, backend=backend)
     
     # 3. 按年分割结果并输出
     print("输出结果...")
@@ -6,35 +6,13 @@ from datetime import datetime, timedelta
 from rasterio.windows import Window
 import calendar
 from tqdm import tqdm
+from wap_kernels import calculate_daily_wap
 
-def calculate_daily_wap(precipitation_data, a=0.9, max_n=44):
-    """
-    计算加权平均降水 (WAP)，严格遵循Lu (2009)公式
-    
-    参数：
-    precipitation_data: 3D数组 (days, height, width)，日降水数据（mm）
-    a: 衰减系数（默认0.9）
-    max_n: 最大回溯天数（默认44）
-    
-    返回：
-    daily_wap: 3D数组，每日WAP值
-    """
-    days, height, width = precipitation_data.shape
-    daily_wap = np.zeros_like(precipitation_data, dtype=np.float32)
-    
-    # 生成权重：从当前日向过去衰减 [a^0, a^1, ..., a^44]
-    weights = (1 - a) * (a ** np.arange(max_n + 1))  # 权重存储
-    
-    for day in range(days):
-        n_back = min(day, max_n)
-        # 取最近n_back+1天的数据（时间顺序：从旧到新）
-        window_data = precipitation_data[day - n_back : day + 1]  # 形状 (n_back+1, H, W)
-        # 对齐权重：最后n_back+1个权重（a^0最新，a^n_back最旧）
-        daily_wap[day] = np.sum(weights[:n_back + 1][::-1][:, None, None] * window_data, axis=0)
-    
-    return daily_wap
 
 if __name__ == "__main__":
+    # WAP 的计算实现："numpy" 或 "numba"（需要安装 numba，结果一致）
+    backend = "numpy"
+
     # 配置路径
     input_dir = r"P:\climate data\ERA5_land_total_precipitation_clipped"
     output_dir = r"P:\climate data\WAP_results"
@@ -66,7 +44,7 @@ if __name__ == "__main__":
         precip_stack = np.concatenate(precip_chunk, axis=0)  # (total_days, chunk_h, width)
 
         # 2.2 计算当前块的WAP
-        wap_chunk = calculate_daily_wap(precip_stack)
+        wap_chunk = calculate_daily_wap(precip_stack, backend=backend)
         del precip_stack  # 立即释放内存
 
         # 2.3 按年写入结果
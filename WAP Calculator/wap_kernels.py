@@ -0,0 +1,82 @@
+"""
+加权平均降水 (WAP) 的计算核心，WAP_calculator.py 与 WAP_calculator_blocks.py 共用。
+
+NumPy 实现逐日对最近 max_n + 1 天的数据栈加权求和；可选的 Numba 实现（需要安装 numba）
+逐像元沿时间轴滑动，按像元块用 prange 并行，不生成每日的 (n_back + 1, height, width) 加权中间数组。
+两者的累加顺序相同（由旧到新、float64），结果逐位一致，通过 backend 参数选择。
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # Numba 为可选依赖
+    njit = None
+
+PIXEL_BLOCK = 256  # Numba 实现中每个并行任务处理的像元数
+
+
+def wap_weights(a=0.9, max_n=44):
+    """权重：从当前日向过去衰减 (1 - a) * [a^0, a^1, ..., a^max_n]。"""
+    return (1 - a) * (a ** np.arange(max_n + 1))
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _wap_numba(precipitation, weights):
+        days, n_pixels = precipitation.shape
+        max_n = weights.shape[0] - 1
+        daily_wap = np.empty((days, n_pixels), dtype=np.float32)
+        n_blocks = (n_pixels + PIXEL_BLOCK - 1) // PIXEL_BLOCK
+        for block in prange(n_blocks):
+            start = block * PIXEL_BLOCK
+            stop = min(start + PIXEL_BLOCK, n_pixels)
+            acc = np.zeros(stop - start, dtype=np.float64)
+            for day in range(days):
+                n_back = min(day, max_n)
+                acc[:] = 0.0
+                # 与 NumPy 实现相同的累加顺序：由最旧的一天到当天
+                for j in range(day - n_back, day + 1):
+                    weight = weights[day - j]
+                    for i in range(stop - start):
+                        acc[i] += weight * precipitation[j, start + i]
+                for i in range(stop - start):
+                    daily_wap[day, start + i] = acc[i]
+        return daily_wap
+
+
+def calculate_daily_wap(precipitation_data, a=0.9, max_n=44, backend="numpy"):
+    """
+    计算加权平均降水 (WAP)，严格遵循Lu (2009)公式
+
+    参数：
+    precipitation_data: 3D数组 (days, height, width)，日降水数据（mm）
+    a: 衰减系数（默认0.9）
+    max_n: 最大回溯天数（默认44）
+    backend: "numpy" 或 "numba"（需要安装 numba，结果一致）
+
+    返回：
+    daily_wap: 3D数组，每日WAP值
+    """
+    weights = wap_weights(a, max_n)  # 权重存储
+
+    if backend == "numba":
+        if njit is None:
+            raise ImportError("The numba backend requires the optional 'numba' package (pip install numba)")
+        days = precipitation_data.shape[0]
+        flat = np.ascontiguousarray(precipitation_data).reshape(days, -1)
+        return _wap_numba(flat, weights).reshape(precipitation_data.shape)
+    if backend != "numpy":
+        raise ValueError(f"Unknown backend: {backend}")
+
+    days, height, width = precipitation_data.shape
+    daily_wap = np.zeros_like(precipitation_data, dtype=np.float32)
+
+    for day in range(days):
+        n_back = min(day, max_n)
+        # 取最近n_back+1天的数据（时间顺序：从旧到新）
+        window_data = precipitation_data[day - n_back : day + 1]  # 形状 (n_back+1, H, W)
+        # 对齐权重：最后n_back+1个权重（a^0最新，a^n_back最旧）
+        daily_wap[day] = np.sum(weights[:n_back + 1][::-1][:, None, None] * window_data, axis=0)
+
+    return daily_wap
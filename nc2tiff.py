@@ -10,11 +10,23 @@ import netCDF4 as nc
 from osgeo import gdal, osr, ogr
 import os
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+import multiprocessing
+import csv
 import time
 import matplotlib.pyplot as plt
 import math
 import re
+import sys
+# NetCDF 时间轴的解码与按年分组与 CN051_nc2tiff.py 共用 weather extreme/nc_time.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "weather extreme"))
+from nc_time import read_time, year_groups
+
+try:
+    import psutil
+except ImportError:  # psutil 为可选依赖，缺少时在 Linux 上读取 /proc
+    psutil = None
     
 def mkdir(path):
  
@@ -39,14 +51,33 @@ def pr_unit_convert(array):
    return array
 
 
+# 输入、输出文件夹（按变量与模式展开）
+INPUT_FOLDER = "H:\\NEX_Data_Update\\{var}v1.1\\{model}"
+OUTPUT_FOLDER = 'Q:\\QTP_Climate_extremes\\QTP_NEX_converted\\{var}\\{model}'
+SCENARIO_PATTERN = r"historical|ssp\d{3,4}"
+
+# 需要单位转换的变量
+UNIT_CONVERTERS = {"pr": pr_unit_convert}
+
+
+def process_bytes_read():
+    """当前进程累计从文件读取的字节数（NetCDF 压缩后的字节，包括命中系统缓存的读取），无法获取时为 None。"""
+    if psutil is not None:
+        counters = psutil.Process().io_counters()
+        return getattr(counters, "read_chars", counters.read_bytes)
+    try:
+        with open("/proc/self/io") as f:
+            return int(next(line for line in f if line.startswith("rchar")).split()[1])
+    except OSError:
+        return None
+
+
 def main(m):
     input_vars = ["pr"]     
-    lon_min_qtp, lon_max_qtp = 74.455225, 104.932482
-    lat_min_qtp, lat_max_qtp = 26.871997, 39.920726
 
     for _var in tqdm(input_vars):
-        input_folder = "H:\\NEX_Data_Update\\prv1.1\\" + m
-        output_folder ='Q:\\QTP_Climate_extremes\\QTP_NEX_converted\\' + _var + "\\" + m
+        input_folder = INPUT_FOLDER.format(var=_var, model=m)
+        output_folder = OUTPUT_FOLDER.format(var=_var, model=m)
         mkdir(output_folder)
         nc_path_list = [input_folder + '\\' + d for d in os.listdir(input_folder) if d[-3:] == '.nc']
         print(f'number of nc file:{len(nc_path_list)}')
@@ -54,91 +85,208 @@ def main(m):
         file_count = len(nc_path_list)
         
         for path in nc_path_list:
-            data = nc.Dataset(path)
-            lon = data.variables['lon'][:]
-            lat = data.variables['lat'][:]
-            out_arr = np.asarray(data.variables[_var])#输入需要转换的波段名称
-            #影像的最边缘像元的中心坐标
-            lonMin, latMax, lonMax, latMin = [lon.min(), lat.max(), lon.max(), lat.min()]
-            
-            #分辨率计算
-            n_lat = len(lat)
-            n_lon = len(lon)
-            lon_res = (lonMax - lonMin)/(float(n_lon) - 1)
-            lat_res = (latMax - latMin)/(float(n_lat) - 1)
-            
-            #根据输入的研究区的最大范围进行数据切片
-            x_offset = int((lon_min_qtp - (lonMin-0.5*lon_res))/lon_res)  #裁剪中国区域
-            y_offset = int((lat_min_qtp - (latMin-0.5*lat_res))/lat_res)
-            x_offset_max = int((lon_max_qtp - (lonMin-0.5*lon_res))/lon_res)+1
-            y_offset_max = int((lat_max_qtp - (latMin-0.5*lat_res))/lat_res)+1
-            
-            out_arr = out_arr[:, y_offset:y_offset_max, x_offset:x_offset_max]
-            
-            #读取时间信息
-            time = list(nc.num2date(data.variables['time'][:], data.variables['time'].units,\
-                               calendar=data.variables['time'].calendar).data)
-            # 下面是转换过程
-            # 将原始异常值替换为np.nan
-            out_arr[out_arr[:, :] == data.variables[_var]._FillValue] = np.nan
-            
-            #单位转换并上下翻转
-            out_arr = pr_unit_convert(out_arr)[:, ::-1, :]
-            
-            match = re.search(r"historical|ssp\d{3,4}", path)
-            if match:
-                scenario = match.group()
-            
-            
-            #将年份信息提取为字符串
-            for t in range(len(time)):
-                time[t] = str(time[t]).split()[0]
-            count = 0
-            while time != []:
-                temp_time = []
-                for i in range(len(time)):
-                    if temp_time == []:
-                        temp_time.append(time[i])
-                    elif time[i].split('-')[0] == temp_time[0].split('-')[0]:
-                        temp_time.append(time[i]) 
-                driver = gdal.GetDriverByName('GTiff')
-                out_tif_name = output_folder + '\\' + m + "_" +  _var + '_' + scenario + "_" +\
-                    temp_time[0].split('-')[0] + '.tif'
-                out_tif = driver.Create(out_tif_name, out_arr.shape[2], out_arr.shape[1], len(temp_time), gdal.GDT_Float32, options=["COMPRESS=LZW"])
-                #设置仿射变换函数
-                
-                #数组切片只能存储0.25的整数倍的空间范围，所以这里存储数据时需要进行转化
-                lon_min_qtp_gt = math.floor(lon_min_qtp / 0.25) * 0.25
-                lat_max_qtp_gt = math.ceil(lat_max_qtp / 0.25) * 0.25
-                
-                geotransform = (lon_min_qtp_gt, lon_res, 0, lat_max_qtp_gt, 0, -lat_res)
-                out_tif.SetGeoTransform(geotransform)
-                
-                #获取地理坐标系
-                srs = osr.SpatialReference()
-                srs.ImportFromEPSG(4326)#定义输出的坐标系统为WGS84
-                out_tif.SetProjection(srs.ExportToWkt())#给新建图层创建投影信息
-                for i in range(len(temp_time)):
-                    raster_band = out_tif.GetRasterBand(i + 1)
-                    raster_band.SetDescription(temp_time[i])
-                    raster_band.WriteArray(out_arr[count + i, :, :])
-                    raster_band.SetNoDataValue(np.nan)
-                out_tif.FlushCache()
-                del out_tif
-                count += len(temp_time)
-                for i in temp_time:
-                    time.remove(i)
+            convert_file(path, _var, output_folder, m)
     
     print('---script ending---')    
+
+
+def convert_file(path, _var, output_folder, m, io_lock=None):
+    """
+    把一个 NEX-GDDP-CMIP6 NetCDF 文件逐年裁剪为 QTP 范围的多波段 GeoTIFF（每年一个文件）。
+
+    参数：
+    path: NetCDF 文件路径
+    _var: 变量名（如 "pr"）
+    output_folder: 输出文件夹
+    m: 模式名（用于输出文件名）
+    io_lock: 可选，读取每年的数据块时进入的上下文管理器（如多进程共享的 Semaphore）；
+             GeoTIFF 的 LZW 压缩与写出不占用，避免把 CPU 密集的压缩也串行化
+
+    返回：
+    stats: dict - 从文件读取的字节数 "bytes_read"（无法统计时为 None）、解压后的数组字节数 "bytes_decoded"、
+           写出的字节数 "bytes_written"、年份数 "years"
+    """
+    io_lock = nullcontext() if io_lock is None else io_lock
+    stats = {"bytes_read": 0, "bytes_decoded": 0, "bytes_written": 0, "years": 0}
+    lon_min_qtp, lon_max_qtp = 74.455225, 104.932482
+    lat_min_qtp, lat_max_qtp = 26.871997, 39.920726
+
+    data = nc.Dataset(path)
+    lon = data.variables['lon'][:]
+    lat = data.variables['lat'][:]
+    var = data.variables[_var]#输入需要转换的波段名称
+    var.set_auto_mask(False)  #按原始数值读取，下面把 _FillValue 替换为 np.nan
+    #影像的最边缘像元的中心坐标
+    lonMin, latMax, lonMax, latMin = [lon.min(), lat.max(), lon.max(), lat.min()]
+    
+    #分辨率计算
+    n_lat = len(lat)
+    n_lon = len(lon)
+    lon_res = (lonMax - lonMin)/(float(n_lon) - 1)
+    lat_res = (latMax - latMin)/(float(n_lat) - 1)
+    
+    #根据输入的研究区的最大范围进行数据切片
+    x_offset = int((lon_min_qtp - (lonMin-0.5*lon_res))/lon_res)  #裁剪中国区域
+    y_offset = int((lat_min_qtp - (latMin-0.5*lat_res))/lat_res)
+    x_offset_max = int((lon_max_qtp - (lonMin-0.5*lon_res))/lon_res)+1
+    y_offset_max = int((lat_max_qtp - (latMin-0.5*lat_res))/lat_res)+1
+    
+    #读取时间信息：按 calendar（noleap、360_day、proleptic_gregorian 等）向量化解码为年份与日期字符串
+    years, dates = read_time(data)
+    match = re.search(SCENARIO_PATTERN, path)
+    if match:
+        scenario = match.group()
+    
+    
+    #按年份切分时间轴
+    for year, count, stop in year_groups(years):
+        temp_time = dates[count:stop]
+        
+        # 下面是转换过程
+        # 只读取当年、研究区范围内的数据块（hyperslab），内存中只保留一年的裁剪区
+        with io_lock:
+            read_start = process_bytes_read()
+            out_arr = var[count:stop, y_offset:y_offset_max, x_offset:x_offset_max]
+            read_end = process_bytes_read()
+        if read_start is None or read_end is None or stats["bytes_read"] is None:
+            stats["bytes_read"] = None
+        else:
+            stats["bytes_read"] += read_end - read_start
+        stats["bytes_decoded"] += out_arr.nbytes
+        # 将原始异常值替换为np.nan
+        out_arr[out_arr == var._FillValue] = np.nan
+        
+        #单位转换并上下翻转
+        if _var in UNIT_CONVERTERS:
+            out_arr = UNIT_CONVERTERS[_var](out_arr)
+        out_arr = out_arr[:, ::-1, :]
+        
+        driver = gdal.GetDriverByName('GTiff')
+        out_tif_name = output_folder + '\\' + m + "_" +  _var + '_' + scenario + "_" + str(year) + '.tif'
+        out_tif = driver.Create(out_tif_name, out_arr.shape[2], out_arr.shape[1], len(temp_time), gdal.GDT_Float32, options=["COMPRESS=LZW"])
+        #设置仿射变换函数
+        
+        #数组切片只能存储0.25的整数倍的空间范围，所以这里存储数据时需要进行转化
+        lon_min_qtp_gt = math.floor(lon_min_qtp / 0.25) * 0.25
+        lat_max_qtp_gt = math.ceil(lat_max_qtp / 0.25) * 0.25
+        
+        geotransform = (lon_min_qtp_gt, lon_res, 0, lat_max_qtp_gt, 0, -lat_res)
+        out_tif.SetGeoTransform(geotransform)
+        
+        #获取地理坐标系
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(4326)#定义输出的坐标系统为WGS84
+        out_tif.SetProjection(srs.ExportToWkt())#给新建图层创建投影信息
+        for i in range(len(temp_time)):
+            raster_band = out_tif.GetRasterBand(i + 1)
+            raster_band.SetDescription(temp_time[i])
+            raster_band.WriteArray(out_arr[i, :, :])
+            raster_band.SetNoDataValue(np.nan)
+        out_tif.FlushCache()
+        del out_tif
+        stats["bytes_written"] += os.path.getsize(out_tif_name)
+        stats["years"] += 1
+    data.close()
+    return stats
+
+
+_io_semaphore = None
+
+
+def _init_worker(semaphore):
+    """工作进程初始化：保存共享的 I/O 信号量。"""
+    global _io_semaphore
+    _io_semaphore = semaphore
+
+
+def _convert_task(path, _var, output_folder, m):
+    """在工作进程中转换一个文件，统计耗时与吞吐量。"""
+    task_start = time.perf_counter()
+    stats = convert_file(path, _var, output_folder, m, io_lock=_io_semaphore)
+    seconds = time.perf_counter() - task_start
+    stats.update({"model": m, "var": _var, "file": os.path.basename(path), "seconds": round(seconds, 3),
+                  "read_mb_per_s": (round(stats["bytes_read"] / 1024 ** 2 / seconds, 2)
+                                    if stats["bytes_read"] is not None and seconds > 0 else None),
+                  "decoded_mb_per_s": round(stats["bytes_decoded"] / 1024 ** 2 / seconds, 2) if seconds > 0 else None})
+    return stats
+
+
+def batch_convert(models, variables, scenarios=None, workers=8, io_limit=2, report_file=None):
+    """
+    多模式 × 多变量 × 多情景的批量转换：每个 NetCDF 文件在进程池的工作进程中独立转换
+    （GDAL 句柄不在线程间共享，单个文件出错或崩溃只记录，不影响其余文件）。
+
+    参数：
+    models: 模式名列表（如 ["ACCESS-CM2", "MIROC6"]）
+    variables: 变量名列表（如 ["pr", "tasmax"]），输入输出文件夹按 INPUT_FOLDER / OUTPUT_FOLDER 展开
+    scenarios: 可选，只转换文件名中包含这些情景的文件（如 ["historical", "ssp245"]）；None 为全部
+    workers: 进程数
+    io_limit: 同时读取 NetCDF 的最大进程数（所有进程共享一个信号量，写 GeoTIFF 不受限制）
+    report_file: 可选，逐文件统计（耗时、从文件读取/解压后/写出的字节数、读取与解压吞吐量 MB/s、错误）写出为 CSV
+
+    返回：
+    reports: list of dict，每个文件一条统计
+    """
+    tasks = []
+    for m in models:
+        for _var in variables:
+            input_folder = INPUT_FOLDER.format(var=_var, model=m)
+            output_folder = OUTPUT_FOLDER.format(var=_var, model=m)
+            if not os.path.isdir(input_folder):
+                print(f"Warning: {input_folder} not found, skipping...")
+                continue
+            os.makedirs(output_folder, exist_ok=True)
+            for d in sorted(os.listdir(input_folder)):
+                match = re.search(SCENARIO_PATTERN, d)
+                if d[-3:] != '.nc' or (scenarios is not None and (match is None or match.group() not in scenarios)):
+                    continue
+                tasks.append((os.path.join(input_folder, d), _var, output_folder, m))
+    print(f'number of nc file:{len(tasks)}')
+
+    batch_start = time.perf_counter()
+    reports = []
+    semaphore = multiprocessing.Semaphore(io_limit)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(semaphore,)) as pool:
+        futures = {pool.submit(_convert_task, *task): task for task in tasks}
+        progress = tqdm(as_completed(futures), total=len(futures), desc="Converting NetCDF files")
+        for future in progress:
+            path, _var, _, m = futures[future]
+            try:
+                stats = future.result()
+                progress.set_postfix_str(f"{stats['file']}: {stats['read_mb_per_s']} MB/s")
+            except Exception as error:
+                print(f"Warning: failed to convert {path}: {error!r}")
+                stats = {"model": m, "var": _var, "file": os.path.basename(path), "error": repr(error)}
+            reports.append(stats)
+    seconds = time.perf_counter() - batch_start
+
+    total_read = sum(stats.get("bytes_read") or 0 for stats in reports) / 1024 ** 2
+    total_decoded = sum(stats.get("bytes_decoded", 0) for stats in reports) / 1024 ** 2
+    failed = sum("error" in stats for stats in reports)
+    print(f"converted {len(reports) - failed}/{len(reports)} files in {seconds:.1f} s: "
+          f"{total_read:.1f} MB read ({total_read / seconds if seconds > 0 else 0:.2f} MB/s), "
+          f"{total_decoded:.1f} MB decoded ({total_decoded / seconds if seconds > 0 else 0:.2f} MB/s)")
+    if report_file is not None:
+        fields = ["model", "var", "file", "years", "seconds", "bytes_read", "bytes_decoded", "bytes_written",
+                  "read_mb_per_s", "decoded_mb_per_s", "error"]
+        with open(report_file, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(reports)
+    return reports
                 
                         
 if __name__ == '__main__':
     start = time.time()
     mode_list = ["ACCESS-CM2"]
-    for m in mode_list:
-        main(m)
-    # with ThreadPoolExecutor(max_workers=9) as pool:
-    #     pool.map(main, mode_list)
+    # 批量转换：模式 × 变量 × 情景，每个文件在独立的工作进程中转换，io_limit 限制同时读取 NetCDF 的进程数
+    batch = True
+    if batch:
+        batch_convert(mode_list, ["pr"], scenarios=None, workers=8, io_limit=2,
+                      report_file='Q:\\QTP_Climate_extremes\\QTP_NEX_converted\\conversion_report.csv')
+    else:
+        for m in mode_list:
+            main(m)
     end = time.time()
     print("----------script ending----------")
     print(f"time: {end - start}")
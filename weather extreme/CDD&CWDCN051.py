@@ -2,6 +2,7 @@ import os
 import numpy as np
 import rasterio
 from tqdm import tqdm
+from etccdi_kernels import cdd_cwd
 
 # 输入降水数据目录
 pre_dir = r"F:\QTP_CN05.1_converted\pre"
@@ -14,6 +15,12 @@ os.makedirs(output_dir_cwd, exist_ok=True)
 # 处理的年份范围（仅 1961-2014）
 start_year, end_year = 1961, 2014
 
+# 是否同时输出干/湿连续段的个数与平均长度
+with_stats = False
+
+# 连续段扫描的实现："numpy" 或 "numba"（需要安装 numba，结果一致）
+backend = "numpy"
+
 # 遍历每年的数据
 for year in tqdm(range(start_year, end_year + 1), desc="Computing CDD & CWD"):
     input_file = os.path.join(pre_dir, f"pre_{year}.tif")
@@ -28,40 +35,14 @@ for year in tqdm(range(start_year, end_year + 1), desc="Computing CDD & CWD"):
         meta = src.meta.copy()
         meta.update({"count": 1, "dtype": "float32", "compress": "lzw"})  # 适配单波段输出
 
-        cdd_max = np.zeros((src.height, src.width), dtype=np.float32)  # 最长干旱日数
-        cwd_max = np.zeros((src.height, src.width), dtype=np.float32)  # 最长湿日数
-
         # 读取所有日降水数据
         precip_data = src.read()  # 形状为 (days, height, width)
 
-        # 遍历每个像素
-        for i in range(src.height):
-            for j in range(src.width):
-                pixel_precip = precip_data[:, i, j]
-
-                if np.all(np.isnan(pixel_precip)):  # 跳过无效数据
-                    cdd_max[i, j] = np.nan
-                    cwd_max[i, j] = np.nan
-                    continue
-
-                # 计算 CDD（最长连续 <1 mm）
-                cdd_count = 0
-                max_cdd = 0
-                cwd_count = 0
-                max_cwd = 0
-
-                for day in range(len(pixel_precip)):
-                    if pixel_precip[day] < 1:
-                        cdd_count += 1
-                        max_cdd = max(max_cdd, cdd_count)
-                        cwd_count = 0  # 断开湿日计数
-                    else:
-                        cwd_count += 1
-                        max_cwd = max(max_cwd, cwd_count)
-                        cdd_count = 0  # 断开干旱日计数
-
-                cdd_max[i, j] = max_cdd
-                cwd_max[i, j] = max_cwd
+        # 所有像元一次性计算最长连续干日（<1 mm）与最长连续湿日，全为 NaN 的像元输出 NaN
+        if with_stats:
+            cdd_max, cwd_max, cdd_count, cdd_mean, cwd_count, cwd_mean = cdd_cwd(precip_data, with_stats=True, backend=backend)
+        else:
+            cdd_max, cwd_max = cdd_cwd(precip_data, backend=backend)
 
         # 保存 CDD 结果
         with rasterio.open(output_file_cdd, "w", **meta) as dst:
@@ -73,4 +54,14 @@ for year in tqdm(range(start_year, end_year + 1), desc="Computing CDD & CWD"):
             dst.write(cwd_max, 1)
             dst.set_band_description(1, f"CWD_{year}")
 
+        # 保存连续段个数与平均长度
+        if with_stats:
+            stats = {"CDD_count": cdd_count, "CDD_mean": cdd_mean, "CWD_count": cwd_count, "CWD_mean": cwd_mean}
+            for name, data in stats.items():
+                stats_dir = os.path.join(os.path.dirname(output_dir_cdd), name)
+                os.makedirs(stats_dir, exist_ok=True)
+                with rasterio.open(os.path.join(stats_dir, f"{name}_{year}.tif"), "w", **meta) as dst:
+                    dst.write(data, 1)
+                    dst.set_band_description(1, f"{name}_{year}")
+
 print("CDD & CWD calculation completed for 1961-2014. Results saved to respective folders.")
@@ -11,9 +11,11 @@ from osgeo import gdal, osr, ogr
 import os
 # import glob
 import re
-import datetime
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor
+from stack_catalog import build_catalog
+from warp_batch_clip import QTP_BOUNDS, cached_cutline_mask
+from nc_time import read_time, year_groups
 import time
 
 def img_resample(path, out_folder):
@@ -39,9 +41,9 @@ def main():
         lon = data.variables['lon'][:]
         lat = data.variables['lat'][:]
         # print(lon)
-        miss_value = data.variables[_var].missing_value
-        out_arr = np.asarray(data.variables[_var])#输入需要转换的波段名称
-        out_arr[out_arr==int(miss_value)] = np.nan
+        var = data.variables[_var]#输入需要转换的波段名称
+        var.set_auto_mask(False)  #按原始数值读取，逐年把 missing_value 替换为 np.nan
+        miss_value = var.missing_value
         # print(out_arr.shape)
         # print(out_arr[0, 1, 1])
         # print(len(out_arr[:]))
@@ -57,27 +59,17 @@ def main():
         # print(lat_res)
         # print(data.variables['time'][:].data)
         # print(data.variables['time'].units)
-        #读取时间信息
-        time = list(nc.num2date(data.variables['time'][:], data.variables['time'].units,\
-                            calendar=data.variables['time'].calendar).data)
-        # time = list(data.variables['time'][:])
+        #读取时间信息：向量化解码为年份与 "YYYY-MM-DD" 日期，按年一次切分
+        years, dates = read_time(data)
 
         # # 下面是转换过程
-        for t in range(len(time)):
-            time[t] = str(time[t]).split()[0]
-
-
-        count = 0
-        while time != []:
-            temp_time = []
-            for i in range(len(time)):
-                if temp_time == []:
-                    temp_time.append(time[i])
-                elif time[i].split('-')[0] == temp_time[0].split('-')[0]:
-                    temp_time.append(time[i])
+        for year, count, stop in year_groups(years):
+            temp_time = dates[count:stop]
+            # 只读取当年的数据块（hyperslab），不把 1961-2021 的整个变量读入内存
+            out_arr = var[count:stop, :, :]
+            out_arr[out_arr==int(miss_value)] = np.nan
             driver = gdal.GetDriverByName('GTiff')
-            out_tif_name = output_folder1 + '\\' + _var + "_" +\
-                temp_time[0].split('-')[0] + '.tif'
+            out_tif_name = output_folder1 + '\\' + _var + "_" + str(year) + '.tif'
             out_tif = driver.Create(out_tif_name, n_lon, n_lat, len(temp_time), gdal.GDT_Float32, options=["COMPRESS=LZW"])
             geotransform = (lonMin-0.5*lon_res, lon_res, 0, latMax+0.5*abs(lat_res), 0, -abs(lat_res))#GeoTransform存储了6个用于描述数据位置的参数，是GeoTiff非常重要的一个信息
             out_tif.SetGeoTransform(geotransform)
@@ -93,12 +85,12 @@ def main():
                 # arr[arr == miss_value] = np.nan
                 # arr = arr * 1000
 
-                raster_band.WriteArray(out_arr[count+i, ::-1, :])
+                raster_band.WriteArray(out_arr[i, ::-1, :])
             out_tif.FlushCache()
             del out_tif
-            count += len(temp_time)
-            for i in temp_time:
-                time.remove(i)
+
+        # 为输出目录建立波段日期索引（catalog.json），供指数脚本直接加载
+        build_catalog(output_folder1, prefix=_var)
 
                 
                 
@@ -120,11 +112,88 @@ def main():
         #     os.remove(image)
                 
                         
+def convert_and_clip(path, _var, output_folder, mask_shapefile, bounds=QTP_BOUNDS, unit_convert=None):
+    """
+    一步完成 NetCDF -> 裁剪后的逐年 GeoTIFF：逐年只读取裁剪窗口内的数据块，在内存中完成上下翻转、
+    缺测值替换、单位换算与多边形掩膜，只写出最终的裁剪结果，不再生成全区域的中间文件再由
+    warp_batch_clip.py 二次读写。
+
+    参数：
+    path: NetCDF 文件路径
+    _var: 变量名（同时作为输出文件名前缀：<_var>_<年份>.tif）
+    output_folder: 输出文件夹
+    mask_shapefile: 掩膜 Shapefile 路径，多边形外的像元设为 np.nan
+    bounds: 裁剪范围 (west, south, east, north)，按源网格向外取整，保持原 0.25° 网格不重采样
+            （与 warp_batch_clip.py 双线性重采样到 bounds 的结果网格不同）
+    unit_convert: 可选，单位换算函数（如 nc2tiff.py 中的 pr_unit_convert），输入输出均为 3D 数组
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    data = nc.Dataset(path)
+    lon = data.variables['lon'][:]
+    lat = data.variables['lat'][:]
+    var = data.variables[_var]
+    var.set_auto_mask(False)
+    miss_value = var.missing_value if 'missing_value' in var.ncattrs() else var._FillValue
+
+    lonMin, latMax, lonMax, latMin = [lon.min(), lat.max(), lon.max(), lat.min()]
+    n_lat = len(lat)
+    n_lon = len(lon)
+    lon_res = (lonMax - lonMin)/(float(n_lon) - 1)
+    lat_res = (latMax - latMin)/(float(n_lat) - 1)
+    geotransform = (lonMin-0.5*lon_res, lon_res, 0, latMax+0.5*abs(lat_res), 0, -abs(lat_res))
+
+    # 裁剪窗口（北向上的行号）与窗口内的掩膜，同一网格只栅格化一次（多个变量共用缓存）
+    (row0, row1, col0, col1), clip_transform, inside = cached_cutline_mask(mask_shapefile, geotransform,
+                                                                            n_lon, n_lat, bounds)
+    height, width = row1 - row0, col1 - col0
+    outside = ~inside
+    # NetCDF 中纬度自南向北，北向上的第 row0 行对应 NetCDF 的第 n_lat - 1 - row0 行
+    lat_slice = slice(n_lat - row1, n_lat - row0)
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    wkt = srs.ExportToWkt()
+
+    years, dates = read_time(data)
+    for year, count, stop in tqdm(year_groups(years), desc=f"{_var}: convert and clip"):
+        temp_time = dates[count:stop]
+        out_arr = var[count:stop, lat_slice, col0:col1].astype(np.float32)[:, ::-1, :]
+        out_arr[out_arr == miss_value] = np.nan
+        if unit_convert is not None:
+            out_arr = unit_convert(out_arr)
+        out_arr[:, outside] = np.nan
+
+        driver = gdal.GetDriverByName('GTiff')
+        out_tif = driver.Create(os.path.join(output_folder, f"{_var}_{year}.tif"), width, height, len(temp_time),
+                                gdal.GDT_Float32, options=["COMPRESS=LZW"])
+        out_tif.SetGeoTransform(clip_transform)
+        out_tif.SetProjection(wkt)
+        for i in range(len(temp_time)):
+            raster_band = out_tif.GetRasterBand(i + 1)
+            raster_band.SetDescription(temp_time[i])
+            raster_band.SetNoDataValue(np.nan)
+            raster_band.WriteArray(out_arr[i])
+        out_tif.FlushCache()
+        del out_tif
+    data.close()
+
+    build_catalog(output_folder, prefix=_var)
+
+
 if __name__ == '__main__':
     start = time.time()
 
     # input_vars = ["tasmax", "tas", "sfcwind", "rsds", "hurs"]
-    main()
+    # 默认转换全国范围，再用 warp_batch_clip.py 裁剪；
+    # clip = True 时直接输出青藏高原裁剪结果（convert_and_clip），但输出保持源 0.25° 网格、不重采样，
+    # 与 warp_batch_clip.py 裁剪的结果及已有阈值的网格不同，不要与之混用
+    clip = False
+    if clip:
+        convert_and_clip("F:\\CN05.1\\00 - CN051-2021\\1961-2021\\CN05.1_Tmin_1961_2021_daily_025x025.nc", "tmin",
+                         "F:\\QTP_CN05.1_converted\\tmin", r"E:\CMIP5&6 comparison\QTP_region\regions\QTP.shp")
+    else:
+        main()
     end = time.time()
     print("----------script ending----------")
     print(f"time: {end - start}")
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os
+from etccdi_engine import ETCCDIEngine, register_standard_indices, load_raster
+from etccdi_scheduler import run_parallel, aux_files
+from index_manifest import IndexManifest, MANIFEST_NAME
+from percentile_thresholds import build_thresholds
+
+# 输入数据路径
+input_dirs = {
+    "pre": r"F:\QTP_CN05.1_converted\pre",
+    "tmax": r"F:\QTP_CN05.1_converted\tmax",
+    "tmin": r"F:\QTP_CN05.1_converted\tmin",
+    "tmean": r"F:\QTP_CN05.1_converted\tmean",
+}
+# 输出根目录（每个指数一个子目录）
+output_base_dir = r"F:\climate extremes"
+
+# 已计算的阈值文件
+prwn95_file = r"F:\climate extremes\PRwn95\PRwn95_1961-2014.tif"
+prwn99_file = r"F:\climate extremes\PRwn99\PRwn99_1961-2014.tif"
+threshold_files = {
+    "TXin90": r"F:\climate extremes\TX90p\threshold\TXin90.tif",
+    "TXin10": r"F:\climate extremes\TX10p\threshold\TXin10.tif",
+    "TNin90": r"F:\climate extremes\TN90p\threshold\TNin90.tif",
+    "TNin10": r"F:\climate extremes\TN10p\threshold\TNin10.tif",
+}
+
+# 百分位指数与持续指数沿用原脚本的 yearly 子目录
+output_dirs = {name: os.path.join(output_base_dir, name, "yearly")
+               for name in ["TX90p", "TX10p", "TN90p", "TN10p", "WSDI", "CSDI"]}
+
+# 目标计算年份与阈值基准期（新增年份时只延长 end_year，基准期与已有阈值保持不变）
+start_year, end_year = 1961, 2021
+base_start_year, base_end_year = 1961, 2014
+
+# 传给 register_standard_indices 的指数设置（如 {"rx_cross_year": True}；
+# {"periods": ["monthly", "seasonal"]} 同时输出各月与 DJF/MAM/JJA/SON 的值，与年值共用一次读取；
+# {"growing_season": True} 增加 GSL、终霜/初霜日与冻结季（7 月至次年 6 月）冻融指数）
+index_options = {}
+
+# 输出方式："yearly" 每个指数每年一个文件；"stack" 每个指数一个多波段 COG（每年一个波段）
+output_mode = "yearly"
+
+# 增量更新：按输出目录下的 manifest.json 只计算缺失或输入已变化的年份与指数
+# （stack 模式下先增量更新逐年文件，再合并为 COG）
+incremental = True
+checksum = False  # 为 True 时文件修改时间变化但内容未变（如重新拷贝）不触发重算
+
+# 并行设置：workers 为进程数（1 为单进程顺序计算），io_limit 为同时读写文件的最大进程数
+workers = 32
+io_limit = 4
+memory_limit_mb = 2048  # 每个阈值任务的内存预算
+window_memory_mb = 512  # 每个进程逐年计算时数据栈的内存预算，按行窗口分块读写（None 为整幅读取）
+
+if __name__ == "__main__":
+    years = range(start_year, end_year + 1)
+    manifest = None
+    if incremental:
+        manifest = IndexManifest(os.path.join(output_base_dir, MANIFEST_NAME), settings=index_options,
+                                 checksum=checksum)
+
+    if workers > 1:
+        # 缺失的阈值作为先行任务计算（每个变量一次读取得到两个阈值）
+        base_years = list(range(base_start_year, base_end_year + 1))
+        prerequisites = []
+        for var, names in {"tmax": {"TXin90": 90, "TXin10": 10}, "tmin": {"TNin90": 90, "TNin10": 10}}.items():
+            outputs = {threshold_files[name]: q for name, q in names.items()
+                       if not os.path.exists(threshold_files[name])}
+            if outputs:
+                input_files = [os.path.join(input_dirs[var], f"{var}_{year}.tif") for year in base_years]
+                prerequisites.append((build_thresholds, (input_files, outputs, base_years),
+                                      {"memory_limit_mb": memory_limit_mb}))
+
+        config = {
+            "input_dirs": input_dirs,
+            "output_base_dir": output_base_dir,
+            "output_dirs": output_dirs,
+            "prwn95_file": prwn95_file,
+            "prwn99_file": prwn99_file,
+            "threshold_files": threshold_files,
+            "memory_limit_mb": window_memory_mb,
+            "options": index_options,
+            "output_mode": output_mode,
+        }
+        run_parallel(config, years, workers=workers, io_limit=io_limit, prerequisites=prerequisites,
+                     manifest=manifest)
+    else:
+        # 读取已有的阈值（缺失的阈值对应的指数不计算）
+        prwn95 = load_raster(prwn95_file) if os.path.exists(prwn95_file) else None
+        prwn99 = load_raster(prwn99_file) if os.path.exists(prwn99_file) else None
+        thresholds = {name: load_raster(path) for name, path in threshold_files.items() if os.path.exists(path)}
+
+        engine = ETCCDIEngine(input_dirs, output_base_dir, output_dirs, memory_limit_mb=window_memory_mb,
+                              output_mode="yearly" if manifest is not None else output_mode)
+        register_standard_indices(engine, prwn95=prwn95, thresholds=thresholds, prwn99=prwn99, **index_options)
+        if manifest is None:
+            engine.run(years)
+        else:
+            config = {"prwn95_file": prwn95_file, "prwn99_file": prwn99_file, "threshold_files": threshold_files}
+            plan = manifest.plan(engine, years, aux_files(config))
+
+            def done(year):
+                manifest.record(year, plan[year])
+                manifest.save()
+
+            engine.run(years, plan, done=done)
+            if output_mode == "stack":
+                engine.stack_outputs(years)
+
+    print("ETCCDI indices calculation completed. Results saved to:", output_base_dir)
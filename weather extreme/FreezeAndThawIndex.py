@@ -1,7 +1,8 @@
 import os
-import numpy as np
 import rasterio
 from tqdm import tqdm
+from etccdi_kernels import freeze_thaw_index, freezing_season_index, new_freezing_season_carry
+from stack_catalog import dates_to_day_of_year
 
 # 输入温度数据路径
 tmean_dir = r"F:\QTP_CN05.1_converted\tmean"
@@ -9,38 +10,35 @@ tmean_dir = r"F:\QTP_CN05.1_converted\tmean"
 # 输出文件夹
 freeze_index_dir = r"F:\climate extremes\Freeze_Index"
 thaw_index_dir = r"F:\climate extremes\Thaw_Index"
+# 冻结季（上一年 7 月 1 日至当年 6 月 30 日，按结束年份命名）的输出文件夹
+season_freeze_index_dir = r"F:\climate extremes\Freeze_Index_season"
+season_thaw_index_dir = r"F:\climate extremes\Thaw_Index_season"
 
 # 创建输出文件夹
 os.makedirs(freeze_index_dir, exist_ok=True)
 os.makedirs(thaw_index_dir, exist_ok=True)
+os.makedirs(season_freeze_index_dir, exist_ok=True)
+os.makedirs(season_thaw_index_dir, exist_ok=True)
 
 # 目标基准期
 start_year, end_year = 1961, 2014
 
+# 冻结季的跨年状态：只保留上一年 7-12 月的部分和，逐年读取时不保留上一年的逐日数据
+season_carry = None
+
 # 计算冻结指数（FI）和融化指数（TI）
 for year in tqdm(range(start_year, end_year + 1), desc="Computing Freeze and Thaw Index"):
     input_file = os.path.join(tmean_dir, f"tm_{year}.tif")
 
     # 读取数据
     with rasterio.open(input_file) as src:
-        num_days = src.count
+        tm_data = src.read()
         meta = src.meta.copy()
         meta.update({"count": 1, "dtype": "float32", "compress": "lzw"})  # 适配单波段输出
+        day_of_year = dates_to_day_of_year(src.descriptions, year)
 
-        freeze_index = np.zeros((src.height, src.width), dtype=np.float32)
-        thaw_index = np.zeros((src.height, src.width), dtype=np.float32)
-        nan_mask = np.zeros((src.height, src.width), dtype=bool)
-
-        for band in range(1, num_days + 1):
-            data = src.read(band)
-            nan_mask |= np.isnan(data)  # 记录无效值区域
-
-            freeze_index += np.abs(data) * (data < 0)  # 冻结指数（负温度的绝对值累加）
-            thaw_index += data * (data > 0)  # 融化指数（正温度累加）
-
-        # 处理无效值
-        freeze_index[nan_mask] = np.nan
-        thaw_index[nan_mask] = np.nan
+    # 冻结指数（负温度的绝对值累加）和融化指数（正温度累加），含 NaN 的像元为 NaN
+    freeze_index, thaw_index = freeze_thaw_index(tm_data)
 
     # 输出冻结指数
     freeze_output_file = os.path.join(freeze_index_dir, f"Freeze_Index_{year}.tif")
@@ -54,4 +52,16 @@ for year in tqdm(range(start_year, end_year + 1), desc="Computing Freeze and Tha
         dst.write(thaw_index, 1)
         dst.set_band_description(1, f"Thaw_Index_{year}")
 
+    # 冻结季：上一年 7-12 月的部分和加上当年 1-6 月（第一年缺少上一年，不输出）
+    if season_carry is None:
+        season_carry = new_freezing_season_carry(tm_data.shape[1:])
+    season_freeze, season_thaw = freezing_season_index(tm_data, day_of_year, year, season_carry)
+    if year == start_year:
+        continue
+    for name, array, folder in [("Freeze_Index_season", season_freeze, season_freeze_index_dir),
+                                ("Thaw_Index_season", season_thaw, season_thaw_index_dir)]:
+        with rasterio.open(os.path.join(folder, f"{name}_{year}.tif"), "w", **meta) as dst:
+            dst.write(array, 1)
+            dst.set_band_description(1, f"{name}_{year}")
+
 print("冻结指数和融化指数计算完成，结果已保存。")
@@ -1,13 +1,16 @@
 import os
+from contextlib import ExitStack
 import numpy as np
 import rasterio
 from tqdm import tqdm
+from etccdi_engine import STACK_OVERHEAD, rows_per_window, row_windows
 
 # 📂 目录设置
 pre_dir = r"F:\QTP_CN05.1_converted\pre"  # 降水数据目录
 output_dir = r"F:\climate extremes\R95p"  # 结果输出目录
 os.makedirs(output_dir, exist_ok=True)
 prwn95_file = r"F:\climate extremes\PRwn95\PRwn95_1961-2014.tif"  # 已计算的 PRwn95 文件
+memory_limit_mb = 512  # 每个窗口计算的内存预算，按行窗口分块读写
 
 
 # **加载 PRwn95**
@@ -28,33 +31,38 @@ for year in tqdm(all_years):
         print(f"Warning: {input_file} not found, skipping...")
         continue
 
-    with rasterio.open(input_file) as src:
+    with rasterio.open(input_file) as src, ExitStack() as stack:
         meta = src.meta.copy()
         meta.update({"count": 1, "dtype": "float32", "compress": "lzw", "nodata": np.nan})  # 设定输出 nodata 为 NaN
+        rows = rows_per_window(src.width, STACK_OVERHEAD * 4 * src.count, memory_limit_mb)
 
-        data = src.read().astype(np.float32)  # 读取所有天 (days, height, width)
+        dst = stack.enter_context(rasterio.open(output_file, "w", **meta))
+        dst.set_band_description(1, f"R95p_{year}")
 
-        # **识别无效值区域**
-        invalid_mask = np.isnan(data)  # 记录无效值区域
+        # **按行窗口计算，逐窗口写出**
+        for window in row_windows(src.height, src.width, rows):
+            data = src.read(window=window).astype(np.float32)  # 读取窗口内所有天 (days, rows, width)
+            prwn95_window = prwn95[window.toslices()]
 
-        # **湿日（降水 ≥ 1 mm）**
-        wet_mask = data >= 1
+            # **识别无效值区域**
+            invalid_mask = np.isnan(data)  # 记录无效值区域
 
-        # **计算超过 PRwn95 的降水量**
-        extreme_precip = np.where((wet_mask) & (data > prwn95), data - prwn95, 0)
+            # **湿日（降水 ≥ 1 mm）**
+            wet_mask = data >= 1
 
-        # **无效值区域设为 NaN**
-        extreme_precip[invalid_mask] = np.nan
+            # **计算超过 PRwn95 的降水量**
+            extreme_precip = np.where((wet_mask) & (data > prwn95_window), data - prwn95_window, 0)
 
-        # **计算 R95p（所有超出 PRwn95 的降水量之和）**
-        r95p = np.nansum(extreme_precip, axis=0).astype(np.float32)  # (height, width)
+            # **无效值区域设为 NaN**
+            extreme_precip[invalid_mask] = np.nan
 
-        # **无效值区域设为 NaN（最终检查）**
-        r95p[np.isnan(prwn95)] = np.nan
+            # **计算 R95p（所有超出 PRwn95 的降水量之和）**
+            r95p = np.nansum(extreme_precip, axis=0).astype(np.float32)  # (rows, width)
 
-        # **保存 R95p 结果**
-        with rasterio.open(output_file, "w", **meta) as dst:
-            dst.write(r95p, 1)
-            dst.set_band_description(1, f"R95p_{year}")
+            # **无效值区域设为 NaN（最终检查）**
+            r95p[np.isnan(prwn95_window)] = np.nan
+
+            # **保存 R95p 结果**
+            dst.write(r95p, 1, window=window)
 
 print("✅ R95p computation (1961-2014) completed. Results saved to:", output_dir)
@@ -2,6 +2,8 @@ import os
 import numpy as np
 import rasterio
 from tqdm import tqdm
+from etccdi_engine import read_tail
+from etccdi_kernels import rxnday
 
 # 输入数据路径
 data_dir = r"F:\QTP_CN05.1_converted\pre"
@@ -15,29 +17,29 @@ os.makedirs(output_dir_rx5, exist_ok=True)
 # 目标计算年份
 start_year, end_year = 1961, 2014
 
+# RX5day 的 5 天窗口是否允许跨越上一年年末
+cross_year = False
+
 # 计算每年的 RX1day 和 RX5day
 for year in tqdm(range(start_year, end_year + 1), desc="Computing RX1day & RX5day"):
     input_file = os.path.join(data_dir, f"pre_{year}.tif")
 
     with rasterio.open(input_file) as src:
-        num_days = src.count  # 该年的天数（365 或 366）
         meta = src.meta.copy()
         meta.update({"count": 1, "dtype": "float32", "compress": "lzw"})  # 单波段输出
 
         # 读取所有日降水数据
         pre_data = src.read().astype(np.float32)  # 形状 (num_days, height, width)
-        nan_mask = np.isnan(pre_data[0])  # 记录无效值区域
-
-        # 计算 RX1day（最大日降水量）
-        rx1day = np.nanmax(pre_data, axis=0)
-        rx1day[nan_mask] = np.nan  # 处理无效值
-
-        # 计算 RX5day（5 天滑动窗口累计降水量的最大值）
-        rx5day = np.full_like(rx1day, np.nan, dtype=np.float32)  # 初始化 RX5day
-        for d in range(num_days - 4):  # 仅能滑动到倒数第 5 天
-            window_sum = np.nansum(pre_data[d:d+5], axis=0)  # 计算 5 天累积降水
-            rx5day = np.nanmax(np.stack([rx5day, window_sum]), axis=0)  # 逐步取最大值
-        rx5day[nan_mask] = np.nan  # 处理无效值
+
+    # 跨年窗口需要上一年年末的 4 天
+    previous = None
+    previous_file = os.path.join(data_dir, f"pre_{year - 1}.tif")
+    if cross_year and os.path.exists(previous_file):
+        previous = read_tail(previous_file, 4)
+
+    # 基于累积和一次计算 RX1day（最大日降水量）与 RX5day（5 天滑动窗口累计降水量的最大值），
+    # 首日为 NaN 的像元为 NaN
+    rx1day, rx5day = rxnday(pre_data, windows=(1, 5), previous=previous)
 
     # 保存 RX1day
     output_file_rx1 = os.path.join(output_dir_rx1, f"RX1day_{year}.tif")
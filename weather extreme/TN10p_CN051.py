@@ -2,7 +2,7 @@ import os
 import numpy as np
 import rasterio
 from tqdm import tqdm
-from datetime import datetime
+from stack_catalog import load_catalog
 
 # 输入数据路径
 data_dir = r"F:\QTP_CN05.1_converted\tmin"
@@ -21,37 +21,31 @@ with rasterio.open(tnin10_file) as src:
     meta = src.meta.copy()  # 复制元数据
     meta.update({"count": 1, "dtype": "float32", "compress": "lzw"})  # 适配单波段输出
 
+# 波段日期索引（首次运行时建立）
+catalog = load_catalog(data_dir, prefix="tmin")
+
 # 计算每年的 TN10p
 for year in tqdm(range(start_year, end_year + 1), desc="Computing TN10p"):
     input_file = os.path.join(data_dir, f"tmin_{year}.tif")
 
-    # 读取该年的最低温数据
+    # 读取该年的最低温数据 (days, height, width)
     with rasterio.open(input_file) as src:
-        num_days = src.count  # 该年的天数（365 或 366）
-        tn10p = np.zeros((src.height, src.width), dtype=np.float32)  # 初始化 TN10p 计数数组
-        valid_pixel_count = np.zeros((src.height, src.width), dtype=np.float32)  # 统计有效天数
-        nan_mask = np.zeros((src.height, src.width), dtype=bool)  # 记录哪些像元应该是 NaN
-
-        for band in range(1, num_days + 1):  # 1-based index
-            date_str = src.descriptions[band - 1]  # 读取日期
-            _, month, day = map(int, date_str.split("-"))
-            day_of_year = (datetime(year, month, day) - datetime(year, 1, 1)).days  # 0-based
-
-            data = src.read(band)  # 读取该天的数据
-            invalid_mask = np.isnan(data)  # 无效值掩码
-            nan_mask |= invalid_mask  # 记录该像元是否为无效值
-
-            # 计算 TN10p
-            tn10p += (data < tnin10[day_of_year]).astype(np.float32)  # 低于 TNin10 计数
-            valid_pixel_count += (~invalid_mask).astype(np.float32)  # 统计有效天数
-
-        # 计算最终百分比
-        valid_mask = valid_pixel_count > 0  # 仅在有数据的像元计算
-        tn10p[valid_mask] /= valid_pixel_count[valid_mask]  # 计算 TN10p 百分比
-        tn10p[~valid_mask] = np.nan  # 保持无效区域为 NaN
-
-        # 调试输出
-        print(f"Year {year}: Valid pixels count min={valid_pixel_count.min()}, max={valid_pixel_count.max()}")
+        data = src.read()
+
+    # 按索引中的日序一次取出每个波段对应的阈值
+    daily_threshold = catalog.gather(tnin10, year)
+
+    # 统计低于阈值的天数与有效天数
+    tn10p = np.sum(data < daily_threshold, axis=0).astype(np.float32)
+    valid_pixel_count = np.sum(~np.isnan(data), axis=0).astype(np.float32)
+
+    # 计算最终百分比
+    valid_mask = valid_pixel_count > 0  # 仅在有数据的像元计算
+    tn10p[valid_mask] /= valid_pixel_count[valid_mask]
+    tn10p[~valid_mask] = np.nan  # 保持无效区域为 NaN
+
+    # 调试输出
+    print(f"Year {year}: Valid pixels count min={valid_pixel_count.min()}, max={valid_pixel_count.max()}")
 
     # 输出 TN10p 结果
     output_file = os.path.join(output_dir, f"TN10p_{year}.tif")
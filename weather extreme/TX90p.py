@@ -2,7 +2,7 @@ import os
 import numpy as np
 import rasterio
 from tqdm import tqdm
-from datetime import datetime
+from stack_catalog import load_catalog
 
 # 输入数据路径
 data_dir = r"F:\QTP_CN05.1_converted\tmax"
@@ -21,37 +21,31 @@ with rasterio.open(txin90_file) as src:
     meta = src.meta.copy()  # 复制元数据
     meta.update({"count": 1, "dtype": "float32", "compress": "lzw"})  # 适配单波段输出
 
+# 波段日期索引（首次运行时建立）
+catalog = load_catalog(data_dir, prefix="tmax")
+
 # 计算每年的 TX90p
 for year in tqdm(range(start_year, end_year + 1), desc="Computing TX90p"):
     input_file = os.path.join(data_dir, f"tmax_{year}.tif")
 
-    # 读取该年的最高温数据
+    # 读取该年的最高温数据 (days, height, width)
     with rasterio.open(input_file) as src:
-        num_days = src.count  # 该年的天数（365 或 366）
-        tx90p = np.zeros((src.height, src.width), dtype=np.float32)  # 初始化 TX90p 计数数组
-        valid_pixel_count = np.zeros((src.height, src.width), dtype=np.float32)  # 统计有效天数
-        nan_mask = np.zeros((src.height, src.width), dtype=bool)  # 记录哪些像元应该是 NaN
-
-        for band in range(1, num_days + 1):  # 1-based index
-            date_str = src.descriptions[band - 1]  # 读取日期
-            _, month, day = map(int, date_str.split("-"))
-            day_of_year = (datetime(year, month, day) - datetime(year, 1, 1)).days  # 0-based
-
-            data = src.read(band)  # 读取该天的数据
-            invalid_mask = np.isnan(data)  # 无效值掩码
-            nan_mask |= invalid_mask  # 记录该像元是否为无效值
-
-            # 计算 TX90p（高于 TXin90）
-            tx90p += (data > txin90[day_of_year]).astype(np.float32)  # 统计暖昼天数
-            valid_pixel_count += (~invalid_mask).astype(np.float32)  # 统计有效天数
-
-        # 计算最终百分比
-        valid_mask = valid_pixel_count > 0  # 仅在有数据的像元计算
-        tx90p[valid_mask] /= valid_pixel_count[valid_mask]  # 计算 TX90p 百分比
-        tx90p[~valid_mask] = np.nan  # 保持无效区域为 NaN
-
-        # 调试输出
-        print(f"Year {year}: Valid pixels count min={valid_pixel_count.min()}, max={valid_pixel_count.max()}")
+        data = src.read()
+
+    # 按索引中的日序一次取出每个波段对应的阈值
+    daily_threshold = catalog.gather(txin90, year)
+
+    # 统计高于阈值的天数与有效天数
+    tx90p = np.sum(data > daily_threshold, axis=0).astype(np.float32)
+    valid_pixel_count = np.sum(~np.isnan(data), axis=0).astype(np.float32)
+
+    # 计算最终百分比
+    valid_mask = valid_pixel_count > 0  # 仅在有数据的像元计算
+    tx90p[valid_mask] /= valid_pixel_count[valid_mask]
+    tx90p[~valid_mask] = np.nan  # 保持无效区域为 NaN
+
+    # 调试输出
+    print(f"Year {year}: Valid pixels count min={valid_pixel_count.min()}, max={valid_pixel_count.max()}")
 
     # 输出 TX90p 结果
     output_file = os.path.join(output_dir, f"TX90p_{year}.tif")
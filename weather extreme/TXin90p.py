@@ -2,7 +2,7 @@ import os
 import numpy as np
 import rasterio
 from tqdm import tqdm
-from datetime import datetime
+from stack_catalog import load_catalog
 
 # 输入数据路径
 data_dir = r"F:\QTP_CN05.1_converted\tmax"
@@ -27,20 +27,18 @@ with rasterio.open(tif_files[0]) as src:
 # 366 天数组（存储 TXin90）
 txin90 = np.full((366, height, width), np.nan, dtype=np.float32)
 
-# 读取所有数据并按日历日整理
+# 读取所有数据并按日历日整理（波段日期来自数据目录的索引）
+catalog = load_catalog(data_dir, prefix="tmax")
 all_data = {d: [] for d in range(366)}
 
 for year, file in tqdm(zip(range(start_year, end_year + 1), tif_files), desc="Reading Data", total=len(tif_files)):
     with rasterio.open(file) as src:
         num_days = src.count  # 获取该年的天数（365 或 366）
 
+        day_of_year = catalog.day_of_year(year)  # 各波段的 0-based 日序（由索引直接给出）
         for band in range(1, num_days + 1):  # 1-based index in rasterio
-            date_str = src.descriptions[band - 1]  # 读取日期，如 "1961-01-01"
-            year, month, day = map(int, date_str.split("-"))
-            day_of_year = (datetime(year, month, day) - datetime(year, 1, 1)).days  # 0-based
-
             data = src.read(band)  # 读取波段数据
-            all_data[day_of_year].append(data)
+            all_data[day_of_year[band - 1]].append(data)
 
 # 计算 90 百分位数（使用 5 天滑动窗口）
 for day in tqdm(range(366), desc="Computing TXin90"):
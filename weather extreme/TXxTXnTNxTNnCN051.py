@@ -1,7 +1,9 @@
 import os
+from contextlib import ExitStack
 import numpy as np
 import rasterio
 from tqdm import tqdm
+from etccdi_engine import STACK_OVERHEAD, rows_per_window, row_windows
 
 # 输入数据路径
 tmax_dir = r"F:\QTP_CN05.1_converted\tmax"
@@ -22,6 +24,7 @@ for folder in output_dirs.values():
 
 # 目标计算年份
 start_year, end_year = 1961, 2014
+memory_limit_mb = 512  # 每个窗口读取数据的内存预算，按行窗口分块计算
 
 # 计算 TXx、TXn、TNx、TNn
 for year in tqdm(range(start_year, end_year + 1), desc="Computing TXx, TXn, TNx, TNn"):
@@ -32,50 +35,33 @@ for year in tqdm(range(start_year, end_year + 1), desc="Computing TXx, TXn, TNx,
         print(f"Skipping {year}, missing data files.")
         continue
 
-    # 读取 Tmax 数据
-    with rasterio.open(tmax_file) as src:
-        tmax_data = src.read()  # 形状 (天数, 高度, 宽度)
-        meta = src.meta.copy()
+    with rasterio.open(tmax_file) as tmax_src, rasterio.open(tmin_file) as tmin_src:
+        meta = tmax_src.meta.copy()
         meta.update({"count": 1, "dtype": "float32", "compress": "lzw"})  # 适配单波段输出
+        height, width = tmax_src.height, tmax_src.width
+        rows = rows_per_window(width, 2 * STACK_OVERHEAD * 4 * tmax_src.count, memory_limit_mb)
 
-    # 读取 Tmin 数据
-    with rasterio.open(tmin_file) as src:
-        tmin_data = src.read()
+        with ExitStack() as stack:
+            destinations = {}
+            for key in output_dirs:
+                dst = stack.enter_context(rasterio.open(
+                    os.path.join(output_dirs[key], f"{key}_{year}.tif"), "w", **meta))
+                dst.set_band_description(1, f"{key}_{year}")
+                destinations[key] = dst
 
-    # 计算 TXx, TXn, TNx, TNn
-    txx = np.nanmax(tmax_data, axis=0)  # 每个像元的最大 Tmax
-    txn = np.nanmin(tmax_data, axis=0)  # 每个像元的最小 Tmax
-    tnx = np.nanmax(tmin_data, axis=0)  # 每个像元的最大 Tmin
-    tnn = np.nanmin(tmin_data, axis=0)  # 每个像元的最小 Tmin
+            # 按行窗口读取 Tmax、Tmin 并逐窗口写出
+            for window in row_windows(height, width, rows):
+                tmax_data = tmax_src.read(window=window)  # 形状 (天数, 窗口行数, 宽度)
+                tmin_data = tmin_src.read(window=window)
 
-    # 处理无效值
-    txx[np.isnan(txx)] = np.nan
-    txn[np.isnan(txn)] = np.nan
-    tnx[np.isnan(tnx)] = np.nan
-    tnn[np.isnan(tnn)] = np.nan
-
-    # 保存 TXx
-    txx_file = os.path.join(output_dirs["TXx"], f"TXx_{year}.tif")
-    with rasterio.open(txx_file, "w", **meta) as dst:
-        dst.write(txx, 1)
-        dst.set_band_description(1, f"TXx_{year}")
-
-    # 保存 TXn
-    txn_file = os.path.join(output_dirs["TXn"], f"TXn_{year}.tif")
-    with rasterio.open(txn_file, "w", **meta) as dst:
-        dst.write(txn, 1)
-        dst.set_band_description(1, f"TXn_{year}")
-
-    # 保存 TNx
-    tnx_file = os.path.join(output_dirs["TNx"], f"TNx_{year}.tif")
-    with rasterio.open(tnx_file, "w", **meta) as dst:
-        dst.write(tnx, 1)
-        dst.set_band_description(1, f"TNx_{year}")
-
-    # 保存 TNn
-    tnn_file = os.path.join(output_dirs["TNn"], f"TNn_{year}.tif")
-    with rasterio.open(tnn_file, "w", **meta) as dst:
-        dst.write(tnn, 1)
-        dst.set_band_description(1, f"TNn_{year}")
+                # 计算 TXx, TXn, TNx, TNn（全为 NaN 的像元结果为 NaN）
+                results = {
+                    "TXx": np.nanmax(tmax_data, axis=0),  # 每个像元的最大 Tmax
+                    "TXn": np.nanmin(tmax_data, axis=0),  # 每个像元的最小 Tmax
+                    "TNx": np.nanmax(tmin_data, axis=0),  # 每个像元的最大 Tmin
+                    "TNn": np.nanmin(tmin_data, axis=0),  # 每个像元的最小 Tmin
+                }
+                for key, data in results.items():
+                    destinations[key].write(data, 1, window=window)
 
 print("TXx, TXn, TNx, TNn calculation completed. Results saved to respective folders.")
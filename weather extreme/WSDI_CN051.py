@@ -2,7 +2,8 @@ import os
 import numpy as np
 import rasterio
 from tqdm import tqdm
-from datetime import datetime
+from etccdi_engine import band_day_of_year, read_head
+from etccdi_kernels import threshold_exceedance, spell_duration
 
 # 输入数据路径
 data_dir = r"F:\QTP_CN05.1_converted\tmax"
@@ -12,6 +13,9 @@ output_dir = r"F:\climate extremes\WSDI\yearly"
 # 目标基准期
 start_year, end_year = 1961, 2014
 
+# 热浪扫描的实现："numpy" 或 "numba"（需要安装 numba，结果一致）
+backend = "numpy"
+
 # 确保输出目录存在
 os.makedirs(output_dir, exist_ok=True)
 
@@ -22,7 +26,7 @@ with rasterio.open(txin90_file) as src:
     meta.update({"count": 1, "dtype": "float32", "compress": "lzw"})  # 适配单波段输出
 
 # 记录上一年年尾的热浪天数
-prev_year_tail = np.zeros((meta["height"], meta["width"]), dtype=np.int32)
+prev_year_tail = np.zeros((meta["height"], meta["width"]), dtype=np.int16)
 
 # 计算每年的 WSDI
 for year in tqdm(range(start_year, end_year + 1), desc="Computing WSDI"):
@@ -31,99 +35,25 @@ for year in tqdm(range(start_year, end_year + 1), desc="Computing WSDI"):
 
     # 读取该年的最高温数据
     with rasterio.open(input_file) as src:
-        num_days = src.count  # 该年的天数（365 或 366）
-        wsdi = np.zeros((src.height, src.width), dtype=np.float32)  # 初始化 WSDI 计数数组
-        nan_mask = np.zeros((src.height, src.width), dtype=bool)  # 记录无效值区域
-        heat_wave_mask = np.zeros((num_days, src.height, src.width), dtype=bool)  # 仅当前年
-
-        # 读取今年的数据
-        for band in range(1, num_days + 1):  # 1-based index
-            date_str = src.descriptions[band - 1]  # 读取日期
-            _, month, day = map(int, date_str.split("-"))
-            day_of_year = (datetime(year, month, day) - datetime(year, 1, 1)).days  # 0-based
-
-            data = src.read(band)  # 读取该天的数据
-            invalid_mask = np.isnan(data)  # 无效值掩码
-            nan_mask |= invalid_mask  # 记录该像元是否为无效值
-
-            # 标记超出 TXin90 的天数
-            heat_wave_mask[band - 1] = (data > txin90[day_of_year]) & (~invalid_mask)
-
-        # 统计当前年的 WSDI
-        year_end_tail = np.zeros((src.height, src.width), dtype=np.int32)  # 记录年尾热浪
-        for i in range(src.height):
-            for j in range(src.width):
-                if nan_mask[i, j]:  # 跳过无效值
-                    continue
-
-                hw_series = heat_wave_mask[:, i, j]
-                count = 0  # 当前年的热浪计数
-                wsdi_value = 0
-                first_non_warm_day = False  # 是否遇到第一天的非暖昼
-
-                for d in range(num_days):
-                    if hw_series[d]:  # 该天是暖昼
-                        count += 1
-                    else:  # 遇到非暖昼
-                        if prev_year_tail[i, j] > 0 and not first_non_warm_day:
-                            wsdi_value += count  # **无条件加上上一年的热浪**
-                            prev_year_tail[i, j] = 0  # **加完后清零**
-                            first_non_warm_day = True  # 标记已经遇到第一天非暖昼
-                            count = 0
-                            continue
-                        if count >= 6:
-                            wsdi_value += count  # 计入 WSDI
-                        count = 0  # 重新开始计数
-
-                # **暂存年末的热浪天数**
-                year_end_tail[i, j] = count
-
-                # 今年的 WSDI 结果
-                wsdi[i, j] = wsdi_value
-
-        # 读取 **下一年年初的 Tmax 数据**
-        if next_year_file and os.path.exists(next_year_file):
-            with rasterio.open(next_year_file) as next_src:
-                next_num_days = next_src.count
-                next_heat_wave = np.zeros((min(6, next_num_days), src.height, src.width), dtype=bool)
-
-                for band in range(1, min(7, next_num_days + 1)):  # 取最多 6 天
-                    date_str = next_src.descriptions[band - 1]  # 读取日期
-                    _, month, day = map(int, date_str.split("-"))
-                    day_of_year = (datetime(year + 1, month, day) - datetime(year + 1, 1, 1)).days  # 0-based
-
-                    data = next_src.read(band)  # 读取该天的数据
-                    invalid_mask = np.isnan(data)
-                    nan_mask |= invalid_mask  # 继续记录无效值
-
-                    # 标记超出 TXin90 的天数
-                    next_heat_wave[band - 1] = (data > txin90[day_of_year]) & (~invalid_mask)
-
-                # **如果年初仍然是热浪，考虑与 year_end_tail 合并**
-                prev_year_tail.fill(0)  # 先重置
-                for i in range(src.height):
-                    for j in range(src.width):
-                        if nan_mask[i, j]:  # 跳过无效值
-                            continue
+        data = src.read()  # 形状 (天数, 高度, 宽度)
+        day_of_year = band_day_of_year(src.descriptions, year)  # 0-based 日序
 
-                        # 计算下一年连续的热浪天数
-                        next_start_count = 0
-                        for d in range(min(6, next_num_days)):
-                            if next_heat_wave[d, i, j]:
-                                next_start_count += 1
-                            else:
-                                break
+    # 标记超出 TXin90 的天数，并记录无效值区域
+    heat_wave_mask = threshold_exceedance(data, day_of_year, txin90, above=True)
+    nan_mask = np.any(np.isnan(data), axis=0)
 
-                        # **判断 year_end_tail 和 next_start_count 之和是否 >= 6**
-                        if year_end_tail[i, j] + next_start_count >= 6:
-                            wsdi[i, j] += year_end_tail[i, j]  # 今年 WSDI 先加上
-                            prev_year_tail[i, j] = next_start_count  # 传递给下一年
+    # 读取 **下一年年初的 Tmax 数据**（最多 6 天），用于衔接跨年的热浪
+    next_heat_wave = None
+    if next_year_file and os.path.exists(next_year_file):
+        next_data, next_descriptions = read_head(next_year_file, 6)
+        next_heat_wave = threshold_exceedance(next_data, band_day_of_year(next_descriptions, year + 1), txin90, above=True)
+        nan_mask |= np.any(np.isnan(next_data), axis=0)  # 继续记录无效值
 
-        # 处理无效值
-        wsdi[nan_mask] = np.nan
+    # 统计当前年的 WSDI（prev_year_tail 原地更新为传递给下一年的年初热浪天数）
+    wsdi = spell_duration(heat_wave_mask, prev_year_tail, next_heat_wave, nan_mask, backend=backend)
 
-        # 调试输出
-        print(f"Year {year}: WSDI min={np.nanmin(wsdi)}, max={np.nanmax(wsdi)}")
+    # 调试输出
+    print(f"Year {year}: WSDI min={np.nanmin(wsdi)}, max={np.nanmax(wsdi)}")
 
     # 输出 WSDI 结果
     output_file = os.path.join(output_dir, f"WSDI_{year}.tif")
@@ -0,0 +1,308 @@
+"""
+时间连续分块的分析立方体（NetCDF4 / Zarr），作为逐年 GeoTIFF 的替代存储。
+
+逐年 GeoTIFF 按波段交错、按条带压缩，取一个像元 1961-2021 的序列需要解压全部年份的整幅栅格。
+立方体把整个序列存为一个 (time, y, x) 变量，分块形状为 (time_chunk, tile_rows, tile_cols)，
+默认 time_chunk 覆盖整个序列：取单个像元或小区域的全序列只需读取极少数块，适合逐像元拟合（SPEI 等）、
+CDD/CWD、CSDI/WSDI 等按像元时间序列的计算。
+AnalysisCube 提供与 etccdi_engine 逐年读取一致的接口（read_year / read_head / read_tail），引擎可直接使用。
+NetCDFSource 以同样的接口直接读取原始 NetCDF（如 CN05.1 的逐日文件），一次性分析时无需先转换为逐年 GeoTIFF。
+
+Zarr 为可选依赖（需要安装 zarr），未安装时只能使用 NetCDF4。
+"""
+
+import os
+import numpy as np
+import rasterio
+import netCDF4 as nc
+from rasterio.crs import CRS
+from rasterio.transform import Affine
+from rasterio.windows import Window
+from tqdm import tqdm
+
+from stack_catalog import dates_to_day_of_year
+from nc_time import read_time, STANDARD_CALENDARS
+
+# NetCDFSource 支持的日历：日期均为真实的公历日期，可表示为 datetime64 并按公历计算日序
+SOURCE_CALENDARS = STANDARD_CALENDARS | {"noleap", "365_day"}
+
+try:
+    import zarr
+except ImportError:  # Zarr 为可选依赖
+    zarr = None
+
+EPOCH = np.datetime64("1970-01-01")
+TIME_UNITS = "days since 1970-01-01"
+
+
+def _is_zarr(path):
+    return path.rstrip("/\\").endswith(".zarr")
+
+
+def _require_zarr():
+    if zarr is None:
+        raise ImportError("Zarr cubes require the optional 'zarr' package (pip install zarr)")
+
+
+def _block_rows(tile_rows, width, total_days, memory_limit_mb):
+    """每次读入的行数：内存预算内 tile_rows 的整数倍（至少一个分块行），保证每个块只写一次。"""
+    rows = int(memory_limit_mb * 1024 ** 2 // (width * 4 * total_days))
+    return max(tile_rows, rows // tile_rows * tile_rows)
+
+
+def export_cube(catalog, output_path, name, years=None, tile=(16, 16), time_chunk=None,
+                memory_limit_mb=1024, complevel=4):
+    """
+    把一个目录中的逐年多波段 GeoTIFF 导出为分块立方体。
+
+    参数：
+    catalog: StackCatalog - 逐年文件索引（stack_catalog.load_catalog），CN05.1 与 NEX 的转换结果均可
+    output_path: 输出路径，".nc" 为 NetCDF4，".zarr" 为 Zarr 目录
+    name: 立方体中的变量名（如 "tmax"）
+    years: 可选，导出的年份（默认索引中的全部年份，须连续）
+    tile: 空间分块 (行, 列)
+    time_chunk: 时间分块长度（默认整个序列，即每个空间分块的全序列连续存储；
+                主要按年读取整幅数据时可设为 366 左右，减少每年需要解压的数据量）
+    memory_limit_mb: 每次读入的内存预算（MB），按分块行的整数倍读取所有年份
+    complevel: NetCDF4 zlib 压缩级别
+    """
+    years = sorted(years or catalog.years)
+    first = catalog.entries[years[0]]
+    height, width = first["height"], first["width"]
+    dates = np.concatenate([catalog.dates(year) for year in years])
+    total_days = len(dates)
+    chunks = (min(time_chunk or total_days, total_days), min(tile[0], height), min(tile[1], width))
+    transform = Affine(*first["transform"])
+    x = transform.c + transform.a * (np.arange(width) + 0.5)
+    y = transform.f + transform.e * (np.arange(height) + 0.5)
+    attrs = {"crs_wkt": first["crs"] or "", "geotransform": list(transform.to_gdal()), "source": catalog.data_dir}
+
+    if _is_zarr(output_path):
+        _require_zarr()
+        data = zarr.open_array(output_path, mode="w", shape=(total_days, height, width), chunks=chunks,
+                               dtype="f4", fill_value=np.nan)
+        data.attrs.update(attrs)
+        data.attrs.update({"name": name, "time": (dates - EPOCH).astype(int).tolist(), "time_units": TIME_UNITS,
+                           "x": x.tolist(), "y": y.tolist()})
+        dataset = None
+    else:
+        dataset = nc.Dataset(output_path, "w", format="NETCDF4")
+        dataset.createDimension("time", total_days)
+        dataset.createDimension("y", height)
+        dataset.createDimension("x", width)
+        time_var = dataset.createVariable("time", "i4", ("time",))
+        time_var.units, time_var.calendar = TIME_UNITS, "standard"
+        time_var[:] = (dates - EPOCH).astype(np.int32)
+        dataset.createVariable("y", "f8", ("y",))[:] = y
+        dataset.createVariable("x", "f8", ("x",))[:] = x
+        data = dataset.createVariable(name, "f4", ("time", "y", "x"), zlib=True, complevel=complevel,
+                                      shuffle=True, chunksizes=chunks, fill_value=np.nan)
+        dataset.setncatts(attrs)
+
+    try:
+        rows = _block_rows(chunks[1], width, total_days, memory_limit_mb)
+        for row_start in tqdm(range(0, height, rows), desc=f"Exporting {name} cube"):
+            window = Window(0, row_start, width, min(rows, height - row_start))
+            # 一次写入若干分块行的全序列，每个块只写一次
+            block = np.concatenate([_read_window(catalog.path(year), window) for year in years], axis=0)
+            data[:, row_start:row_start + window.height, :] = block
+    finally:
+        if dataset is not None:
+            dataset.close()
+
+
+def _read_window(path, window):
+    with rasterio.open(path) as src:
+        return src.read(window=window).astype(np.float32)
+
+
+class AnalysisCube:
+    """
+    读取 export_cube 导出的立方体。
+
+    参数：
+    path: ".nc" 或 ".zarr" 路径
+    name: 变量名（默认立方体中唯一的数据变量）
+    """
+
+    def __init__(self, path, name=None):
+        self.path = path
+        if _is_zarr(path):
+            _require_zarr()
+            self.dataset = None
+            self.data = zarr.open_array(path, mode="r")
+            attrs = dict(self.data.attrs)
+            self.name = attrs["name"]
+            days = np.asarray(attrs["time"], dtype=np.int64)
+        else:
+            self.dataset = nc.Dataset(path, "r")
+            self.dataset.set_auto_mask(False)
+            if name is None:
+                name = next(var for var in self.dataset.variables if var not in ("time", "y", "x"))
+            self.name = name
+            self.data = self.dataset.variables[name]
+            attrs = {key: self.dataset.getncattr(key) for key in self.dataset.ncattrs()}
+            days = np.asarray(self.dataset.variables["time"][:], dtype=np.int64)
+
+        self.dates = EPOCH + days.astype("timedelta64[D]")
+        self.time_years = self.dates.astype("datetime64[Y]").astype(int) + 1970
+        _, self.height, self.width = self.data.shape
+        self.transform = Affine.from_gdal(*attrs["geotransform"])
+        self.crs = CRS.from_wkt(attrs["crs_wkt"]) if attrs["crs_wkt"] else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.dataset is not None:
+            self.dataset.close()
+            self.dataset = None
+
+    def __contains__(self, year):
+        return bool(np.any(self.time_years == year))
+
+    @property
+    def years(self):
+        return np.unique(self.time_years).tolist()
+
+    @property
+    def meta(self):
+        """与 rasterio 一致的元数据（count 为 1，可直接用于 etccdi_engine.single_band_meta）。"""
+        return {"driver": "GTiff", "dtype": "float32", "nodata": np.nan, "width": self.width,
+                "height": self.height, "count": 1, "crs": self.crs, "transform": self.transform}
+
+    def year_slice(self, year):
+        """某一年在时间轴上的范围（slice）。"""
+        start = int(np.searchsorted(self.time_years, year, side="left"))
+        stop = int(np.searchsorted(self.time_years, year, side="right"))
+        return slice(start, stop)
+
+    def read(self, time_slice, window=None):
+        """读取 (time, rows, cols) 子块，返回 float32 数组。"""
+        if window is None:
+            rows, cols = slice(0, self.height), slice(0, self.width)
+        else:
+            rows, cols = window.toslices()
+        return np.asarray(self.data[time_slice, rows, cols], dtype=np.float32)
+
+    def read_year(self, year, window=None):
+        """某一年的逐日数据栈及 0-based 日序。"""
+        span = self.year_slice(year)
+        return self.read(span, window), dates_to_day_of_year(self.dates[span], year)
+
+    def read_head(self, year, days, window=None):
+        """某一年开头 days 天的数据及日序。"""
+        span = self.year_slice(year)
+        span = slice(span.start, min(span.start + days, span.stop))
+        return self.read(span, window), dates_to_day_of_year(self.dates[span], year)
+
+    def read_tail(self, year, days, window=None):
+        """某一年末尾 days 天的数据。"""
+        span = self.year_slice(year)
+        return self.read(slice(max(span.stop - days, span.start), span.stop), window)
+
+    def read_series(self, row, col):
+        """单个像元的完整时间序列（1D float32）。"""
+        return np.asarray(self.data[:, row, col], dtype=np.float32)
+
+
+class NetCDFSource(AnalysisCube):
+    """
+    原始 NetCDF 上的虚拟逐年数据栈，接口与 AnalysisCube 相同，读取直接访问源文件、不在磁盘上生成中间文件。
+
+    按年读取时间轴的子集，在内存中翻转为北向上并把 _FillValue / missing_value 替换为 np.nan；
+    地理参考由 lon / lat 坐标向量得到，与 CN051_nc2tiff.py 的转换结果一致。
+
+    参数：
+    path: NetCDF 路径，变量维度为 (time, lat, lon)
+    name: 变量名（默认文件中唯一的三维变量）
+
+    只支持 SOURCE_CALENDARS 中的日历；360_day、all_leap（366_day）等含 2 月 30 日或每年 2 月 29 日的日历
+    无法换算为公历日序，打开时报错（可先用 nc2tiff.py / CN051_nc2tiff.py 转换，日期保留为波段描述字符串）。
+    """
+
+    def __init__(self, path, name=None):
+        self.path = path
+        self.dataset = nc.Dataset(path, "r")
+        variables = self.dataset.variables
+        time_var = variables["time"]
+        calendar = (time_var.calendar if "calendar" in time_var.ncattrs() else "standard").lower()
+        if calendar not in SOURCE_CALENDARS:
+            self.dataset.close()
+            raise ValueError(f"Unsupported calendar '{calendar}' in {path} "
+                             f"(NetCDFSource supports {sorted(SOURCE_CALENDARS)})")
+        if name is None:
+            name = next(var for var, value in variables.items() if value.ndim == 3)
+        self.name = name
+        self.data = variables[name]
+        self.data.set_auto_mask(False)
+        self.missing_values = [np.float32(self.data.getncattr(key)) for key in ("_FillValue", "missing_value")
+                               if key in self.data.ncattrs()]
+
+        lon = np.asarray(variables["lon"][:], dtype=np.float64)
+        lat = np.asarray(variables["lat"][:], dtype=np.float64)
+        # 纬度自南向北存储时读取后上下翻转
+        self.flip = bool(lat[0] < lat[-1])
+        _, self.height, self.width = self.data.shape
+        lon_res = (lon.max() - lon.min()) / (len(lon) - 1)
+        lat_res = (lat.max() - lat.min()) / (len(lat) - 1)
+        self.transform = Affine(lon_res, 0, lon.min() - 0.5 * lon_res, 0, -lat_res, lat.max() + 0.5 * lat_res)
+        self.crs = CRS.from_epsg(4326)
+
+        self.time_years, dates = read_time(self.dataset)
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+
+    def _rows(self, rows):
+        """北向上的行范围 -> 文件中的行范围。"""
+        return slice(self.height - rows.stop, self.height - rows.start) if self.flip else rows
+
+    def _mask(self, data):
+        for value in self.missing_values:
+            data[data == value] = np.nan
+        return data
+
+    def read(self, time_slice, window=None):
+        """读取 (time, rows, cols) 子块（北向上），返回 float32 数组。"""
+        if window is None:
+            rows, cols = slice(0, self.height), slice(0, self.width)
+        else:
+            rows, cols = window.toslices()
+        data = self._mask(np.asarray(self.data[time_slice, self._rows(rows), cols], dtype=np.float32))
+        return np.ascontiguousarray(data[:, ::-1, :]) if self.flip else data
+
+    def read_series(self, row, col):
+        """单个像元的完整时间序列（1D float32）。"""
+        file_row = self.height - 1 - row if self.flip else row
+        return self._mask(np.asarray(self.data[:, file_row, col], dtype=np.float32))
+
+
+def open_cube(path, name=None):
+    """
+    打开 .nc / .zarr 输入：export_cube 导出的立方体返回 AnalysisCube，其他 NetCDF（原始数据）返回 NetCDFSource。
+    """
+    if _is_zarr(path):
+        return AnalysisCube(path, name)
+    with nc.Dataset(path, "r") as dataset:
+        exported = "geotransform" in dataset.ncattrs()
+    return AnalysisCube(path, name) if exported else NetCDFSource(path, name)
+
+
+if __name__ == "__main__":
+    from stack_catalog import load_catalog
+
+    # CN05.1 与 NEX 转换结果导出为立方体（每个变量/情景一个 .nc）：数据目录, 文件前缀, 输出路径, 变量名
+    exports = [
+        (r"F:\QTP_CN05.1_converted\pre", "pre", r"F:\QTP_CN05.1_cube\pre.nc", "pre"),
+        (r"F:\QTP_CN05.1_converted\tmax", "tmax", r"F:\QTP_CN05.1_cube\tmax.nc", "tmax"),
+        (r"F:\QTP_CN05.1_converted\tmin", "tmin", r"F:\QTP_CN05.1_cube\tmin.nc", "tmin"),
+        (r"F:\QTP_CN05.1_converted\tmean", "tm", r"F:\QTP_CN05.1_cube\tmean.nc", "tmean"),
+        (r"Q:\QTP_Climate_extremes\QTP_NEX_converted\pr\ACCESS-CM2", "ACCESS-CM2_pr_historical",
+         r"Q:\QTP_Climate_extremes\cube\ACCESS-CM2_pr_historical.nc", "pr"),
+    ]
+    for data_dir, prefix, output_path, name in exports:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        export_cube(load_catalog(data_dir, prefix=prefix), output_path, name, memory_limit_mb=2048)
+        print(f"{name} cube saved to:", output_path)
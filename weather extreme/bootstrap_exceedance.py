@@ -0,0 +1,214 @@
+"""
+基准期内百分位指数（TX90p/TX10p/TN90p/TN10p）的 bootstrap 计算（Zhang et al., 2005）。
+
+基准期内的年份 j 与用同一批年份计算的阈值比较会高估超限率。bootstrap 做法：把基准期中的年份 j
+依次替换为其余每一年 i（i 出现两次），由这 N-1 个伪基准期分别计算阈值并统计年份 j 的超限率，再取平均。
+
+直接实现需要 N×(N-1) 次阈值计算。这里每个日序窗口的样本只排序一次：
+伪基准期样本 = 去掉年份 j 后的有序样本 T_j ∪ 年份 i 的窗口样本 A_i，
+其第 k 个次序统计量 = min_t max(T_j[k-t], A_i[t-1])（t = 0..|A_i|），
+T_j 只需在有序样本中取 k 附近的几个值，因此每个 (j, i) 的阈值只需少量逐元素运算即可得到。
+基准期外的年份仍使用常规阈值（ETCCDI_CN051.py / TX90p.py 等）。
+"""
+
+import os
+from contextlib import ExitStack
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from tqdm import tqdm
+
+from etccdi_engine import band_day_of_year, single_band_meta, write_single_band
+from percentile_thresholds import DAYS_OF_YEAR, lerp, window_sample_indices, rows_per_block
+
+
+def _remove_year(sorted_samples, year_ranks, r_start, r_stop):
+    """
+    在有序样本中去掉某一年的样本后，取第 r_start..r_stop-1 个次序统计量。
+
+    参数：
+    sorted_samples: (n, P) 有序样本
+    year_ranks: (w, P) 该年样本在有序样本中的位置
+    r_start, r_stop: 需要的次序范围（可为负，负次序在调用处按 -inf 处理）
+
+    返回：
+    band: (r_stop - r_start, P)
+    """
+    # 去掉该年后第 r 个值位于原位置 r + u，u = #{t: p_t - t <= r}（p_t 为该年样本的有序位置）
+    shifted = np.sort(year_ranks, axis=0) - np.arange(year_ranks.shape[0])[:, None]
+    r = np.arange(r_start, r_stop)
+    u = np.sum(shifted[None] <= r[:, None, None], axis=1)
+    positions = np.clip(r[:, None] + u, 0, sorted_samples.shape[0] - 1)
+    return np.take_along_axis(sorted_samples, positions, axis=0)
+
+
+def _union_order_statistic(band, band_start, year_sorted, k):
+    """
+    T_j ∪ A_i 的第 k 个次序统计量（对所有 i 同时计算）。
+
+    参数：
+    band: (R, P) T_j 的第 band_start.. 个次序统计量
+    year_sorted: (N, w, P) 各年份窗口样本（升序，缺测位置为 +inf）
+    k: (N,) 每个 i 对应的次序
+
+    返回：
+    values: (N, P)
+    """
+    width = year_sorted.shape[1]
+    result = np.full(year_sorted[:, 0].shape, np.inf, dtype=band.dtype)
+    for t in range(width + 1):
+        rank = k - t
+        t_values = band[np.clip(rank - band_start, 0, band.shape[0] - 1)]
+        t_values = np.where((rank < 0)[:, None], -np.inf, t_values)
+        a_values = -np.inf if t == 0 else year_sorted[:, t - 1]
+        np.minimum(result, np.maximum(t_values, a_values), out=result)
+    return result
+
+
+def bootstrap_thresholds(sorted_samples, ranks, year_sorted, counts, j, q):
+    """
+    年份 j 被替换为每个年份 i 时的第 q 百分位阈值。
+
+    参数：
+    sorted_samples: (n, P) 当前窗口全部样本（升序，缺测为 +inf）
+    ranks: (N, w, P) 各年份样本在 sorted_samples 中的位置
+    year_sorted: (N, w, P) 各年份样本（升序，缺测为 +inf）
+    counts: (N,) 各年份在窗口内的样本数
+    j: 被替换的年份序号
+    q: 百分位数
+
+    返回：
+    thresholds: (N, P)，第 i 行为用年份 i 替换年份 j 后的阈值（i == j 时即常规阈值）
+    """
+    n = counts.sum() - counts[j] + counts  # 每个伪基准期的样本数
+    quantile = q / 100
+    virtual = n * quantile + (1 - quantile) - 1  # 与 np.percentile 的 linear 方法相同
+    k = np.floor(virtual).astype(np.int64)
+    k_next = np.minimum(k + 1, n - 1)
+    gamma = (virtual - k)[:, None]
+
+    width = year_sorted.shape[1]
+    band_start = int(k.min()) - width
+    band = _remove_year(sorted_samples, ranks[j], band_start, int(k_next.max()) + 1)
+    lower = _union_order_statistic(band, band_start, year_sorted, k)
+    upper = _union_order_statistic(band, band_start, year_sorted, k_next)
+    with np.errstate(invalid="ignore"):  # 无效像元全为 inf
+        return lerp(lower, upper, gamma)
+
+
+def bootstrap_exceedance(input_files, years, outputs, window_days=5, memory_limit_mb=1024):
+    """
+    计算基准期内每一年的 bootstrap 超限率。
+
+    参数：
+    input_files: list - 基准期逐年文件路径（与 years 一一对应）
+    years: list - 基准期年份
+    outputs: dict - 指数名 -> (百分位数, 是否统计高于阈值)，如 {"TX90p": (90, True), "TX10p": (10, False)}；
+             同一变量的多个指数共用一次读取与排序
+    window_days: 滑动窗口长度（默认 5）
+    memory_limit_mb: 每块可用的内存预算（MB）
+
+    返回：
+    results: dict - 指数名 -> (N, height, width) 数组，第 j 层为 years[j] 的超限率
+    meta: 单波段输出元数据
+    """
+    n_years = len(years)
+    with ExitStack() as stack:
+        sources = [stack.enter_context(rasterio.open(path)) for path in input_files]
+        height, width = sources[0].height, sources[0].width
+        meta = single_band_meta(sources[0].meta)
+
+        day_of_year = np.concatenate([band_day_of_year(src.descriptions, year)
+                                      for src, year in zip(sources, years)])
+        year_index = np.concatenate([np.full(src.count, j) for j, src in enumerate(sources)])
+        samples = window_sample_indices(day_of_year, window_days)
+
+        # 每个日序窗口中样本在 (年份, 年内序号) 上的位置，以及每年该日序对应的波段
+        layouts = []
+        for day in range(DAYS_OF_YEAR):
+            sample_years = year_index[samples[day]]
+            slots = np.zeros(len(sample_years), dtype=np.int64)
+            counts = np.zeros(n_years, dtype=np.int64)
+            for s, j in enumerate(sample_years):
+                slots[s] = counts[j]
+                counts[j] += 1
+            center = np.full(n_years, -1)
+            center[year_index[day_of_year == day]] = np.flatnonzero(day_of_year == day)
+            layouts.append((sample_years, slots, counts, center))
+
+        block_rows = rows_per_block(width, len(day_of_year), 4 * max(len(s) for s in samples),
+                                    len(outputs), memory_limit_mb)
+        results = {name: np.full((n_years, height, width), np.nan, dtype=np.float32) for name in outputs}
+
+        for row_start in tqdm(range(0, height, block_rows), desc="Bootstrapping exceedance"):
+            window = Window(0, row_start, width, min(block_rows, height - row_start))
+            block = np.concatenate([src.read(window=window) for src in sources], axis=0)
+            pixels = block.reshape(block.shape[0], -1)
+            totals = {name: np.zeros((n_years, pixels.shape[1]), dtype=np.float64) for name in outputs}
+
+            for day in range(DAYS_OF_YEAR):
+                sample_years, slots, counts, center = layouts[day]
+                if len(sample_years) == 0:
+                    continue
+                values = np.full((n_years, window_days, pixels.shape[1]), np.inf, dtype=pixels.dtype)
+                values[sample_years, slots] = pixels[samples[day]]
+                # 与 np.percentile 一致：伪基准期样本含 NaN 时阈值为 NaN（不超限）
+                year_nan = np.any(np.isnan(values), axis=1)
+                nan_years = year_nan.sum(axis=0)
+                values[np.isnan(values)] = np.inf
+
+                # 每个窗口只排序一次，供所有 (j, i) 组合复用
+                flat = values.reshape(n_years * window_days, -1)
+                order = np.argsort(flat, axis=0, kind="stable")
+                sorted_samples = np.take_along_axis(flat, order, axis=0)
+                ranks = np.empty_like(order)
+                np.put_along_axis(ranks, order, np.arange(flat.shape[0])[:, None], axis=0)
+                ranks = ranks.reshape(n_years, window_days, -1)
+                year_sorted = np.sort(values, axis=1)
+
+                for j in range(n_years):
+                    if center[j] < 0:  # 该年没有这一天（非闰年的第 366 天）
+                        continue
+                    x = pixels[center[j]]
+                    for name, (q, above) in outputs.items():
+                        thresholds = bootstrap_thresholds(sorted_samples, ranks, year_sorted, counts, j, q)
+                        exceed = x > thresholds if above else x < thresholds
+                        exceed[j] = False  # 不含 i == j
+                        exceed[year_nan | (nan_years - year_nan[j] > 0)] = False
+                        totals[name][j] += exceed.sum(axis=0)
+
+            # 超限率 = 各伪基准期超限天数的平均 / 有效天数
+            valid = np.stack([np.sum(~np.isnan(pixels[year_index == j]), axis=0) for j in range(n_years)])
+            for name in outputs:
+                ratio = np.full(valid.shape, np.nan, dtype=np.float32)
+                np.divide(totals[name] / (n_years - 1), valid, out=ratio, where=valid > 0)
+                results[name][:, window.row_off:window.row_off + window.height] = \
+                    ratio.reshape(n_years, window.height, width)
+    return results, meta
+
+
+if __name__ == "__main__":
+    # 基准期
+    start_year, end_year = 1961, 2014
+    years = list(range(start_year, end_year + 1))
+    data_root = r"F:\QTP_CN05.1_converted"
+    output_base_dir = r"F:\climate extremes"
+    memory_limit_mb = 2048  # 根据内存调整
+
+    # 每个变量一次读取得到两个指数
+    variables = {
+        "tmax": {"TX90p": (90, True), "TX10p": (10, False)},
+        "tmin": {"TN90p": (90, True), "TN10p": (10, False)},
+    }
+
+    for var, outputs in variables.items():
+        input_files = [os.path.join(data_root, var, f"{var}_{year}.tif") for year in years]
+        results, meta = bootstrap_exceedance(input_files, years, outputs, memory_limit_mb=memory_limit_mb)
+
+        # 基准期内的结果覆盖常规方法的输出
+        for name, values in results.items():
+            output_dir = os.path.join(output_base_dir, name, "yearly")
+            os.makedirs(output_dir, exist_ok=True)
+            for j, year in enumerate(years):
+                write_single_band(os.path.join(output_dir, f"{name}_{year}.tif"), values[j], meta, f"{name}_{year}")
+        print(f"{var} bootstrap completed:", ", ".join(outputs.keys()))
@@ -0,0 +1,687 @@
+"""
+单次读取的 ETCCDI 指数计算引擎。
+
+先把需要的指数注册到引擎中，运行时每个变量每年的数据栈（pre/tmax/tmin/tmean）只读取、解码一次，
+所有依赖该变量的指数在同一轮中计算完成并输出为单波段 GeoTIFF，
+输出路径与原来的单指数脚本一致：output_base_dir/<指数名>/<指数名>_<年份>.tif。
+"""
+
+import os
+import glob
+from contextlib import ExitStack, nullcontext
+from functools import partial
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from tqdm import tqdm
+
+import etccdi_kernels as kernels
+from analysis_cube import open_cube
+from stack_writer import StackWriter, stack_yearly_files
+from stack_catalog import dates_to_day_of_year, is_leap_year
+
+# 各变量的逐年文件命名方式（与 CN051_nc2tiff.py / warp_batch_clip.py 的输出一致）
+FILE_PATTERNS = {
+    "pre": "pre_{year}.tif",
+    "tmax": "tmax_{year}.tif",
+    "tmin": "tmin_{year}.tif",
+    "tmean": "tm_{year}.tif",
+}
+
+# 分窗口计算时每个逐日数据栈的内存放大倍数（数据栈本身 + 核心函数中的布尔掩膜、float64 累积和等临时数组）
+STACK_OVERHEAD = 6
+
+
+def band_day_of_year(descriptions, year):
+    """
+    将波段描述（"YYYY-MM-DD"）解析为 0-based 日序。
+
+    参数：
+    descriptions: 波段描述序列（src.descriptions）
+    year: 年份
+
+    返回：
+    day_of_year: 1D整型数组 (days,)
+    """
+    return dates_to_day_of_year(descriptions, year)
+
+
+def rows_per_window(width, bytes_per_pixel, memory_limit_mb):
+    """根据内存预算估算每个窗口的行数（至少 1 行）。"""
+    return max(1, int(memory_limit_mb * 1024 ** 2 // (width * bytes_per_pixel)))
+
+
+def row_windows(height, width, rows):
+    """按行分块的窗口序列，每块 rows 行（最后一块可能较少）。"""
+    for row_start in range(0, height, rows):
+        yield Window(0, row_start, width, min(rows, height - row_start))
+
+
+def read_stack(path, window=None):
+    """
+    读取一年的逐日数据栈（window 不为 None 时只读取该窗口）。
+
+    返回：
+    data: 3D数组 (days, height, width)，float32
+    meta: 栅格元数据
+    descriptions: 波段描述（日期字符串）
+    """
+    with rasterio.open(path) as src:
+        data = src.read(window=window).astype(np.float32)
+        return data, src.meta.copy(), src.descriptions
+
+
+def read_head(path, days, window=None):
+    """
+    读取一年数据栈开头的若干天（用于跨年衔接的指数）。
+
+    返回：
+    data: 3D数组 (days, height, width)，float32
+    descriptions: 对应波段的描述
+    """
+    with rasterio.open(path) as src:
+        days = min(days, src.count)
+        indexes = list(range(1, days + 1))
+        return src.read(indexes, window=window).astype(np.float32), src.descriptions[:days]
+
+
+def read_tail(path, days, window=None):
+    """读取一年数据栈末尾的若干天（用于跨年滑动窗口），返回 (days, height, width) float32 数组。"""
+    with rasterio.open(path) as src:
+        days = min(days, src.count)
+        indexes = list(range(src.count - days + 1, src.count + 1))
+        return src.read(indexes, window=window).astype(np.float32)
+
+
+def single_band_meta(meta):
+    """由输入元数据生成单波段 float32 输出的元数据。"""
+    meta = meta.copy()
+    meta.update({"count": 1, "dtype": "float32", "compress": "lzw", "nodata": np.nan})
+    return meta
+
+
+def write_single_band(path, array, meta, description):
+    """写出单波段结果。"""
+    with rasterio.open(path, "w", **meta) as dst:
+        dst.write(array.astype(np.float32), 1)
+        dst.set_band_description(1, description)
+
+
+def load_raster(path):
+    """读取阈值等辅助栅格（全部波段）；单波段文件返回 2D 数组。"""
+    with rasterio.open(path) as src:
+        data = src.read().astype(np.float32)
+    return data[0] if data.shape[0] == 1 else data
+
+
+class ETCCDIEngine:
+    """
+    指数注册与单次读取调度。
+
+    参数：
+    input_dirs: dict - 变量名 -> 逐年 GeoTIFF 所在目录，例如 {"pre": r"F:\\QTP_CN05.1_converted\\pre"}；
+                也可以是 analysis_cube 导出的立方体（.nc / .zarr），按年从立方体读取；
+                或原始 NetCDF（如 CN05.1 逐日文件，见 analysis_cube.NetCDFSource），不先转换为逐年 GeoTIFF
+    output_base_dir: str - 输出根目录，每个指数写到 output_base_dir/<指数名>/
+    output_dirs: dict - 可选，单独指定某些指数的输出目录（如 {"TX90p": r"...\\TX90p\\yearly"}）
+    io_limiter: 可选，读写文件时进入的上下文管理器（如多进程共享的 Semaphore），用于限制并发 I/O
+    memory_limit_mb: 可选，每年计算时数据栈可用的内存预算（MB）；设置后按行窗口读取、计算并逐窗口写出，
+                     结果与整幅计算完全一致（None 为整幅读取）
+    output_mode: "yearly"（每个指数每年一个单波段文件）或 "stack"（run 时每个指数输出一个多波段 COG，
+                 每年一个波段，由后台线程写出，见 stack_writer）
+    stack_options: 可选，stack 模式传给 StackWriter 的参数（如 {"cog_options": {"COMPRESS": "ZSTD"}}）
+    """
+
+    def __init__(self, input_dirs, output_base_dir, output_dirs=None, io_limiter=None, memory_limit_mb=None,
+                 output_mode="yearly", stack_options=None):
+        if output_mode not in ("yearly", "stack"):
+            raise ValueError(f"Unknown output mode: {output_mode}")
+        self.input_dirs = dict(input_dirs)
+        self.output_base_dir = output_base_dir
+        self.output_dirs = dict(output_dirs or {})
+        self.io_limiter = io_limiter
+        self.memory_limit_mb = memory_limit_mb
+        self.output_mode = output_mode
+        self.stack_options = dict(stack_options or {})
+        self.indices = []
+        self._cubes = {}
+        self._writer = None
+
+    def register(self, outputs, variables, func, aux=None, lookahead=0, lookbehind=0, sequential=False):
+        """
+        注册一个（或一组共享计算的）指数。
+
+        参数：
+        outputs: str 或 list - 输出的指数名；func 返回多个数组时按此顺序对应
+        variables: list - 需要的变量名（"pre"、"tmax"、"tmin"、"tmean"）
+        func: callable - func(inputs) -> 数组或数组元组；inputs 为 dict，包含各变量的
+              (days, height, width) 数据栈、"year"、"day_of_year" 以及 aux 中的辅助数组
+        aux: dict - 可选，辅助数组（阈值、跨年状态等），最后两维须与栅格一致；
+             分窗口计算时传入对应窗口的视图，跨年状态的原地更新仍写回整幅数组
+        lookahead: int - 需要的下一年开头天数；大于 0 时 inputs 中额外提供 "<变量>_next"
+                   与 "day_of_year_next"（下一年文件不存在时为 None）
+        lookbehind: int - 需要的上一年末尾天数；大于 0 时 inputs 中额外提供 "<变量>_prev"
+                    （上一年文件不存在时为 None）与对应的上一年日序 "day_of_year_prev"
+        sequential: bool - 指数依赖上一年计算后留下的状态（如 WSDI/CSDI 的 carry），年份须按顺序计算
+        """
+        if isinstance(outputs, str):
+            outputs = [outputs]
+        for var in variables:
+            if var not in FILE_PATTERNS:
+                raise ValueError(f"Unknown variable: {var}")
+        self.indices.append({
+            "outputs": list(outputs),
+            "variables": list(variables),
+            "func": func,
+            "aux": dict(aux or {}),
+            "lookahead": lookahead,
+            "lookbehind": lookbehind,
+            "sequential": sequential,
+        })
+
+    def select(self, outputs=None):
+        """输出中包含 outputs 任一指数名的已注册指数（None 为全部）。"""
+        if outputs is None:
+            return self.indices
+        outputs = set(outputs)
+        return [index for index in self.indices if outputs.intersection(index["outputs"])]
+
+    @property
+    def variables(self):
+        """已注册指数用到的全部变量（保持注册顺序）。"""
+        return self.variables_of(self.indices)
+
+    @staticmethod
+    def variables_of(indices):
+        used = []
+        for index in indices:
+            for var in index["variables"]:
+                if var not in used:
+                    used.append(var)
+        return used
+
+    def input_file(self, var, year):
+        return os.path.join(self.input_dirs[var], FILE_PATTERNS[var].format(year=year))
+
+    def cube(self, var):
+        """输入为 .nc / .zarr 时返回对应的 AnalysisCube（或原始 NetCDF 的 NetCDFSource），否则返回 None。"""
+        path = self.input_dirs[var]
+        if not path.rstrip("/\\").endswith((".nc", ".zarr")):
+            return None
+        if var not in self._cubes:
+            self._cubes[var] = open_cube(path)
+        return self._cubes[var]
+
+    def grid_shape(self, var):
+        """某变量输入栅格的 (height, width)，以第一个存在的逐年文件为准（没有输入时为 None）。"""
+        cube = self.cube(var)
+        if cube is not None:
+            return cube.height, cube.width
+        files = sorted(glob.glob(os.path.join(self.input_dirs[var], FILE_PATTERNS[var].format(year="*"))))
+        if not files:
+            return None
+        with rasterio.open(files[0]) as src:
+            return src.height, src.width
+
+    def has_input(self, var, year):
+        cube = self.cube(var)
+        return year in cube if cube is not None else os.path.exists(self.input_file(var, year))
+
+    def read_input(self, var, year, window=None):
+        """读取某变量一年的数据栈，返回 (data, meta, day_of_year)。"""
+        cube = self.cube(var)
+        with self.io():
+            if cube is not None:
+                data, day_of_year = cube.read_year(year, window)
+                return data, cube.meta, day_of_year
+            data, meta, descriptions = read_stack(self.input_file(var, year), window)
+        return data, meta, band_day_of_year(descriptions, year)
+
+    def read_input_head(self, var, year, days, window=None):
+        """读取某变量一年开头的若干天，返回 (data, day_of_year)。"""
+        cube = self.cube(var)
+        with self.io():
+            if cube is not None:
+                return cube.read_head(year, days, window)
+            data, descriptions = read_head(self.input_file(var, year), days, window)
+        return data, band_day_of_year(descriptions, year)
+
+    def read_input_tail(self, var, year, days, window=None):
+        """读取某变量一年末尾的若干天。"""
+        cube = self.cube(var)
+        with self.io():
+            if cube is not None:
+                return cube.read_tail(year, days, window)
+            return read_tail(self.input_file(var, year), days, window)
+
+    def output_dir(self, name):
+        return self.output_dirs.get(name, os.path.join(self.output_base_dir, name))
+
+    def output_file(self, name, year):
+        return os.path.join(self.output_dir(name), f"{name}_{year}.tif")
+
+    def stack_file(self, name, years):
+        """stack 模式下某个指数的多波段输出：<输出根目录>/<指数名>/<指数名>_<起始年>-<结束年>.tif。"""
+        return os.path.join(self.output_base_dir, name, f"{name}_{years[0]}-{years[-1]}.tif")
+
+    def stack_outputs(self, years, remove_yearly=False):
+        """
+        把已有的逐年输出合并为每个指数一个多波段 COG（并行计算或增量更新后使用）。
+
+        参数：
+        years: 年份序列（缺少输出文件的年份跳过）
+        remove_yearly: 合并后是否删除逐年文件
+        """
+        years = list(years)
+        for index in self.indices:
+            for name in index["outputs"]:
+                files = {year: self.output_file(name, year) for year in years
+                         if os.path.exists(self.output_file(name, year))}
+                if not files:
+                    continue
+                stack_yearly_files(name, files, self.stack_file(name, years), self.stack_options.get("cog_options"))
+                if remove_yearly:
+                    for path in files.values():
+                        os.remove(path)
+
+    def io(self):
+        """文件读写的并发限制（未设置 io_limiter 时不限制）。"""
+        return nullcontext() if self.io_limiter is None else self.io_limiter
+
+    def make_output_dirs(self):
+        for index in self.indices:
+            for name in index["outputs"]:
+                os.makedirs(self.output_dir(name), exist_ok=True)
+
+    def write_year(self, year, results, meta):
+        """输出某一年的全部结果（stack 模式下交给后台写出线程）。"""
+        if self._writer is not None:
+            for name, array in results.items():
+                self._writer.write(name, year, array, meta)
+            return
+        with self.io():
+            for name, array in results.items():
+                write_single_band(self.output_file(name, year), array, meta, f"{name}_{year}")
+
+    def compute_year(self, year, lookahead=True, window=None, outputs=None):
+        """
+        计算某一年所有已注册的指数（每个变量只读取一次）。
+
+        参数：
+        year: 年份
+        lookahead: 是否读取下一年开头的数据供跨年指数使用（计算范围的最后一年为 False，与原脚本一致）
+        window: rasterio Window，只计算该窗口（None 为整幅）
+        outputs: 可选，只计算输出包含这些指数名的指数（只读取它们用到的变量）
+
+        返回：
+        results: dict - 指数名 -> 2D数组
+        meta: 单波段输出元数据（无任何输入文件时为 None）
+        """
+        indices = self.select(outputs)
+        variables = self.variables_of(indices)
+        stacks = {}
+        meta = None
+        day_of_year = None
+        for var in variables:
+            if not self.has_input(var, year):
+                print(f"Warning: {var} {year} not found in {self.input_dirs[var]}, skipping...")
+                continue
+            stacks[var], var_meta, var_day_of_year = self.read_input(var, year, window)
+            if meta is None:
+                meta = single_band_meta(var_meta)
+                day_of_year = var_day_of_year
+
+        # 跨年衔接的指数只需读取下一年开头的若干天
+        head_days = {}
+        for index in indices:
+            for var in index["variables"]:
+                head_days[var] = max(head_days.get(var, 0), index["lookahead"])
+        heads = {}
+        next_day_of_year = None
+        for var, days in head_days.items():
+            if not lookahead or days == 0 or not self.has_input(var, year + 1):
+                continue
+            heads[var], next_day_of_year = self.read_input_head(var, year + 1, days, window)
+
+        # 跨年滑动窗口的指数只需读取上一年末尾的若干天
+        tail_days = {}
+        for index in indices:
+            for var in index["variables"]:
+                tail_days[var] = max(tail_days.get(var, 0), index["lookbehind"])
+        tails = {}
+        for var, days in tail_days.items():
+            if days > 0 and self.has_input(var, year - 1):
+                tails[var] = self.read_input_tail(var, year - 1, days, window)
+
+        results = {}
+        for index in indices:
+            if not all(var in stacks for var in index["variables"]):
+                continue
+            inputs = {var: stacks[var] for var in index["variables"]}
+            if window is None:
+                inputs.update(index["aux"])
+            else:
+                rows, cols = window.toslices()
+                inputs.update({name: array[..., rows, cols] for name, array in index["aux"].items()})
+            inputs["year"] = year
+            inputs["day_of_year"] = day_of_year
+            if index["lookahead"]:
+                for var in index["variables"]:
+                    head = heads.get(var)
+                    inputs[f"{var}_next"] = None if head is None else head[:index["lookahead"]]
+                inputs["day_of_year_next"] = next_day_of_year
+            if index["lookbehind"]:
+                days_previous = 366 if is_leap_year(year - 1) else 365
+                inputs["day_of_year_prev"] = None
+                for var in index["variables"]:
+                    tail = tails.get(var)
+                    inputs[f"{var}_prev"] = None if tail is None else tail[-index["lookbehind"]:]
+                    if tail is not None:
+                        # 逐年文件包含全年各天，末尾 k 个波段即上一年最后 k 天
+                        days = inputs[f"{var}_prev"].shape[0]
+                        inputs["day_of_year_prev"] = np.arange(days_previous - days, days_previous)
+            values = index["func"](inputs)
+            if len(index["outputs"]) == 1:
+                values = (values,)
+            results.update(zip(index["outputs"], values))
+        return results, meta
+
+    def window_rows(self, year, outputs=None):
+        """按内存预算估算某一年每个窗口的行数（以第一个存在的输入确定栅格大小）。"""
+        variables = self.variables_of(self.select(outputs))
+        for var in variables:
+            if not self.has_input(var, year):
+                continue
+            cube = self.cube(var)
+            if cube is not None:
+                height, width, days = cube.height, cube.width, len(cube.dates[cube.year_slice(year)])
+            else:
+                with rasterio.open(self.input_file(var, year)) as src:
+                    height, width, days = src.height, src.width, src.count
+            bytes_per_pixel = STACK_OVERHEAD * 4 * days * len(variables)
+            return height, width, rows_per_window(width, bytes_per_pixel, self.memory_limit_mb)
+        return None
+
+    def run_year(self, year, lookahead=True, outputs=None, write=True):
+        """
+        计算并输出某一年的全部指数；设置了 memory_limit_mb 时按行窗口逐块计算、逐块写出。
+
+        outputs 可限定只计算部分指数；write 为 False 时只计算不写出（用于恢复跨年状态）。
+        """
+        grid = None if self.memory_limit_mb is None else self.window_rows(year, outputs)
+        if grid is None:
+            results, meta = self.compute_year(year, lookahead=lookahead, outputs=outputs)
+            if write:
+                self.write_year(year, results, meta)
+            return
+
+        height, width, rows = grid
+        with ExitStack() as stack:
+            destinations = {}
+            for window in row_windows(height, width, rows):
+                results, meta = self.compute_year(year, lookahead=lookahead, window=window, outputs=outputs)
+                if not write:
+                    continue
+                if self._writer is not None:
+                    for name, array in results.items():
+                        self._writer.write(name, year, array, meta, window)
+                    continue
+                with self.io():
+                    for name, array in results.items():
+                        if name not in destinations:
+                            dst = stack.enter_context(rasterio.open(self.output_file(name, year), "w", **meta))
+                            dst.set_band_description(1, f"{name}_{year}")
+                            destinations[name] = dst
+                        destinations[name].write(array.astype(np.float32), 1, window=window)
+
+    def run(self, years, plan=None, done=None, progress=True):
+        """
+        按年计算并输出全部已注册指数（WSDI/CSDI 等跨年指数要求 years 连续递增）。
+
+        参数：
+        years: 连续递增的年份序列
+        plan: 可选，年份 -> 需要计算的指数名（增量更新，见 index_manifest）；不在 plan 中的年份跳过；
+              需要逐年输出，stack 模式下请在增量更新后调用 stack_outputs
+        done: 可选，每年写出后调用 done(year)（stack 模式下为放入写出队列后）
+        progress: 是否显示进度条
+        """
+        years = list(years)
+        if self.output_mode == "stack":
+            if plan is not None:
+                raise ValueError("Incremental plans need yearly outputs; merge them afterwards with stack_outputs")
+            with StackWriter(lambda name: self.stack_file(name, years), years, **self.stack_options) as writer:
+                self._writer = writer
+                try:
+                    self._run_years(years, None, done, progress)
+                finally:
+                    self._writer = None
+            return
+        self.make_output_dirs()
+        self._run_years(years, plan, done, progress)
+
+    def _run_years(self, years, plan, done, progress):
+        carried = {}  # 依赖上一年状态的指数名 -> 最近一次计算的年份
+        for year in tqdm(years, desc="Computing ETCCDI indices", disable=not progress):
+            outputs = None if plan is None else plan.get(year)
+            if plan is not None and not outputs:
+                continue
+            # 依赖上一年状态的指数（carry）：上一年未在本次计算时，先不写出地计算上一年以恢复状态
+            sequential = [name for index in self.select(outputs) if index["sequential"]
+                          for name in index["outputs"]]
+            stale = [name for name in sequential if carried.get(name) != year - 1]
+            if stale and year - 1 in years:
+                self.run_year(year - 1, lookahead=True, outputs=stale, write=False)
+            self.run_year(year, lookahead=year + 1 in years, outputs=outputs)
+            carried.update(dict.fromkeys(sequential, year))
+            if done is not None:
+                done(year)
+
+
+def spell_duration_index(inputs, var, threshold_name, above, carry_name, min_length=6, backend=None):
+    """
+    WSDI/CSDI 的引擎适配：由当年与下一年开头的数据计算持续指数，跨年状态保存在 aux 的 carry 数组中。
+    """
+    data = inputs[var]
+    threshold = inputs[threshold_name]
+    mask = kernels.threshold_exceedance(data, inputs["day_of_year"], threshold, above)
+    invalid = np.any(np.isnan(data), axis=0)
+
+    next_data = inputs.get(f"{var}_next")
+    next_mask = None
+    if next_data is not None:
+        next_mask = kernels.threshold_exceedance(next_data, inputs["day_of_year_next"], threshold, above)
+        invalid |= np.any(np.isnan(next_data), axis=0)
+    return kernels.spell_duration(mask, inputs[carry_name], next_mask, invalid, min_length, backend=backend)
+
+
+def period_index(inputs, var, statistics, resolutions, rx_cross_year=False):
+    """
+    一个变量的月、季节分辨率指数：当年（及上一年年末）的数据栈按月分组归约一次，得到全部时段的值。
+
+    参数：
+    inputs: 引擎传入的 dict；lookbehind 大于 0 时包含 "<变量>_prev" 与 "day_of_year_prev"（用于 DJF 与跨月窗口）
+    var: 变量名
+    statistics: list of (指数名, 统计方式, 参数)，统计方式为 "max"、"min"、"prcptot"、
+                "rxnday"（参数为窗口长度）或 "exceedance"（参数为 (阈值名, 是否统计高于阈值)）
+    resolutions: 输出分辨率，如 ("monthly", "seasonal")
+    rx_cross_year: 当年 1 月的 RXnday 窗口是否可延伸到上一年年末
+
+    返回：
+    values: 元组，按 statistics、再按 kernels.period_labels(resolutions) 的顺序
+    """
+    data = inputs[var]
+    day_of_year = inputs["day_of_year"]
+    previous = inputs.get(f"{var}_prev")
+    lead = 0
+    if previous is not None:
+        lead = previous.shape[0]
+        day_of_year = np.concatenate([inputs["day_of_year_prev"], day_of_year])
+        data = np.concatenate([previous, data], axis=0)
+    groups = kernels.period_groups(inputs["day_of_year"], inputs["year"],
+                                   None if previous is None else inputs["day_of_year_prev"])
+    invalid = np.isnan(data[lead])
+
+    values = []
+    for name, statistic, argument in statistics:
+        if statistic in ("max", "min"):
+            result = kernels.period_extreme(data, groups, np.fmax if statistic == "max" else np.fmin, resolutions)
+        elif statistic == "prcptot":
+            result = kernels.period_prcptot(data, groups, invalid, resolutions)
+        elif statistic == "rxnday":
+            result = kernels.period_rxnday(data, groups, argument, lead, invalid, resolutions, rx_cross_year)
+        elif statistic == "exceedance":
+            threshold_name, above = argument
+            result = kernels.period_exceedance(data, day_of_year, inputs[threshold_name], groups, resolutions, above)
+        else:
+            raise ValueError(f"Unknown period statistic: {statistic}")
+        values += [result[label] for label in kernels.period_labels(resolutions)]
+    return tuple(values)
+
+
+def _flatten(values):
+    """rxnday(with_day=True) 返回 (maxima, days)，展开为与输出名对应的元组。"""
+    if isinstance(values, tuple):
+        return tuple(values[0]) + tuple(values[1])
+    return tuple(values)
+
+
+def register_standard_indices(engine, prwn95=None, thresholds=None, spell_stats=False, prwn99=None,
+                              rx_windows=(1, 5), rx_cross_year=False, rx_dates=False,
+                              nan_policy="any", tfr_max=1000, backend=None, periods=(), growing_season=False):
+    """
+    注册 weather extreme 目录中已有脚本对应的全部指数（仅限 engine.input_dirs 中已配置的变量）。
+
+    参数：
+    engine: ETCCDIEngine
+    prwn95: 2D数组 - 可选，PRwn95 阈值；提供时注册 R95p
+    prwn99: 2D数组 - 可选，PRwn99 阈值；提供时注册 R99p
+    thresholds: dict - 可选，{"TXin90": ..., "TXin10": ..., "TNin90": ..., "TNin10": ...}，
+                每个为 (366, height, width) 的阈值数组；提供时注册对应的 TX90p/TX10p/TN90p/TN10p，
+                TXin90 与 TNin10 还分别用于 WSDI 与 CSDI
+    spell_stats: 为 True 时同时输出干/湿连续段个数与平均长度（CDD_count、CDD_mean、CWD_count、CWD_mean）
+    rx_windows: RXnday 的窗口长度，默认输出 RX1day 与 RX5day
+    rx_cross_year: 为 True 时 RXnday 的窗口可跨越上一年年末（窗口计入其结束的年份）
+    rx_dates: 为 True 时同时输出最大值所在窗口最后一天的波段序号（RX<n>day_day，0-based）
+    nan_policy: FD/ID/DTR/TFR/冻融指数的 NaN 规则（"any" 或 "all"，见 kernels.fd_id_dtr_tfr）
+    tfr_max: TFR 的最大允许值，None 表示不限制
+    backend: CDD/CWD 与 WSDI/CSDI 时间轴扫描的实现，"numpy" 或 "numba"（None 为 kernels.DEFAULT_BACKEND）
+    periods: 额外输出的分辨率，"monthly"（各月）和/或 "seasonal"（DJF/MAM/JJA/SON，DJF 含上一年 12 月）；
+             为 PRCPTOT、RXnday、TXx/TXn/TNx/TNn 与已提供阈值的百分位指数输出 "<指数名>_<时段>"
+             （如 TXx_Jan、RX5day_DJF），与年值在同一次读取中计算
+    growing_season: 为 True 时注册 GSL、终霜日/初霜日（LastFrost、FirstFrost，0-based 日序）与
+                    冻结季（上一年 7 月至当年 6 月）的冻结/融化指数（Freeze_Index_season、Thaw_Index_season）
+    """
+    def register(outputs, variables, func, **kwargs):
+        # 只注册输入目录已配置的变量对应的指数
+        if all(var in engine.input_dirs for var in variables):
+            engine.register(outputs, variables, func, **kwargs)
+
+    register("PRCPTOT", ["pre"], lambda d: kernels.prcptot(d["pre"]))
+    register("SDII", ["pre"], lambda d: kernels.sdii(d["pre"]))
+    register(["R1mm", "R10mm"], ["pre"],
+             lambda d: (kernels.precip_days(d["pre"], 1), kernels.precip_days(d["pre"], 10)))
+    rx_names = [f"RX{n}day" for n in rx_windows]
+    if rx_dates:
+        rx_names += [f"RX{n}day_day" for n in rx_windows]
+    register(
+        rx_names, ["pre"],
+        lambda d: _flatten(kernels.rxnday(d["pre"], rx_windows, d.get("pre_prev"), with_day=rx_dates)),
+        lookbehind=max(rx_windows) - 1 if rx_cross_year else 0,
+    )
+    if spell_stats:
+        register(["CDD", "CWD", "CDD_count", "CDD_mean", "CWD_count", "CWD_mean"], ["pre"],
+                 lambda d: kernels.cdd_cwd(d["pre"], with_stats=True, backend=backend))
+    else:
+        register(["CDD", "CWD"], ["pre"], lambda d: kernels.cdd_cwd(d["pre"], backend=backend))
+    if prwn95 is not None:
+        register("R95p", ["pre"], lambda d: kernels.r95p(d["pre"], d["prwn95"]),
+                 aux={"prwn95": prwn95})
+    if prwn99 is not None:
+        register("R99p", ["pre"], lambda d: kernels.r95p(d["pre"], d["prwn99"]),
+                 aux={"prwn99": prwn99})
+
+    register(["TXx", "TXn"], ["tmax"], lambda d: (kernels.txx(d["tmax"]), kernels.txn(d["tmax"])))
+    register(["TNx", "TNn"], ["tmin"], lambda d: (kernels.tnx(d["tmin"]), kernels.tnn(d["tmin"])))
+
+    # Freeze_Index / Thaw_Index 只按 tmean 判断 NaN（与 FreezeAndThawIndex.py 一致），FD/ID/DTR/TFR 按三个变量
+    register(["FD", "ID", "DTR", "TFR", "Freeze_Index", "Thaw_Index"], ["tmin", "tmax", "tmean"],
+             lambda d: kernels.fd_id_dtr_tfr(d["tmin"], d["tmax"], d["tmean"], nan_policy=nan_policy,
+                                             tfr_max=tfr_max))
+
+    # 百分位指数：(指数名, 变量, 阈值名, 是否统计高于阈值)
+    percentile_indices = [
+        ("TX90p", "tmax", "TXin90", True),
+        ("TX10p", "tmax", "TXin10", False),
+        ("TN90p", "tmin", "TNin90", True),
+        ("TN10p", "tmin", "TNin10", False),
+    ]
+    for name, var, threshold_name, above in percentile_indices:
+        if not thresholds or threshold_name not in thresholds:
+            continue
+        register(
+            name, [var],
+            lambda d, var=var, threshold_name=threshold_name, above=above:
+                kernels.percentile_exceedance(d[var], d["day_of_year"], d[threshold_name], above),
+            aux={threshold_name: thresholds[threshold_name]},
+        )
+
+    # 持续指数：(指数名, 变量, 阈值名, 是否统计高于阈值)，年份需按顺序计算
+    spell_indices = [
+        ("WSDI", "tmax", "TXin90", True),
+        ("CSDI", "tmin", "TNin10", False),
+    ]
+    for name, var, threshold_name, above in spell_indices:
+        if not thresholds or threshold_name not in thresholds:
+            continue
+        carry = np.zeros(thresholds[threshold_name].shape[1:], dtype=np.int16)
+        register(
+            name, [var],
+            partial(spell_duration_index, var=var, threshold_name=threshold_name, above=above,
+                    carry_name=f"{name}_carry", backend=backend),
+            aux={threshold_name: thresholds[threshold_name], f"{name}_carry": carry},
+            lookahead=6,
+            sequential=True,
+        )
+
+    if growing_season:
+        register("GSL", ["tmean"],
+                 lambda d: kernels.gsl(d["tmean"], d["day_of_year"], d["year"], nan_policy=nan_policy))
+        register(["LastFrost", "FirstFrost"], ["tmin"],
+                 lambda d: kernels.frost_dates(d["tmin"], d["day_of_year"], d["year"], nan_policy=nan_policy))
+        # 冻结季跨年：只把上一年 7-12 月的部分和作为状态传给下一年，年份须按顺序计算
+        shape = engine.grid_shape("tmean") if "tmean" in engine.input_dirs else None
+        if shape is not None:
+            register(
+                ["Freeze_Index_season", "Thaw_Index_season"], ["tmean"],
+                lambda d: kernels.freezing_season_index(d["tmean"], d["day_of_year"], d["year"],
+                                                        d["freezing_season_carry"], nan_policy=nan_policy),
+                aux={"freezing_season_carry": kernels.new_freezing_season_carry(shape)},
+                sequential=True,
+            )
+
+    # 月、季节分辨率：每个变量注册一组，各指数共用同一次读取与分组
+    if periods:
+        labels = kernels.period_labels(periods)
+        december = 31 if "seasonal" in periods else 0  # DJF 需要上一年 12 月
+        period_statistics = {
+            "pre": [("PRCPTOT", "prcptot", None)] + [(f"RX{n}day", "rxnday", n) for n in rx_windows],
+            "tmax": [("TXx", "max", None), ("TXn", "min", None)],
+            "tmin": [("TNx", "max", None), ("TNn", "min", None)],
+        }
+        aux = {"tmax": {}, "tmin": {}}
+        for name, var, threshold_name, above in percentile_indices:
+            if thresholds and threshold_name in thresholds:
+                period_statistics[var].append((name, "exceedance", (threshold_name, above)))
+                aux[var][threshold_name] = thresholds[threshold_name]
+        for var, statistics in period_statistics.items():
+            lookbehind = december
+            if var == "pre" and (december or rx_cross_year):
+                # 跨月（跨年）的 n 天窗口还需要 12 月之前的 n - 1 天
+                lookbehind += max(rx_windows) - 1
+            register(
+                [f"{name}_{label}" for name, _, _ in statistics for label in labels], [var],
+                partial(period_index, var=var, statistics=statistics, resolutions=tuple(periods),
+                        rx_cross_year=rx_cross_year),
+                aux=aux.get(var),
+                lookbehind=lookbehind,
+            )
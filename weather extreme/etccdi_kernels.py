@@ -0,0 +1,773 @@
+"""
+ETCCDI 极端气候指数的数组计算核心。
+
+所有函数输入均为 (days, height, width) 的逐日数据栈，输出 (height, width) 的 float32 结果，
+无效值（NaN）的处理方式与 weather extreme 目录下对应的单指数脚本保持一致。
+
+连续段相关的时间轴扫描（longest_run、spell_statistics、cdd_cwd、spell_duration）另有 Numba 编译实现
+（etccdi_numba，需要安装 numba），通过 backend 参数选择，两者结果逐位一致；
+backend 为 None 时使用模块级的 DEFAULT_BACKEND。
+"""
+
+import warnings
+from functools import reduce
+import numpy as np
+
+try:
+    import etccdi_numba
+except ImportError:  # Numba 为可选依赖
+    etccdi_numba = None
+
+WET_DAY_THRESHOLD = 1.0  # 湿日阈值（降水 ≥ 1 mm）
+BACKENDS = ("numpy", "numba")
+DEFAULT_BACKEND = "numpy"
+
+# 月、季节分辨率的输出标签；DJF 为上一年 12 月与当年 1、2 月
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+SEASONS = {"DJF": (12, 1, 2), "MAM": (3, 4, 5), "JJA": (6, 7, 8), "SON": (9, 10, 11)}
+PERIOD_RESOLUTIONS = ("monthly", "seasonal")
+
+
+def _use_numba(backend):
+    """backend 是否为 "numba"（未安装 numba 时报错）。"""
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend} (expected one of {BACKENDS})")
+    if backend == "numba" and etccdi_numba is None:
+        raise ImportError("The numba backend requires the optional 'numba' package (pip install numba)")
+    return backend == "numba"
+
+
+def _pixels(array):
+    """(days, height, width) -> 行连续的 (days, pixels)。"""
+    return np.ascontiguousarray(array).reshape(array.shape[0], -1)
+
+
+def _nan_reduce(func, data):
+    """对时间轴做 nanmax/nanmin，全为 NaN 的像元直接返回 NaN 而不告警。"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return func(data, axis=0).astype(np.float32)
+
+
+def prcptot(pre):
+    """
+    PRCPTOT：湿日（≥ 1 mm）降水总量。
+
+    参数：
+    pre: 3D数组 (days, height, width)，日降水（mm）
+
+    返回：
+    prcptot: 2D数组，首日为 NaN 的像元保持 NaN
+    """
+    out = np.sum(np.where(pre >= WET_DAY_THRESHOLD, pre, 0), axis=0).astype(np.float32)
+    out[np.isnan(pre[0])] = np.nan
+    return out
+
+
+def sdii(pre):
+    """
+    SDII：湿日平均降水强度（湿日降水总量 / 湿日数）。
+
+    参数：
+    pre: 3D数组 (days, height, width)，日降水（mm）
+
+    返回：
+    sdii: 2D数组，无湿日的像元为 NaN
+    """
+    wet_mask = pre >= WET_DAY_THRESHOLD
+    total_precip = np.sum(np.where(wet_mask, pre, 0), axis=0).astype(np.float32)
+    wet_days = np.sum(wet_mask, axis=0)
+    out = np.full(total_precip.shape, np.nan, dtype=np.float32)
+    np.divide(total_precip, wet_days, out=out, where=wet_days > 0)
+    return out
+
+
+def precip_days(pre, threshold):
+    """
+    R1mm/R10mm 等：日降水 ≥ threshold 的天数。
+
+    参数：
+    pre: 3D数组 (days, height, width)，日降水（mm）
+    threshold: 降水阈值（mm）
+
+    返回：
+    days: 2D数组，末日为 NaN 的像元为 NaN（与 R1mm&R10mmCN051.py 一致）
+    """
+    out = np.sum(pre >= threshold, axis=0).astype(np.float32)
+    out[np.isnan(pre[-1])] = np.nan
+    return out
+
+
+def r95p(pre, prwn95):
+    """
+    R95p：湿日中超过 PRwn95 部分的降水量之和（传入 PRwn99 即为 R99p）。
+
+    参数：
+    pre: 3D数组 (days, height, width)，日降水（mm）
+    prwn95: 2D数组，基准期湿日降水 95 百分位数
+
+    返回：
+    r95p: 2D数组，PRwn95 为 NaN 的像元为 NaN
+    """
+    exceed = (pre >= WET_DAY_THRESHOLD) & (pre > prwn95)
+    out = np.sum(np.where(exceed, pre - prwn95, 0), axis=0).astype(np.float32)
+    out[np.isnan(prwn95)] = np.nan
+    return out
+
+
+def rxnday(pre, windows=(1, 5), previous=None, with_day=False):
+    """
+    RXnday：n 天滑动窗口累计降水量的最大值，多个 n 共用一次沿时间轴的累积和。
+
+    NaN 日按 0 累加（与 RX1day&RX5dayCN051.py 中的 np.nansum 一致），首日为 NaN 的像元为 NaN。
+
+    参数：
+    pre: 3D数组 (days, height, width)，日降水（mm）
+    windows: 窗口长度序列，如 (1, 5)
+    previous: 3D数组 (k, height, width)，上一年年末的 k 天降水，可为 None；
+              提供时跨年的窗口（结束于当年）也参与计算
+    with_day: True 时同时返回最大值所在窗口最后一天的波段序号（0-based，当年）
+
+    返回：
+    maxima: list，与 windows 对应的 2D数组；with_day 为 True 时返回 (maxima, days)
+    """
+    invalid = np.isnan(pre[0])
+    lead = 0
+    if previous is not None:
+        lead = previous.shape[0]
+        pre = np.concatenate([previous, pre], axis=0)
+
+    cumsum = np.zeros((pre.shape[0] + 1,) + pre.shape[1:], dtype=np.float64)
+    np.cumsum(np.nan_to_num(pre, nan=0.0), axis=0, out=cumsum[1:])
+
+    maxima, days = [], []
+    for n in windows:
+        # 结束于当年的窗口：结束位置 end ∈ [max(lead, n-1), 总天数-1]
+        first_end = max(lead, n - 1)
+        sums = cumsum[first_end + 1:] - cumsum[first_end + 1 - n:cumsum.shape[0] - n]
+        if sums.shape[0] == 0:
+            maxima.append(np.full(invalid.shape, np.nan, dtype=np.float32))
+            days.append(np.full(invalid.shape, np.nan, dtype=np.float32))
+            continue
+        best = np.argmax(sums, axis=0)
+        maximum = np.take_along_axis(sums, best[None], axis=0)[0].astype(np.float32)
+        day = (best + first_end - lead).astype(np.float32)
+        maximum[invalid] = np.nan
+        day[invalid] = np.nan
+        maxima.append(maximum)
+        days.append(day)
+    return (maxima, days) if with_day else maxima
+
+
+def txx(tmax):
+    """TXx：日最高温的年最大值。"""
+    return _nan_reduce(np.nanmax, tmax)
+
+
+def txn(tmax):
+    """TXn：日最高温的年最小值。"""
+    return _nan_reduce(np.nanmin, tmax)
+
+
+def tnx(tmin):
+    """TNx：日最低温的年最大值。"""
+    return _nan_reduce(np.nanmax, tmin)
+
+
+def tnn(tmin):
+    """TNn：日最低温的年最小值。"""
+    return _nan_reduce(np.nanmin, tmin)
+
+
+def _invalid_mask(stacks, nan_policy):
+    """
+    按 NaN 规则得到无效像元。
+
+    nan_policy: "any" - 任一数据栈在任一天为 NaN 即无效（FDIDDTRTFRCN051.py 对 tmin/tmax/tmean、
+                        FreezeAndThawIndex.py 只对 tmean 的做法）；
+                "all" - 仅当某一数据栈全部为 NaN 时无效，其余 NaN 日跳过
+    """
+    if nan_policy == "any":
+        reduce = np.any
+    elif nan_policy == "all":
+        reduce = np.all
+    else:
+        raise ValueError(f"Unknown nan_policy: {nan_policy}")
+    invalid = np.zeros(stacks[0].shape[1:], dtype=bool)
+    for data in stacks:
+        invalid |= reduce(np.isnan(data), axis=0)
+    return invalid
+
+
+def freeze_thaw_index(tmean, nan_policy="any"):
+    """
+    冻结指数与融化指数：日平均气温 < 0°C 的绝对值累加与 > 0°C 的累加。
+
+    参数：
+    tmean: 3D数组 (days, height, width)，日平均气温
+    nan_policy: NaN 规则，见 _invalid_mask
+
+    返回：
+    freeze_index, thaw_index: 2D float32 数组
+    """
+    freeze = -np.sum(np.where(tmean < 0, tmean, 0), axis=0, dtype=np.float64)
+    thaw = np.sum(np.where(tmean > 0, tmean, 0), axis=0, dtype=np.float64)
+    invalid = _invalid_mask([tmean], nan_policy)
+    freeze, thaw = freeze.astype(np.float32), thaw.astype(np.float32)
+    freeze[invalid] = np.nan
+    thaw[invalid] = np.nan
+    return freeze, thaw
+
+
+def fd_id_dtr_tfr(tmin, tmax, tmean, nan_policy="any", tfr_max=1000, min_freeze_index=1):
+    """
+    FD、ID、DTR、TFR 及冻结/融化指数，对三个气温数据栈做一次整网格归约。
+
+    参数：
+    tmin, tmax, tmean: 3D数组 (days, height, width)，日最低、最高、平均气温
+    nan_policy: "any"（默认，与 FDIDDTRTFRCN051.py 一致）- 三个数据栈中任一天为 NaN 的像元 FD/ID/DTR/TFR 输出 NaN；
+                "all" - 跳过 NaN 日，仅当相关数据栈全部为 NaN 时输出 NaN
+    tfr_max: TFR 的最大允许值，超过时置为 NaN；None 表示不限制
+    min_freeze_index: 冻结指数小于该值时 TFR 置为 NaN（避免极端高值）
+
+    返回：
+    fd, id, dtr, tfr, freeze_index, thaw_index: 2D float32 数组
+    （freeze_index、thaw_index 只按 tmean 判断 NaN，与 freeze_thaw_index / FreezeAndThawIndex.py 一致）
+    """
+    fd = np.sum(tmin < 0, axis=0).astype(np.float32)
+    id = np.sum(tmax < 0, axis=0).astype(np.float32)
+
+    diff = tmax - tmin
+    valid_days = np.sum(~np.isnan(diff), axis=0)
+    dtr = np.full(fd.shape, np.nan, dtype=np.float32)
+    np.divide(np.nansum(diff, axis=0, dtype=np.float64), valid_days, out=dtr, where=valid_days > 0,
+              casting="unsafe")
+
+    freeze_index, thaw_index = freeze_thaw_index(tmean, nan_policy)
+    # TFR 使用与 FD/ID/DTR 相同的无效像元（三个数据栈），冻结/融化指数本身保持只按 tmean 判断
+    tfr_freeze, tfr_thaw = freeze_index.copy(), thaw_index.copy()
+    if nan_policy == "any":
+        invalid = _invalid_mask([tmin, tmax, tmean], nan_policy)
+        for array in (fd, id, dtr, tfr_freeze, tfr_thaw):
+            array[invalid] = np.nan
+    else:
+        fd[_invalid_mask([tmin], nan_policy)] = np.nan
+        id[_invalid_mask([tmax], nan_policy)] = np.nan
+
+    # TFR = 融化指数 / 冻结指数
+    tfr = np.full(fd.shape, np.nan, dtype=np.float32)
+    with np.errstate(invalid="ignore"):
+        usable = (tfr_freeze != 0) & (tfr_freeze >= min_freeze_index)
+        np.divide(tfr_thaw, tfr_freeze, out=tfr, where=usable)
+        if tfr_max is not None:
+            tfr[tfr > tfr_max] = np.nan
+    return fd, id, dtr, tfr, freeze_index, thaw_index
+
+
+def run_lengths(mask):
+    """
+    沿时间轴计算每一天所在连续段截至当天的长度。
+
+    参数：
+    mask: 布尔数组 (days, ...)，True 表示满足条件的日
+
+    返回：
+    runs: 整型数组 (days, ...)，mask 为 False 的日为 0
+    """
+    days = mask.shape[0]
+    dtype = np.int16 if days < np.iinfo(np.int16).max else np.int32
+    index = np.arange(1, days + 1, dtype=dtype).reshape((-1,) + (1,) * (mask.ndim - 1))
+    # 最近一次中断（mask 为 False）的位置，1-based；从未中断时为 0
+    last_break = np.where(mask, 0, index).astype(dtype)
+    np.maximum.accumulate(last_break, axis=0, out=last_break)
+    return np.where(mask, index - last_break, 0).astype(dtype)
+
+
+def longest_run(mask, backend=None):
+    """沿时间轴的最长连续段长度，返回 2D float32 数组。"""
+    if _use_numba(backend):
+        longest, _, _ = etccdi_numba.spell_statistics(_pixels(mask), 1)
+        return longest.reshape(mask.shape[1:]).astype(np.float32)
+    return run_lengths(mask).max(axis=0).astype(np.float32)
+
+
+def _mean_length(count, total):
+    mean_length = np.zeros(count.shape, dtype=np.float32)
+    np.divide(total, count, out=mean_length, where=count > 0)
+    return mean_length
+
+
+def spell_statistics(mask, min_length=1, backend=None):
+    """
+    所有像元一次性统计最长连续段、连续段个数与平均长度。
+
+    参数：
+    mask: 布尔数组 (days, height, width)
+    min_length: 计入个数与平均长度的最短连续段（不影响最长连续段）
+    backend: "numpy" 或 "numba"（None 为 DEFAULT_BACKEND）
+
+    返回：
+    longest: 2D数组，最长连续天数
+    count: 2D数组，长度 ≥ min_length 的连续段个数
+    mean_length: 2D数组，这些连续段的平均长度，无连续段时为 0
+    """
+    if _use_numba(backend):
+        shape = mask.shape[1:]
+        longest, count, total = etccdi_numba.spell_statistics(_pixels(mask), min_length)
+        count = count.reshape(shape).astype(np.float32)
+        return (longest.reshape(shape).astype(np.float32), count,
+                _mean_length(count, total.reshape(shape).astype(np.float32)))
+
+    runs = run_lengths(mask)
+    longest = runs.max(axis=0).astype(np.float32)
+
+    # 连续段的最后一天：当天满足条件而次日不满足（或已是最后一天）
+    ends = mask.copy()
+    ends[:-1] &= ~mask[1:]
+    ends &= runs >= min_length
+    count = np.sum(ends, axis=0).astype(np.float32)
+    total = np.sum(np.where(ends, runs, 0), axis=0).astype(np.float32)
+    return longest, count, _mean_length(count, total)
+
+
+def cdd_cwd(pre, with_stats=False, min_length=1, backend=None):
+    """
+    CDD/CWD：最长连续干日（< 1 mm）与最长连续湿日数。
+
+    与 CDD&CWDCN051.py 一致：全年均为 NaN 的像元输出 NaN；其余像元中的 NaN 日不满足 < 1 mm，
+    按湿日处理。
+
+    参数：
+    pre: 3D数组 (days, height, width)，日降水（mm）
+    with_stats: True 时额外返回干/湿连续段的个数与平均长度
+    min_length: 统计连续段个数与平均长度时的最短长度
+    backend: "numpy" 或 "numba"（None 为 DEFAULT_BACKEND）；numba 直接扫描降水，不生成干/湿布尔数组
+
+    返回：
+    (cdd, cwd)，with_stats 为 True 时为
+    (cdd, cwd, dry_count, dry_mean_length, wet_count, wet_mean_length)
+    """
+    if _use_numba(backend):
+        shape = pre.shape[1:]
+        *spells, invalid = etccdi_numba.dry_wet_spells(_pixels(pre), WET_DAY_THRESHOLD, min_length)
+        cdd, dry_count, dry_total, cwd, wet_count, wet_total = [
+            array.reshape(shape).astype(np.float32) for array in spells]
+        if with_stats:
+            results = (cdd, cwd, dry_count, _mean_length(dry_count, dry_total),
+                       wet_count, _mean_length(wet_count, wet_total))
+        else:
+            results = (cdd, cwd)
+        for array in results:
+            array[invalid.reshape(shape)] = np.nan
+        return results
+
+    dry = pre < WET_DAY_THRESHOLD
+    if with_stats:
+        cdd, dry_count, dry_mean = spell_statistics(dry, min_length, backend="numpy")
+        cwd, wet_count, wet_mean = spell_statistics(~dry, min_length, backend="numpy")
+        results = (cdd, cwd, dry_count, dry_mean, wet_count, wet_mean)
+    else:
+        results = (longest_run(dry, backend="numpy"), longest_run(~dry, backend="numpy"))
+
+    invalid = np.all(np.isnan(pre), axis=0)
+    for array in results:
+        array[invalid] = np.nan
+    return results
+
+
+def threshold_exceedance(data, day_of_year, threshold, above=True):
+    """
+    逐日与 366 天阈值比较，返回布尔数组 (days, height, width)；NaN 日恒为 False。
+
+    参数：
+    data: 3D数组 (days, height, width)，日气温
+    day_of_year: 1D整型数组 (days,)，每个波段对应的 0-based 日序（0-365）
+    threshold: 3D数组 (366, height, width)，基准期逐日百分位阈值
+    above: True 判断 data > threshold，False 判断 data < threshold
+    """
+    daily_threshold = threshold[day_of_year]
+    return data > daily_threshold if above else data < daily_threshold
+
+
+def spell_duration(mask, carry, next_mask=None, invalid=None, min_length=6, backend=None):
+    """
+    WSDI/CSDI：一年内长度 ≥ min_length 的连续暖昼（冷夜）天数之和，跨年连续段通过 carry 衔接。
+
+    与 WSDI_CN051.py / CSDI_CN051.py 的逐像元循环结果一致：
+    - carry > 0（上一年年末的连续段延续到今年）时，今年开头的连续段无条件计入；
+    - 年末未结束的连续段与下一年开头的 min_length 天内的连续段合计 ≥ min_length 时计入今年，
+      并把下一年开头的连续天数写入 carry；
+    - 没有下一年数据（next_mask 为 None）时年末连续段不计入。
+
+    参数：
+    mask: 布尔数组 (days, height, width)，当年每日是否为暖昼（冷夜）
+    carry: 整型数组 (height, width)，上一年传入的开头连续天数，原地更新为传给下一年的值
+    next_mask: 布尔数组 (k, height, width)，下一年开头 k（≤ min_length）天，可为 None
+    invalid: 布尔数组 (height, width)，无效像元（当年或下一年开头存在 NaN），输出 NaN 且 carry 置 0
+    min_length: 最短持续天数（默认 6）
+    backend: "numpy" 或 "numba"（None 为 DEFAULT_BACKEND）
+
+    返回：
+    value: 2D float32 数组
+    """
+    if _use_numba(backend):
+        shape = mask.shape[1:]
+        flat_carry = np.ascontiguousarray(carry).reshape(-1)
+        has_next = next_mask is not None
+        next_mask = _pixels(next_mask) if has_next else np.zeros((0, flat_carry.size), dtype=bool)
+        invalid = (np.zeros(flat_carry.size, dtype=bool) if invalid is None
+                   else np.ascontiguousarray(invalid).reshape(-1))
+        value = etccdi_numba.spell_duration(_pixels(mask), flat_carry, next_mask, has_next, invalid, min_length)
+        carry[...] = flat_carry.reshape(shape)
+        return value.reshape(shape)
+
+    runs = run_lengths(mask)
+
+    # 年内已结束的连续段：当天满足而次日不满足
+    closed = mask[:-1] & ~mask[1:]
+    closed_runs = np.where(closed, runs[:-1], 0)
+    value = np.sum(np.where(closed_runs >= min_length, closed_runs, 0), axis=0).astype(np.float32)
+
+    # 延续上一年的开头连续段在遇到第一天不满足条件时无条件计入（不足 min_length 的部分需补加）
+    has_break = ~np.all(mask, axis=0)
+    leading = np.argmax(~mask, axis=0)
+    continued = (carry > 0) & has_break & (leading < min_length)
+    value += np.where(continued, leading, 0)
+
+    # 年末仍在持续的连续段
+    tail = runs[-1]
+    if next_mask is None:
+        carry[has_break] = 0
+    else:
+        head = next_mask[:min_length]
+        next_leading = np.where(np.all(head, axis=0), head.shape[0], np.argmax(~head, axis=0))
+        joined = tail + next_leading >= min_length
+        if invalid is not None:
+            joined &= ~invalid
+        value += np.where(joined, tail, 0)
+        carry[...] = np.where(joined, next_leading, 0)
+
+    if invalid is not None:
+        value[invalid] = np.nan
+    return value
+
+
+def percentile_exceedance(data, day_of_year, threshold, above=True):
+    """
+    TX90p/TX10p/TN90p/TN10p：超过（或低于）逐日百分位阈值的天数占有效天数的比例。
+
+    参数：
+    data: 3D数组 (days, height, width)，日气温
+    day_of_year: 1D整型数组 (days,)，每个波段对应的 0-based 日序（0-365）
+    threshold: 3D数组 (366, height, width)，基准期逐日百分位阈值
+    above: True 统计 data > threshold，False 统计 data < threshold
+
+    返回：
+    ratio: 2D数组，无有效天数的像元为 NaN
+    """
+    exceed = threshold_exceedance(data, day_of_year, threshold, above)
+    count = np.sum(exceed, axis=0).astype(np.float32)
+    valid = np.sum(~np.isnan(data), axis=0).astype(np.float32)
+    out = np.full(count.shape, np.nan, dtype=np.float32)
+    np.divide(count, valid, out=out, where=valid > 0)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# 生长季与冻结季：以 7 月 1 日为界的半年划分
+# ---------------------------------------------------------------------------
+
+def month_start_band(day_of_year, year, month=7):
+    """当年 month 月 1 日（或之后第一天）对应的波段序号；波段须按日期排序。"""
+    boundary = (np.datetime64(f"{year:04d}-{month:02d}-01") - np.datetime64(f"{year:04d}-01-01")).astype(np.int64)
+    return int(np.searchsorted(day_of_year, boundary))
+
+
+def first_run_start(mask, min_length):
+    """
+    每个像元第一个长度 ≥ min_length 的连续段的起始波段序号。
+
+    参数：
+    mask: 布尔数组 (days, height, width)
+    min_length: 最短连续天数
+
+    返回：
+    start: 2D整型数组，没有这样的连续段时为 -1
+    """
+    reached = run_lengths(mask) >= min_length
+    found = np.any(reached, axis=0)
+    return np.where(found, np.argmax(reached, axis=0) - (min_length - 1), -1)
+
+
+def gsl(tmean, day_of_year, year, threshold=5.0, min_length=6, nan_policy="any"):
+    """
+    GSL 生长季长度（北半球定义）：从第一个连续 min_length 天日平均气温 > threshold 的起始日，
+    到 7 月 1 日之后（且在生长季开始之后）第一个连续 min_length 天 < threshold 的起始日之间的天数；
+    没有结束时算到年末，没有开始时为 0。NaN 日中断连续段。
+
+    参数：
+    tmean: 3D数组 (days, height, width)，日平均气温
+    day_of_year: 1D整型数组 (days,)，各波段的 0-based 日序
+    year: 年份
+    threshold: 气温阈值（°C，默认 5）
+    min_length: 连续天数（默认 6）
+    nan_policy: NaN 规则，见 _invalid_mask
+
+    返回：
+    gsl: 2D float32 数组
+    """
+    days = tmean.shape[0]
+    start = first_run_start(tmean > threshold, min_length)
+    # 结束段只在 7 月 1 日与生长季开始日中较晚者之后搜索
+    bound = np.maximum(month_start_band(day_of_year, year, 7), start)
+    position = np.arange(days).reshape(-1, 1, 1)
+    end = first_run_start((tmean < threshold) & (position >= bound), min_length)
+    end = np.where(end < 0, days, end)
+    out = np.where(start < 0, 0, end - start).astype(np.float32)
+    out[_invalid_mask([tmean], nan_policy)] = np.nan
+    return out
+
+
+def frost_dates(tmin, day_of_year, year, nan_policy="any"):
+    """
+    终霜日与初霜日：7 月 1 日之前最后一个、之后第一个日最低气温 < 0°C 的日序（0-based）。
+
+    参数：
+    tmin: 3D数组 (days, height, width)，日最低气温
+    day_of_year: 1D整型数组 (days,)，各波段的 0-based 日序
+    year: 年份
+    nan_policy: NaN 规则，见 _invalid_mask
+
+    返回：
+    last_frost, first_frost: 2D float32 数组，该半年没有霜冻日或像元无效时为 NaN
+    """
+    split = month_start_band(day_of_year, year, 7)
+    day_of_year = np.asarray(day_of_year)
+    last_frost = np.full(tmin.shape[1:], np.nan, dtype=np.float32)
+    first_frost = np.full(tmin.shape[1:], np.nan, dtype=np.float32)
+    if split > 0:
+        spring = tmin[:split] < 0
+        found = np.any(spring, axis=0)
+        last = split - 1 - np.argmax(spring[::-1], axis=0)
+        last_frost[found] = day_of_year[last[found]]
+    if split < tmin.shape[0]:
+        autumn = tmin[split:] < 0
+        found = np.any(autumn, axis=0)
+        first = split + np.argmax(autumn, axis=0)
+        first_frost[found] = day_of_year[first[found]]
+    invalid = _invalid_mask([tmin], nan_policy)
+    last_frost[invalid] = np.nan
+    first_frost[invalid] = np.nan
+    return last_frost, first_frost
+
+
+def new_freezing_season_carry(shape):
+    """freezing_season_index 的跨年状态：上一年 7-12 月的冻结指数、融化指数与对应年份（无数据时为 NaN）。"""
+    return np.full((3,) + tuple(shape), np.nan, dtype=np.float64)
+
+
+def freezing_season_index(tmean, day_of_year, year, carry, nan_policy="any"):
+    """
+    冻结季（上一年 7 月 1 日至当年 6 月 30 日）的冻结指数与融化指数，逐年流式计算：
+    每年只把 7-12 月的部分和留在 carry 中，下一年与 1-6 月的部分和相加，不保留、不拼接多年的逐日数据。
+
+    参数：
+    tmean: 3D数组 (days, height, width)，当年日平均气温
+    day_of_year: 1D整型数组 (days,)，各波段的 0-based 日序
+    year: 年份（输出为结束于该年 6 月 30 日的冻结季）
+    carry: new_freezing_season_carry 创建的数组 (3, height, width)，原地更新为当年 7-12 月的部分和
+    nan_policy: NaN 规则，见 _invalid_mask（分别作用于两个半年）
+
+    返回：
+    freeze_index, thaw_index: 2D float32 数组；上一年 7-12 月不在 carry 中（如计算的第一年）时为 NaN
+    """
+    split = month_start_band(day_of_year, year, 7)
+    spring_freeze, spring_thaw = freeze_thaw_index(tmean[:split], nan_policy)
+    autumn_freeze, autumn_thaw = freeze_thaw_index(tmean[split:], nan_policy)
+
+    complete = carry[2] == year - 1
+    freeze_index = np.where(complete, carry[0] + spring_freeze, np.nan).astype(np.float32)
+    thaw_index = np.where(complete, carry[1] + spring_thaw, np.nan).astype(np.float32)
+    carry[0] = autumn_freeze
+    carry[1] = autumn_thaw
+    carry[2] = year
+    return freeze_index, thaw_index
+
+
+# ---------------------------------------------------------------------------
+# 月、季节分辨率：同一个逐日数据栈一次分组归约得到各月的值，季节值由月值合成
+# ---------------------------------------------------------------------------
+
+def period_labels(resolutions):
+    """resolutions（"monthly"、"seasonal"）对应的输出标签，顺序与 period_* 函数返回的 dict 一致。"""
+    for resolution in resolutions:
+        if resolution not in PERIOD_RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution} (expected one of {PERIOD_RESOLUTIONS})")
+    labels = []
+    if "monthly" in resolutions:
+        labels += MONTH_NAMES
+    if "seasonal" in resolutions:
+        labels += SEASONS
+    return labels
+
+
+def day_months(day_of_year, year):
+    """0-based 日序 -> 月份（1-12）。"""
+    dates = np.datetime64(f"{year:04d}-01-01") + np.asarray(day_of_year).astype("timedelta64[D]")
+    return dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+
+
+def period_groups(day_of_year, year, day_of_year_previous=None):
+    """
+    每一天所属的月份分组：当年 1-12 月为 1-12；提供上一年年末的日序时，上一年 12 月为 0（用于 DJF），
+    更早的日期为 -1（只用于跨月的滑动窗口，不参与分组）。
+
+    参数：
+    day_of_year: 1D整型数组，当年各波段的 0-based 日序
+    year: 年份
+    day_of_year_previous: 1D整型数组，上一年年末各波段的日序，可为 None
+
+    返回：
+    groups: 1D整型数组，与 [上一年年末, 当年] 拼接后的时间轴对应
+    """
+    groups = day_months(day_of_year, year)
+    if day_of_year_previous is None:
+        return groups
+    previous = day_months(day_of_year_previous, year - 1)
+    return np.concatenate([np.where(previous == 12, 0, -1), groups])
+
+
+def monthly_reduce(data, groups, ufunc, dtype=None):
+    """
+    用一次 ufunc.reduceat 沿时间轴对各月分组归约（波段须按日期排序，每组在时间轴上连续）。
+
+    参数：
+    data: 3D数组 (days, height, width)
+    groups: period_groups 的结果
+    ufunc: 归约函数，如 np.fmax（忽略 NaN）、np.add
+    dtype: 可选，归约的累加类型
+
+    返回：
+    values: 3D float32 数组 (13, height, width)，第 0 层为上一年 12 月，第 1-12 层为当年各月；缺少的月份为 NaN
+    present: 1D布尔数组 (13,)，各层是否有数据
+    """
+    groups = np.asarray(groups)
+    if np.any(np.diff(groups) < 0):
+        raise ValueError("Bands must be sorted by date for grouped reductions")
+    first = int(np.searchsorted(groups, 0))
+    values = np.full((13,) + data.shape[1:], np.nan, dtype=np.float32)
+    present = np.zeros(13, dtype=bool)
+    if first == groups.size:
+        return values, present
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(groups[first:])) + 1])
+    labels = groups[first:][starts]
+    values[labels] = ufunc.reduceat(data[first:], starts, axis=0, dtype=dtype)
+    present[labels] = True
+    return values, present
+
+
+def period_values(monthly, present, ufunc, resolutions):
+    """
+    由 monthly_reduce 的结果得到各输出时段的值：月值直接取当年各月，季节值用 ufunc 合并三个月；
+    缺少上一年 12 月（或任一月份）的季节为 NaN。
+
+    返回：
+    values: dict - period_labels(resolutions) 中的标签 -> 2D数组
+    """
+    values = {}
+    for label in period_labels(resolutions):
+        if label in MONTH_NAMES:
+            values[label] = monthly[MONTH_NAMES.index(label) + 1]
+            continue
+        layers = [0 if label == "DJF" and month == 12 else month for month in SEASONS[label]]
+        if not present[layers].all():
+            values[label] = np.full(monthly.shape[1:], np.nan, dtype=np.float32)
+            continue
+        values[label] = reduce(ufunc, [monthly[layer] for layer in layers]).astype(np.float32)
+    return values
+
+
+def period_extreme(data, groups, ufunc, resolutions):
+    """
+    TXx/TXn/TNx/TNn 的月、季节值：各时段内的最大（np.fmax）或最小（np.fmin）值，全为 NaN 的时段为 NaN。
+
+    参数：
+    data: 3D数组 (days, height, width)，按 groups 拼接后的日气温
+    groups: period_groups 的结果
+    ufunc: np.fmax 或 np.fmin
+    resolutions: 输出分辨率，如 ("monthly", "seasonal")
+
+    返回：
+    values: dict - 时段标签 -> 2D数组
+    """
+    monthly, present = monthly_reduce(data, groups, ufunc)
+    return period_values(monthly, present, ufunc, resolutions)
+
+
+def period_prcptot(pre, groups, invalid, resolutions):
+    """
+    PRCPTOT 的月、季节值：各时段内湿日（≥ 1 mm）降水总量。
+
+    参数：
+    pre: 3D数组，按 groups 拼接后的日降水（mm）
+    invalid: 2D布尔数组，输出为 NaN 的像元（与年值一致，为当年首日为 NaN 的像元）
+    """
+    wet = np.where(pre >= WET_DAY_THRESHOLD, pre, 0).astype(np.float32)
+    monthly, present = monthly_reduce(wet, groups, np.add, dtype=np.float64)
+    values = period_values(monthly, present, np.add, resolutions)
+    for array in values.values():
+        array[invalid] = np.nan
+    return values
+
+
+def period_rxnday(pre, groups, n, lead, invalid, resolutions, cross_year=False):
+    """
+    RXnday 的月、季节值：结束于该时段内的 n 天窗口累计降水量的最大值（窗口可跨越月份）。
+
+    参数：
+    pre: 3D数组，按 groups 拼接后的日降水（mm），前 lead 天为上一年年末
+    n: 窗口长度
+    lead: 上一年年末的天数
+    invalid: 2D布尔数组，输出为 NaN 的像元（当年首日为 NaN）
+    cross_year: 为 False 时当年的窗口不延伸到上一年（与 rxnday 默认一致，各月最大值的最大值等于年值）
+
+    返回：
+    values: dict - 时段标签 -> 2D数组
+    """
+    cumsum = np.zeros((pre.shape[0] + 1,) + pre.shape[1:], dtype=np.float64)
+    np.cumsum(np.nan_to_num(pre, nan=0.0), axis=0, out=cumsum[1:])
+    # 以窗口最后一天为位置的 n 天累计值，窗口不完整的位置为 NaN（归约时被 np.fmax 忽略）
+    sums = np.full(pre.shape, np.nan, dtype=np.float32)
+    sums[n - 1:] = cumsum[n:] - cumsum[:-n]
+    if not cross_year:
+        sums[lead:lead + n - 1] = np.nan
+    monthly, present = monthly_reduce(sums, groups, np.fmax)
+    values = period_values(monthly, present, np.fmax, resolutions)
+    for array in values.values():
+        array[invalid] = np.nan
+    return values
+
+
+def period_exceedance(data, day_of_year, threshold, groups, resolutions, above=True):
+    """
+    TX90p/TX10p/TN90p/TN10p 的月、季节值：时段内超过（或低于）逐日百分位阈值的天数占有效天数的比例。
+    季节值由各月的天数合计后再相除。
+
+    参数：
+    data: 3D数组，按 groups 拼接后的日气温
+    day_of_year: 1D整型数组，与 data 对应的日序（上一年年末部分为上一年的日序）
+    threshold: 3D数组 (366, height, width)
+    above: True 统计 data > threshold，False 统计 data < threshold
+    """
+    exceed = threshold_exceedance(data, day_of_year, threshold, above)
+    count, present = monthly_reduce(exceed, groups, np.add, dtype=np.int32)
+    valid, _ = monthly_reduce(~np.isnan(data), groups, np.add, dtype=np.int32)
+    counts = period_values(count, present, np.add, resolutions)
+    valids = period_values(valid, present, np.add, resolutions)
+    values = {}
+    for label, total in valids.items():
+        out = np.full(total.shape, np.nan, dtype=np.float32)
+        np.divide(counts[label], total, out=out, where=total > 0)
+        values[label] = out
+    return values
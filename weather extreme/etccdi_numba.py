@@ -0,0 +1,179 @@
+"""
+etccdi_kernels 中时间轴扫描的 Numba 编译实现（可选后端，需要安装 numba）。
+
+NumPy 实现用 run_lengths 生成与数据栈同样大小的连续段长度数组，再做归约；这里逐像元沿时间轴扫描一次，
+只保留每个像元的少量状态，不产生 (days, height, width) 的中间数组。像元按块用 prange 并行，
+每块内按天、再按像元循环，保证内存按行连续访问。
+结果与 NumPy 实现逐位一致，通过 etccdi_kernels 中各函数的 backend="numba" 选用。
+"""
+
+import numpy as np
+from numba import njit, prange
+
+PIXEL_BLOCK = 256  # 每个并行任务处理的像元数
+
+
+@njit(cache=True)
+def _block_spells(mask, start, stop, min_length, longest, count, total):
+    """一个像元块内的最长连续段、长度 ≥ min_length 的连续段个数与总长度。"""
+    days = mask.shape[0]
+    width = stop - start
+    run = np.zeros(width, dtype=np.int64)
+    for t in range(days):
+        for i in range(width):
+            p = start + i
+            if mask[t, p]:
+                run[i] += 1
+                if run[i] > longest[p]:
+                    longest[p] = run[i]
+            else:
+                if run[i] > 0 and run[i] >= min_length:
+                    count[p] += 1
+                    total[p] += run[i]
+                run[i] = 0
+    for i in range(width):
+        p = start + i
+        if run[i] > 0 and run[i] >= min_length:
+            count[p] += 1
+            total[p] += run[i]
+
+
+@njit(parallel=True, cache=True)
+def spell_statistics(mask, min_length):
+    """
+    mask: 布尔数组 (days, pixels)
+
+    返回：
+    longest, count, total: 1D int64 数组 (pixels,)
+    """
+    n_pixels = mask.shape[1]
+    longest = np.zeros(n_pixels, dtype=np.int64)
+    count = np.zeros(n_pixels, dtype=np.int64)
+    total = np.zeros(n_pixels, dtype=np.int64)
+    n_blocks = (n_pixels + PIXEL_BLOCK - 1) // PIXEL_BLOCK
+    for block in prange(n_blocks):
+        start = block * PIXEL_BLOCK
+        stop = min(start + PIXEL_BLOCK, n_pixels)
+        _block_spells(mask, start, stop, min_length, longest, count, total)
+    return longest, count, total
+
+
+@njit(parallel=True, cache=True)
+def dry_wet_spells(pre, threshold, min_length):
+    """
+    由日降水直接统计干（< threshold）/湿连续段，省去两个布尔数组；NaN 日按湿日处理。
+
+    pre: 2D float 数组 (days, pixels)
+
+    返回：
+    dry_longest, dry_count, dry_total, wet_longest, wet_count, wet_total: 1D int64 数组；
+    all_nan: 1D 布尔数组，全年均为 NaN 的像元
+    """
+    days, n_pixels = pre.shape
+    dry_longest = np.zeros(n_pixels, dtype=np.int64)
+    dry_count = np.zeros(n_pixels, dtype=np.int64)
+    dry_total = np.zeros(n_pixels, dtype=np.int64)
+    wet_longest = np.zeros(n_pixels, dtype=np.int64)
+    wet_count = np.zeros(n_pixels, dtype=np.int64)
+    wet_total = np.zeros(n_pixels, dtype=np.int64)
+    all_nan = np.ones(n_pixels, dtype=np.bool_)
+    n_blocks = (n_pixels + PIXEL_BLOCK - 1) // PIXEL_BLOCK
+    for block in prange(n_blocks):
+        start = block * PIXEL_BLOCK
+        stop = min(start + PIXEL_BLOCK, n_pixels)
+        width = stop - start
+        dry_run = np.zeros(width, dtype=np.int64)
+        wet_run = np.zeros(width, dtype=np.int64)
+        for t in range(days):
+            for i in range(width):
+                p = start + i
+                value = pre[t, p]
+                if not np.isnan(value):
+                    all_nan[p] = False
+                if value < threshold:
+                    if wet_run[i] > 0 and wet_run[i] >= min_length:
+                        wet_count[p] += 1
+                        wet_total[p] += wet_run[i]
+                    wet_run[i] = 0
+                    dry_run[i] += 1
+                    if dry_run[i] > dry_longest[p]:
+                        dry_longest[p] = dry_run[i]
+                else:
+                    if dry_run[i] > 0 and dry_run[i] >= min_length:
+                        dry_count[p] += 1
+                        dry_total[p] += dry_run[i]
+                    dry_run[i] = 0
+                    wet_run[i] += 1
+                    if wet_run[i] > wet_longest[p]:
+                        wet_longest[p] = wet_run[i]
+        for i in range(width):
+            p = start + i
+            if dry_run[i] > 0 and dry_run[i] >= min_length:
+                dry_count[p] += 1
+                dry_total[p] += dry_run[i]
+            if wet_run[i] > 0 and wet_run[i] >= min_length:
+                wet_count[p] += 1
+                wet_total[p] += wet_run[i]
+    return dry_longest, dry_count, dry_total, wet_longest, wet_count, wet_total, all_nan
+
+
+@njit(parallel=True, cache=True)
+def spell_duration(mask, carry, next_mask, has_next, invalid, min_length):
+    """
+    WSDI/CSDI 的逐像元扫描，规则与 etccdi_kernels.spell_duration 相同。
+
+    mask: 布尔数组 (days, pixels)
+    carry: 1D 整型数组 (pixels,)，原地更新
+    next_mask: 布尔数组 (k, pixels)，has_next 为 False 时忽略
+    invalid: 1D 布尔数组 (pixels,)
+
+    返回：
+    value: 1D float32 数组，invalid 像元为 NaN
+    """
+    days, n_pixels = mask.shape
+    head_days = min(next_mask.shape[0], min_length)
+    value = np.zeros(n_pixels, dtype=np.float32)
+    n_blocks = (n_pixels + PIXEL_BLOCK - 1) // PIXEL_BLOCK
+    for block in prange(n_blocks):
+        start = block * PIXEL_BLOCK
+        stop = min(start + PIXEL_BLOCK, n_pixels)
+        width = stop - start
+        run = np.zeros(width, dtype=np.int64)
+        closed = np.zeros(width, dtype=np.int64)
+        leading = np.full(width, -1, dtype=np.int64)  # 第一个不满足条件的日，-1 表示全年满足
+        for t in range(days):
+            for i in range(width):
+                p = start + i
+                if mask[t, p]:
+                    run[i] += 1
+                else:
+                    # 年内已结束的连续段
+                    if run[i] >= min_length:
+                        closed[i] += run[i]
+                    run[i] = 0
+                    if leading[i] < 0:
+                        leading[i] = t
+
+        for i in range(width):
+            p = start + i
+            total = closed[i]
+            has_break = leading[i] >= 0
+            # 延续上一年的开头连续段无条件计入
+            if carry[p] > 0 and has_break and leading[i] < min_length:
+                total += leading[i]
+            if not has_next:
+                if has_break:
+                    carry[p] = 0
+            else:
+                next_leading = head_days
+                for t in range(head_days):
+                    if not next_mask[t, p]:
+                        next_leading = t
+                        break
+                if run[i] + next_leading >= min_length and not invalid[p]:
+                    total += run[i]
+                    carry[p] = next_leading
+                else:
+                    carry[p] = 0
+            value[p] = np.nan if invalid[p] else np.float32(total)
+    return value
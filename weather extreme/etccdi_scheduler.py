@@ -0,0 +1,156 @@
+"""
+ETCCDI 指数的按年并行调度。
+
+各年份的大部分指数互不依赖，这里把年份分配到进程池中并行计算，同时满足已有的依赖关系：
+1. 先行任务（逐日百分位阈值等）全部完成后才开始计算指数；
+2. WSDI/CSDI 通过 carry 在相邻年份间传递状态，作为一条按年顺序执行的任务链，与其余年份任务并行；
+3. 所有进程共享一个信号量，限制同时读写文件的进程数，避免大量进程同时读盘反而变慢。
+
+每个工作进程只构建一次引擎（阈值等辅助栅格只读取一次），随后复用于分配到的所有年份。
+传入 IndexManifest 时只计算缺失或过期的指数（增量更新），每个任务完成后写回清单。
+"""
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+
+from etccdi_engine import ETCCDIEngine, register_standard_indices, load_raster
+
+_io_semaphore = None
+_engines = {}
+
+
+def _init_worker(semaphore):
+    """工作进程初始化：保存共享的 I/O 信号量。"""
+    global _io_semaphore
+    _io_semaphore = semaphore
+
+
+def build_engine(config, sequential=None, io_limiter=None):
+    """
+    由配置构建引擎并注册标准指数。
+
+    参数：
+    config: dict - 可序列化的运行配置：
+            "input_dirs"、"output_base_dir"、"output_dirs"（可选）、
+            "prwn95_file"、"prwn99_file"（可选）、"threshold_files"（可选，阈值名 -> 路径）、
+            "memory_limit_mb"（可选，见 ETCCDIEngine）、
+            "output_mode"、"stack_options"（可选，"stack" 时各进程仍写逐年文件，全部完成后合并为多波段 COG）、
+            "options"（可选，传给 register_standard_indices 的其余参数）
+    sequential: None 注册全部指数；True 只保留依赖上一年状态的指数；False 只保留逐年独立的指数
+    io_limiter: 传给引擎的 I/O 并发限制
+
+    返回：
+    engine: ETCCDIEngine
+    """
+    prwn95_file = config.get("prwn95_file")
+    prwn95 = load_raster(prwn95_file) if prwn95_file and os.path.exists(prwn95_file) else None
+    prwn99_file = config.get("prwn99_file")
+    prwn99 = load_raster(prwn99_file) if prwn99_file and os.path.exists(prwn99_file) else None
+    thresholds = {name: load_raster(path) for name, path in config.get("threshold_files", {}).items()
+                  if os.path.exists(path)}
+
+    engine = ETCCDIEngine(config["input_dirs"], config["output_base_dir"], config.get("output_dirs"), io_limiter,
+                          config.get("memory_limit_mb"), stack_options=config.get("stack_options"))
+    register_standard_indices(engine, prwn95=prwn95, thresholds=thresholds, prwn99=prwn99,
+                              **config.get("options", {}))
+    if sequential is not None:
+        engine.indices = [index for index in engine.indices if index["sequential"] == sequential]
+    return engine
+
+
+def aux_files(config):
+    """配置中的阈值文件：引擎辅助数组名 -> 路径（用于增量清单检测阈值变化）。"""
+    files = {name: config[key] for name, key in [("prwn95", "prwn95_file"), ("prwn99", "prwn99_file")]
+             if config.get(key)}
+    files.update(config.get("threshold_files", {}))
+    return files
+
+
+def _worker_engine(config, sequential):
+    """每个工作进程缓存一个引擎（同一进程池内配置不变）。"""
+    if sequential not in _engines:
+        _engines[sequential] = build_engine(config, sequential, _io_semaphore)
+    return _engines[sequential]
+
+
+def _run_year(config, year, lookahead, outputs=None):
+    """计算并输出某一年全部（或 outputs 指定的）逐年独立的指数。"""
+    engine = _worker_engine(config, False)
+    engine.run_year(year, lookahead=lookahead, outputs=outputs)
+    return year
+
+
+def _run_sequential(config, years, plan=None):
+    """按年份顺序计算依赖上一年状态的指数（WSDI/CSDI）；plan 见 ETCCDIEngine.run。"""
+    engine = _worker_engine(config, True)
+    engine.run(years, plan, progress=False)
+    return years
+
+
+def _run_prerequisite(func, args, kwargs):
+    func(*args, **kwargs)
+
+
+def run_parallel(config, years, workers=None, io_limit=4, prerequisites=(), manifest=None):
+    """
+    按年并行计算全部指数。
+
+    参数：
+    config: dict - 运行配置，见 build_engine
+    years: 连续递增的年份序列
+    workers: 进程数（默认 CPU 核数）；每个进程同时持有一年的数据栈和全部阈值，应按内存调整
+    io_limit: 同时读写文件的最大进程数
+    prerequisites: 先行任务列表，每项为 (func, args, kwargs)，如阈值计算；
+                   这些任务并行执行，全部完成后才开始计算指数（func 须为模块级函数）
+    manifest: 可选，IndexManifest；只计算缺失或依赖已变化的指数
+    """
+    years = list(years)
+    workers = workers or os.cpu_count()
+    semaphore = multiprocessing.Semaphore(io_limit)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(semaphore,)) as pool:
+        # 先行任务（阈值）
+        futures = [pool.submit(_run_prerequisite, func, args, kwargs) for func, args, kwargs in prerequisites]
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Building prerequisites"):
+            future.result()
+
+        # 输出目录只需创建一次（阈值已就绪，注册结果与工作进程一致）
+        engine = build_engine(config)
+        engine.make_output_dirs()
+        sequential = [name for index in engine.indices if index["sequential"] for name in index["outputs"]]
+        plan = None if manifest is None else manifest.plan(engine, years, aux_files(config))
+        del engine
+
+        # 每年分为逐年独立的指数与顺序任务链中的指数
+        if plan is None:
+            year_outputs = {year: None for year in years}
+            chain = {year: sequential for year in years} if sequential else {}
+        else:
+            year_outputs, chain = {}, {}
+            for year, outputs in plan.items():
+                independent = [name for name in outputs if name not in sequential]
+                if independent:
+                    year_outputs[year] = independent
+                if len(independent) < len(outputs):
+                    chain[year] = [name for name in outputs if name in sequential]
+
+        # 顺序任务链耗时最长，最先提交；其余年份任务填满剩余进程
+        futures = {}
+        if chain:
+            future = pool.submit(_run_sequential, config, years, None if plan is None else chain)
+            futures[future] = chain
+        for year, outputs in year_outputs.items():
+            future = pool.submit(_run_year, config, year, year + 1 in years, outputs)
+            futures[future] = {year: outputs}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Computing ETCCDI indices"):
+            future.result()
+            if manifest is not None:
+                for year, outputs in futures[future].items():
+                    manifest.record(year, {name: plan[year][name] for name in outputs})
+                manifest.save()
+
+    # 多波段输出：逐年文件合并为每个指数一个 COG（增量更新需要保留逐年文件）
+    if config.get("output_mode", "yearly") == "stack":
+        build_engine(config).stack_outputs(years, remove_yearly=manifest is None)
@@ -0,0 +1,423 @@
+"""
+ETCCDI 指数的惰性 xarray/dask 接口，供 notebook 中探索使用（需要安装 xarray 与 dask）。
+
+open_dataset 把转换后的逐年 GeoTIFF 目录（或 analysis_cube 导出的 .nc / .zarr 立方体）按空间分块打开为
+(time, y, x) 的 xarray.Dataset，此时不读取数据；cdd(ds)、tx90p(ds, thresholds) 等函数返回惰性的
+(year, y, x) DataArray，调用 .compute() 时才并行计算。每个空间分块的全序列是一个 dask 任务，
+块内按年调用 etccdi_kernels（与 etccdi_engine 的结果一致），跨年的状态（WSDI/CSDI 的 carry、冻结季的部分和）
+在块内逐年传递，下一年开头、上一年末尾的数据直接取自同一分块。
+
+local_client 启动本地 dask.distributed 集群（可选依赖，需要安装 distributed），
+可设置每个进程的内存上限与溢出到磁盘的目录：
+
+    import etccdi_xarray as indices
+    client = indices.local_client(n_workers=8, memory_limit="4GB", spill_dir=r"F:\\dask-spill")
+    ds = indices.open_dataset({"pre": r"F:\\QTP_CN05.1_converted\\pre", "tmax": r"F:\\QTP_CN05.1_converted\\tmax"})
+    thresholds = {"TXin90": load_raster(r"F:\\climate extremes\\TX90p\\threshold\\TXin90.tif")}
+    cdd = indices.cdd(ds.sel(time=slice("1961", "2014")))
+    tx90p = indices.tx90p(ds, thresholds).compute()
+"""
+
+import os
+from functools import partial
+import numpy as np
+import rasterio
+import xarray as xr
+import dask
+import dask.array as da
+from rasterio.transform import Affine
+from rasterio.windows import Window
+
+import etccdi_kernels as kernels
+from analysis_cube import AnalysisCube
+from etccdi_engine import FILE_PATTERNS, spell_duration_index
+from stack_catalog import load_catalog
+
+try:
+    from dask.distributed import Client, LocalCluster
+except ImportError:  # distributed 为可选依赖
+    Client = LocalCluster = None
+
+try:
+    import numba
+except ImportError:  # Numba 为可选依赖（backend="numba"）
+    numba = None
+
+if numba is not None and "NUMBA_THREADING_LAYER" not in os.environ:
+    # dask 的多个线程会同时调用 Numba 并行核心：TBB 线程层在这种情况下进程退出时会挂起，优先使用 OpenMP 线程层
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+
+DEFAULT_CHUNKS = (32, 32)  # 默认空间分块（行, 列）；每块读入全序列，61 年约 90 MB / 变量
+
+
+class _RasterStack:
+    """一个逐年多波段 GeoTIFF 的惰性数组，供 dask.array.from_array 按块读取（每次读取时打开文件）。"""
+
+    def __init__(self, path, count, height, width):
+        self.path = path
+        self.shape = (count, height, width)
+        self.dtype = np.dtype(np.float32)
+        self.ndim = 3
+
+    def __getitem__(self, key):
+        bands, rows, cols = (range(*k.indices(n)) for k, n in zip(key, self.shape))
+        if not len(bands) or not len(rows) or not len(cols):
+            return np.empty((len(bands), len(rows), len(cols)), dtype=np.float32)
+        window = Window(cols.start, rows.start, cols.stop - cols.start, rows.stop - rows.start)
+        with rasterio.open(self.path) as src:
+            data = src.read([band + 1 for band in bands], window=window).astype(np.float32)
+        return data[:, ::rows.step, ::cols.step]
+
+
+def _open_stacks(data_dir, var, chunks):
+    """逐年 GeoTIFF 目录 -> (time, y, x) DataArray（按 catalog.json 中的波段日期建立时间坐标）。"""
+    catalog = load_catalog(data_dir, prefix=FILE_PATTERNS[var].split("_")[0])
+    if not catalog.years:
+        raise FileNotFoundError(f"No yearly stacks for {var} in {data_dir}")
+    first = catalog.entries[catalog.years[0]]
+    height, width = first["height"], first["width"]
+    transform = Affine(*first["transform"])
+    arrays = []
+    for year in catalog.years:
+        entry = catalog.entries[year]
+        stack = _RasterStack(catalog.path(year), entry["bands"], height, width)
+        token = dask.base.tokenize(catalog.path(year), os.path.getmtime(catalog.path(year)))
+        arrays.append(da.from_array(stack, chunks=(-1,) + tuple(chunks), name=f"{var}-{year}-{token}",
+                                    meta=np.empty((0, 0, 0), dtype=np.float32)))
+    return xr.DataArray(
+        da.concatenate(arrays, axis=0),
+        dims=("time", "y", "x"),
+        coords={
+            "time": np.concatenate([catalog.dates(year) for year in catalog.years]).astype("datetime64[ns]"),
+            "y": transform.f + transform.e * (np.arange(height) + 0.5),
+            "x": transform.c + transform.a * (np.arange(width) + 0.5),
+        },
+        name=var,
+        attrs={"crs_wkt": first["crs"] or "", "geotransform": list(transform.to_gdal())},
+    )
+
+
+def _open_cube(path, var, chunks):
+    """analysis_cube 导出的立方体 -> (time, y, x) DataArray。"""
+    cube = AnalysisCube(path)
+    attrs = {"crs_wkt": cube.crs.to_wkt() if cube.crs else "", "geotransform": list(cube.transform.to_gdal())}
+    if path.rstrip("/\\").endswith(".nc"):
+        cube.close()
+        data = xr.open_dataset(path, chunks={"time": -1, "y": chunks[0], "x": chunks[1]})[cube.name]
+        return data.rename(var).assign_attrs(attrs)
+    return xr.DataArray(
+        da.from_array(cube.data, chunks=(-1,) + tuple(chunks)),
+        dims=("time", "y", "x"),
+        coords={
+            "time": cube.dates.astype("datetime64[ns]"),
+            "y": cube.transform.f + cube.transform.e * (np.arange(cube.height) + 0.5),
+            "x": cube.transform.c + cube.transform.a * (np.arange(cube.width) + 0.5),
+        },
+        name=var,
+        attrs=attrs,
+    )
+
+
+def open_dataset(input_dirs, years=None, chunks=DEFAULT_CHUNKS):
+    """
+    惰性打开转换后的数据集。
+
+    参数：
+    input_dirs: dict - 变量名（"pre"、"tmax"、"tmin"、"tmean"）-> 逐年 GeoTIFF 目录或 .nc / .zarr 立方体，
+                与 ETCCDIEngine 的 input_dirs 相同
+    years: 可选，只保留这些年份（须连续）
+    chunks: 空间分块 (行, 列)；时间方向不分块
+
+    返回：
+    ds: xarray.Dataset，各变量为 (time, y, x) 的 dask 数组，attrs 中有 crs_wkt 与 geotransform
+    """
+    variables = {}
+    for var, path in input_dirs.items():
+        if path.rstrip("/\\").endswith((".nc", ".zarr")):
+            variables[var] = _open_cube(path, var, chunks)
+        else:
+            variables[var] = _open_stacks(path, var, chunks)
+    ds = xr.Dataset(variables)
+    ds.attrs.update(next(iter(variables.values())).attrs)
+    if years is not None:
+        years = list(years)
+        ds = ds.sel(time=slice(str(years[0]), str(years[-1])))
+    return ds
+
+
+def local_client(n_workers=None, memory_limit="4GB", spill_dir=None, threads_per_worker=1):
+    """
+    启动本地 dask.distributed 集群并返回 Client（需要安装 distributed）。
+
+    参数：
+    n_workers: 进程数（默认由 dask 按 CPU 核数决定）
+    memory_limit: 每个进程的内存上限（如 "4GB"），超过约 60% 时把数据溢出到磁盘
+    spill_dir: 溢出文件目录（默认系统临时目录）
+    threads_per_worker: 每个进程的线程数
+    """
+    if LocalCluster is None:
+        raise ImportError("local_client requires the optional 'distributed' package (pip install distributed)")
+    if spill_dir is not None:
+        os.makedirs(spill_dir, exist_ok=True)
+        dask.config.set({"temporary_directory": spill_dir})
+    cluster = LocalCluster(n_workers=n_workers, threads_per_worker=threads_per_worker,
+                           memory_limit=memory_limit, local_directory=spill_dir)
+    return Client(cluster)
+
+
+def _year_slices(time):
+    """时间坐标 -> (年份列表, 各年的切片, 各年的 0-based 日序)；时间须递增。"""
+    dates = np.asarray(time, dtype="datetime64[D]")
+    if np.any(np.diff(dates.astype(np.int64)) <= 0):
+        raise ValueError("The time coordinate must be strictly increasing")
+    year_of_day = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    years, starts = np.unique(year_of_day, return_index=True)
+    stops = np.append(starts[1:], len(dates))
+    day_of_year = (dates - dates.astype("datetime64[Y]")).astype(np.int64)
+    return [int(year) for year in years], [slice(a, b) for a, b in zip(starts, stops)], day_of_year
+
+
+def _annual_block(*blocks, func, variables, aux_names, state, years, slices, day_of_year,
+                  lookahead, lookbehind, n_outputs):
+    """一个空间分块的全序列：按年组装与 ETCCDIEngine 相同的 inputs 并调用 func。"""
+    stacks = dict(zip(variables, blocks[:len(variables)]))
+    aux = dict(zip(aux_names, blocks[len(variables):]))
+    shape = blocks[0].shape[1:]
+    states = {name: factory(shape) for name, factory in state.items()}
+    out = np.full((n_outputs, len(years)) + shape, np.nan, dtype=np.float32)
+    for i, (year, days) in enumerate(zip(years, slices)):
+        inputs = {var: data[days] for var, data in stacks.items()}
+        inputs.update(aux)
+        inputs.update(states)
+        inputs["year"] = year
+        inputs["day_of_year"] = day_of_year[days]
+        if lookahead:
+            # 与 ETCCDIEngine.run 一致：只在下一年也在计算范围内时使用下一年开头
+            has_next = i + 1 < len(years) and years[i + 1] == year + 1
+            following = slices[i + 1] if has_next else None
+            for var, data in stacks.items():
+                inputs[f"{var}_next"] = data[following][:lookahead] if has_next else None
+            inputs["day_of_year_next"] = day_of_year[following][:lookahead] if has_next else None
+        if lookbehind:
+            has_previous = i > 0 and years[i - 1] == year - 1
+            previous = slices[i - 1] if has_previous else None
+            for var, data in stacks.items():
+                inputs[f"{var}_prev"] = data[previous][-lookbehind:] if has_previous else None
+            inputs["day_of_year_prev"] = day_of_year[previous][-lookbehind:] if has_previous else None
+        values = func(inputs)
+        if not isinstance(values, (tuple, list)):
+            values = (values,)
+        for k, value in enumerate(values):
+            out[k, i] = value
+    return out
+
+
+def annual_index(ds, variables, func, names, aux=None, state=None, lookahead=0, lookbehind=0):
+    """
+    通用的惰性逐年指数：func 的约定与 ETCCDIEngine.register 相同。
+
+    参数：
+    ds: open_dataset 返回的 Dataset（可先按时间、空间裁剪）
+    variables: func 用到的变量名
+    func: callable - func(inputs) -> 2D数组或数组元组
+    names: str 或 list - 输出名，func 返回多个数组时按此顺序对应
+    aux: dict - 可选，辅助数组（阈值等），最后两维与栅格一致（numpy 数组或 DataArray）
+    state: dict - 可选，跨年状态名 -> factory(shape)，每个分块创建一次、逐年在 inputs 中原地更新
+    lookahead, lookbehind: 需要的下一年开头 / 上一年末尾天数
+
+    返回：
+    names 为 str 时返回 (year, y, x) DataArray，否则返回 Dataset
+    """
+    single = isinstance(names, str)
+    names = [names] if single else list(names)
+    aux = dict(aux or {})
+    years, slices, day_of_year = _year_slices(ds["time"].values)
+
+    data = [ds[var].data.rechunk({0: -1}) for var in variables]
+    spatial = data[0].chunks[1:]
+    data = [array.rechunk((-1,) + spatial) for array in data]
+    aux_arrays = []
+    for array in aux.values():
+        array = da.asarray(np.asarray(array, dtype=np.float32))
+        aux_arrays.append(array.rechunk(tuple((n,) for n in array.shape[:-2]) + spatial))
+
+    result = da.map_blocks(
+        partial(_annual_block, func=func, variables=list(variables), aux_names=list(aux),
+                state=dict(state or {}), years=years, slices=slices, day_of_year=day_of_year,
+                lookahead=lookahead, lookbehind=lookbehind, n_outputs=len(names)),
+        *data, *aux_arrays,
+        new_axis=0, chunks=((len(names),), (len(years),)) + spatial, dtype=np.float32,
+        meta=np.empty((0, 0, 0, 0), dtype=np.float32),
+    )
+    coords = {"year": years, "y": ds["y"].values, "x": ds["x"].values}
+    arrays = {name: xr.DataArray(result[k], dims=("year", "y", "x"), coords=coords, name=name, attrs=ds.attrs)
+              for k, name in enumerate(names)}
+    return arrays[names[0]] if single else xr.Dataset(arrays, attrs=ds.attrs)
+
+
+def _threshold(thresholds, name):
+    """thresholds 可以是阈值数组本身，也可以是 {"TXin90": ..., ...} 形式的 dict。"""
+    return thresholds[name] if isinstance(thresholds, dict) else thresholds
+
+
+# ---------------------------------------------------------------------------
+# 降水指数
+# ---------------------------------------------------------------------------
+
+def prcptot(ds):
+    return annual_index(ds, ["pre"], lambda d: kernels.prcptot(d["pre"]), "PRCPTOT")
+
+
+def sdii(ds):
+    return annual_index(ds, ["pre"], lambda d: kernels.sdii(d["pre"]), "SDII")
+
+
+def r1mm(ds):
+    return annual_index(ds, ["pre"], lambda d: kernels.precip_days(d["pre"], 1), "R1mm")
+
+
+def r10mm(ds):
+    return annual_index(ds, ["pre"], lambda d: kernels.precip_days(d["pre"], 10), "R10mm")
+
+
+def rxnday(ds, windows=(1, 5), cross_year=False):
+    """RX<n>day（返回 Dataset，各窗口共用一次累积和）；cross_year 见 register_standard_indices 的 rx_cross_year。"""
+    return annual_index(ds, ["pre"], lambda d: tuple(kernels.rxnday(d["pre"], windows, d.get("pre_prev"))),
+                        [f"RX{n}day" for n in windows], lookbehind=max(windows) - 1 if cross_year else 0)
+
+
+def rx1day(ds, cross_year=False):
+    return rxnday(ds, (1,), cross_year)["RX1day"]
+
+
+def rx5day(ds, cross_year=False):
+    return rxnday(ds, (5,), cross_year)["RX5day"]
+
+
+def cdd_cwd(ds, with_stats=False, backend=None):
+    """CDD 与 CWD（with_stats 为 True 时另有连续段个数与平均长度），返回 Dataset。"""
+    names = ["CDD", "CWD"] + (["CDD_count", "CDD_mean", "CWD_count", "CWD_mean"] if with_stats else [])
+    return annual_index(ds, ["pre"], lambda d: kernels.cdd_cwd(d["pre"], with_stats, backend=backend), names)
+
+
+def cdd(ds, backend=None):
+    return cdd_cwd(ds, backend=backend)["CDD"]
+
+
+def cwd(ds, backend=None):
+    return cdd_cwd(ds, backend=backend)["CWD"]
+
+
+def r95p(ds, prwn95):
+    """R95p：prwn95 为 2D 阈值（如 PRwn95CN051.py 的输出）。"""
+    return annual_index(ds, ["pre"], lambda d: kernels.r95p(d["pre"], d["prwn95"]), "R95p",
+                        aux={"prwn95": prwn95})
+
+
+def r99p(ds, prwn99):
+    return annual_index(ds, ["pre"], lambda d: kernels.r95p(d["pre"], d["prwn99"]), "R99p",
+                        aux={"prwn99": prwn99})
+
+
+# ---------------------------------------------------------------------------
+# 气温指数
+# ---------------------------------------------------------------------------
+
+def txx(ds):
+    return annual_index(ds, ["tmax"], lambda d: kernels.txx(d["tmax"]), "TXx")
+
+
+def txn(ds):
+    return annual_index(ds, ["tmax"], lambda d: kernels.txn(d["tmax"]), "TXn")
+
+
+def tnx(ds):
+    return annual_index(ds, ["tmin"], lambda d: kernels.tnx(d["tmin"]), "TNx")
+
+
+def tnn(ds):
+    return annual_index(ds, ["tmin"], lambda d: kernels.tnn(d["tmin"]), "TNn")
+
+
+def fd_id_dtr_tfr(ds, nan_policy="any", tfr_max=1000):
+    """FD、ID、DTR、TFR 与冻结/融化指数（返回 Dataset），规则见 kernels.fd_id_dtr_tfr。"""
+    return annual_index(
+        ds, ["tmin", "tmax", "tmean"],
+        lambda d: kernels.fd_id_dtr_tfr(d["tmin"], d["tmax"], d["tmean"], nan_policy=nan_policy, tfr_max=tfr_max),
+        ["FD", "ID", "DTR", "TFR", "Freeze_Index", "Thaw_Index"],
+    )
+
+
+def _percentile(ds, var, thresholds, threshold_name, above, name):
+    return annual_index(
+        ds, [var],
+        lambda d: kernels.percentile_exceedance(d[var], d["day_of_year"], d[threshold_name], above),
+        name, aux={threshold_name: _threshold(thresholds, threshold_name)},
+    )
+
+
+def tx90p(ds, thresholds):
+    """TX90p：thresholds 为 (366, y, x) 的 TXin90 或包含 "TXin90" 的 dict。"""
+    return _percentile(ds, "tmax", thresholds, "TXin90", True, "TX90p")
+
+
+def tx10p(ds, thresholds):
+    return _percentile(ds, "tmax", thresholds, "TXin10", False, "TX10p")
+
+
+def tn90p(ds, thresholds):
+    return _percentile(ds, "tmin", thresholds, "TNin90", True, "TN90p")
+
+
+def tn10p(ds, thresholds):
+    return _percentile(ds, "tmin", thresholds, "TNin10", False, "TN10p")
+
+
+def _spell(ds, var, thresholds, threshold_name, above, name, backend):
+    carry_name = f"{name}_carry"
+    return annual_index(
+        ds, [var],
+        partial(spell_duration_index, var=var, threshold_name=threshold_name, above=above,
+                carry_name=carry_name, backend=backend),
+        name, aux={threshold_name: _threshold(thresholds, threshold_name)},
+        state={carry_name: lambda shape: np.zeros(shape, dtype=np.int16)}, lookahead=6,
+    )
+
+
+def wsdi(ds, thresholds, backend=None):
+    """WSDI：thresholds 为 TXin90 或包含 "TXin90" 的 dict；跨年连续段在每个分块内逐年衔接。"""
+    return _spell(ds, "tmax", thresholds, "TXin90", True, "WSDI", backend)
+
+
+def csdi(ds, thresholds, backend=None):
+    """CSDI：thresholds 为 TNin10 或包含 "TNin10" 的 dict。"""
+    return _spell(ds, "tmin", thresholds, "TNin10", False, "CSDI", backend)
+
+
+# ---------------------------------------------------------------------------
+# 生长季与冻结季
+# ---------------------------------------------------------------------------
+
+def gsl(ds, nan_policy="any"):
+    return annual_index(ds, ["tmean"],
+                        lambda d: kernels.gsl(d["tmean"], d["day_of_year"], d["year"], nan_policy=nan_policy), "GSL")
+
+
+def frost_dates(ds, nan_policy="any"):
+    """终霜日与初霜日（0-based 日序），返回 Dataset。"""
+    return annual_index(
+        ds, ["tmin"],
+        lambda d: kernels.frost_dates(d["tmin"], d["day_of_year"], d["year"], nan_policy=nan_policy),
+        ["LastFrost", "FirstFrost"],
+    )
+
+
+def freezing_season(ds, nan_policy="any"):
+    """冻结季（上一年 7 月至当年 6 月）的冻结/融化指数，返回 Dataset；第一年为 NaN。"""
+    return annual_index(
+        ds, ["tmean"],
+        lambda d: kernels.freezing_season_index(d["tmean"], d["day_of_year"], d["year"],
+                                                d["freezing_season_carry"], nan_policy=nan_policy),
+        ["Freeze_Index_season", "Thaw_Index_season"],
+        state={"freezing_season_carry": kernels.new_freezing_season_carry},
+    )
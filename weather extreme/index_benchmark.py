@@ -0,0 +1,385 @@
+"""
+指数计算的基准测试：在合成的 CN05.1 数据（synthetic_cn051.py，青藏高原裁剪区与全国两种网格）上
+逐项计时 weather extreme 中的全部指数，以及 WAP、热指数（get_heat_index(HI).py）与 SPEI（SPEI_calculator.py）。
+
+每一项在单独的子进程中运行，记录：
+- wall_time_s：耗时（repeat 次中的最短值，times 为每次的耗时）；
+- peak_rss_mb：子进程的峰值常驻内存；
+- bytes_read：运行期间读取的字节数（需要 psutil 或 Linux 的 /proc/self/io）。
+结果连同提交号、平台与数据集信息写为 JSON，可用 compare_results 与其他提交的结果对比。
+缺少可选依赖（numba、GDAL、climate_indices 等）的项记为 skipped。
+Numba 项首次运行包含 JIT 编译（之后从缓存加载），repeat > 1 时取最短耗时可排除编译时间。
+"""
+
+import os
+import sys
+import json
+import time
+import datetime
+import platform
+import subprocess
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import rasterio
+
+try:
+    import psutil
+except ImportError:  # psutil 为可选依赖，缺少时在 Linux 上读取 /proc
+    psutil = None
+
+from etccdi_engine import FILE_PATTERNS, write_single_band
+from etccdi_scheduler import build_engine
+from stack_catalog import load_catalog
+from synthetic_cn051 import GRIDS, generate_dataset, generate_heat_index_inputs
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+THRESHOLDS = {"tmax": {"TXin90": 90, "TXin10": 10}, "tmin": {"TNin90": 90, "TNin10": 10}}
+
+
+def peak_rss_mb():
+    """当前进程的峰值常驻内存（MB）。"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        if psutil is None:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024 ** 2
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if platform.system() == "Darwin" else peak / 1024
+
+
+def bytes_read():
+    """当前进程累计读取的字节数（包括命中缓存的读取），无法获取时为 None。"""
+    if psutil is not None:
+        counters = psutil.Process().io_counters()
+        return getattr(counters, "read_chars", counters.read_bytes)
+    try:
+        with open("/proc/self/io") as f:
+            return int(next(line for line in f if line.startswith("rchar")).split()[1])
+    except OSError:
+        return None
+
+
+def load_script(path, name):
+    """按路径导入仓库中的脚本（文件名可含括号、目录名可含空格）。"""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module  # Numba 的编译缓存按模块名查找
+    spec.loader.exec_module(module)
+    return module
+
+
+def git_commit():
+    """当前提交号（工作区有改动时加 -dirty），不在 git 仓库中时为 None。"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+# ---------------------------------------------------------------------------
+# 各测试项：func(ctx, **kwargs)，ctx 为数据集与工作目录信息
+# ---------------------------------------------------------------------------
+
+def _input_files(ctx, var, years):
+    return [os.path.join(ctx["input_dirs"][var], FILE_PATTERNS[var].format(year=year)) for year in years]
+
+
+def _engine_config(ctx, memory_limit_mb=None, options=None):
+    return {
+        "input_dirs": ctx["input_dirs"],
+        "output_base_dir": os.path.join(ctx["work_dir"], "indices"),
+        "prwn95_file": os.path.join(ctx["work_dir"], "PRwn95.tif"),
+        "prwn99_file": os.path.join(ctx["work_dir"], "PRwn99.tif"),
+        "threshold_files": {name: os.path.join(ctx["work_dir"], "thresholds", f"{name}.tif")
+                            for names in THRESHOLDS.values() for name in names},
+        "memory_limit_mb": memory_limit_mb,
+        "options": options or {},
+    }
+
+
+def case_thresholds(ctx, var):
+    """逐日百分位阈值（percentile_thresholds.build_thresholds，一次读取得到 90 与 10 百分位）。"""
+    from percentile_thresholds import build_thresholds
+    outputs = {os.path.join(ctx["work_dir"], "thresholds", f"{name}.tif"): q for name, q in THRESHOLDS[var].items()}
+    build_thresholds(_input_files(ctx, var, ctx["years"]), outputs, list(ctx["years"]))
+
+
+def case_wet_day_quantiles(ctx, method):
+    """PRwn95/PRwn99（streaming_quantile.wet_day_quantiles）。"""
+    from streaming_quantile import wet_day_quantiles
+    results, meta = wet_day_quantiles(_input_files(ctx, "pre", ctx["years"]), method=method)
+    if method == "exact":
+        for q, array in results.items():
+            write_single_band(os.path.join(ctx["work_dir"], f"PRwn{q}.tif"), array, meta, f"PRwn{q}")
+
+
+def case_bootstrap(ctx, var):
+    """基准期内的 bootstrap 超限率（bootstrap_exceedance）。"""
+    from bootstrap_exceedance import bootstrap_exceedance
+    names = {"tmax": {"TX90p": (90, True), "TX10p": (10, False)},
+             "tmin": {"TN90p": (90, True), "TN10p": (10, False)}}[var]
+    bootstrap_exceedance(_input_files(ctx, var, ctx["years"]), list(ctx["years"]), names)
+
+
+def case_engine(ctx, outputs=None, memory_limit_mb=None, options=None):
+    """ETCCDIEngine：outputs 指定的一组指数（None 为全部指数一次读取）。"""
+    engine = build_engine(_engine_config(ctx, memory_limit_mb, options))
+    engine.indices = engine.select(outputs)
+    engine.run(ctx["years"], progress=False)
+
+
+def case_check_freeze_thaw(ctx):
+    """
+    一致性检查：引擎输出的 Freeze_Index / Thaw_Index 与 FreezeAndThawIndex.py 的计算（只按 tmean 判断 NaN）
+    逐位一致，不一致时本项记为 failed。
+    """
+    from etccdi_kernels import freeze_thaw_index
+    engine = build_engine(_engine_config(ctx))
+    engine.indices = engine.select(["Freeze_Index", "Thaw_Index"])
+    engine.run(ctx["years"], progress=False)
+    for year in ctx["years"]:
+        with rasterio.open(_input_files(ctx, "tmean", [year])[0]) as src:
+            expected = freeze_thaw_index(src.read())
+        for name, array in zip(["Freeze_Index", "Thaw_Index"], expected):
+            with rasterio.open(engine.output_file(name, year)) as src:
+                if not np.array_equal(src.read(1), array, equal_nan=True):
+                    raise AssertionError(f"{name}_{year} differs from FreezeAndThawIndex.py")
+
+
+def case_wap(ctx, backend):
+    """WAP（WAP Calculator/wap_kernels.py），所有年份的降水连续计算。"""
+    wap_kernels = load_script(os.path.join(REPO_ROOT, "WAP Calculator", "wap_kernels.py"), "wap_kernels")
+    stacks = []
+    for path in _input_files(ctx, "pre", ctx["years"]):
+        with rasterio.open(path) as src:
+            stacks.append(src.read().astype(np.float32))
+    wap_kernels.calculate_daily_wap(np.concatenate(stacks, axis=0), backend=backend)
+
+
+def case_heat_index(ctx):
+    """热指数（get_heat_index(HI).py，一个月的日数据）。"""
+    module = load_script(os.path.join(REPO_ROOT, "get_heat_index(HI).py"), "get_heat_index")
+    tasmax_folder, hurs_folder = ctx["heat_index_inputs"]
+    module.heat_index(tasmax_folder, hurs_folder, 2000, 7, ctx["work_dir"] + os.sep)
+
+
+def case_spei(ctx, pixels=200, scale=3):
+    """SPEI（SPEI_calculator.py 的逐像元 PET 与 SPEI），取前 pixels 个有效像元的月序列。"""
+    module = load_script(os.path.join(REPO_ROOT, "SPEI_calculator.py"), "SPEI_calculator")
+    years = list(ctx["years"])
+    tmean_catalog = load_catalog(ctx["input_dirs"]["tmean"])
+    tmean, pre = [], []
+    for year in years:
+        months = tmean_catalog.dates(year).astype("datetime64[M]").astype(int) % 12
+        with rasterio.open(tmean_catalog.path(year)) as src:
+            t = src.read()
+            transform = src.transform
+        with rasterio.open(_input_files(ctx, "pre", [year])[0]) as src:
+            p = src.read()
+        tmean.append([t[months == m].mean(axis=0) for m in range(12)])
+        pre.append([p[months == m].sum(axis=0) for m in range(12)])
+    tmean = np.concatenate(tmean).reshape(len(years) * 12, -1)
+    pre = np.concatenate(pre).reshape(len(years) * 12, -1)
+    height, width = t.shape[1:]
+    latitude = np.repeat(transform.f + transform.e * (np.arange(height) + 0.5), width)
+
+    for pixel in np.flatnonzero(~np.isnan(tmean[0]))[:pixels]:
+        pet = module.cal_pet(tmean[:, pixel], latitude[pixel], years[0])
+        module.cal_spei(pre[:, pixel], pet, scale, years[0], years[0], years[-1])
+
+
+# 前置项：阈值与 PRwn95/PRwn99，其结果供后续指数使用，总会运行
+PREREQUISITE_CASES = [
+    ("thresholds/tmax", case_thresholds, {"var": "tmax"}),
+    ("thresholds/tmin", case_thresholds, {"var": "tmin"}),
+    ("quantiles/PRwn95+PRwn99[exact]", case_wet_day_quantiles, {"method": "exact"}),
+]
+
+
+def benchmark_cases(ctx):
+    """
+    前置项之后的测试项：(名称, 函数, 参数)。
+    指数按引擎中注册的组逐组计时（须在前置项完成后调用，依赖阈值的指数才会注册），
+    再加上全部指数一次读取（整幅与分窗口）。
+    """
+    cases = [
+        ("quantiles/PRwn95+PRwn99[sketch]", case_wet_day_quantiles, {"method": "sketch"}),
+        ("bootstrap/tmax", case_bootstrap, {"var": "tmax"}),
+        ("bootstrap/tmin", case_bootstrap, {"var": "tmin"}),
+    ]
+    groups = [index["outputs"] for index in build_engine(_engine_config(ctx)).indices]
+    for outputs in groups:
+        cases.append((f"index/{'+'.join(outputs)}", case_engine, {"outputs": outputs}))
+        if set(outputs) & {"CDD", "WSDI", "CSDI"}:
+            cases.append((f"index/{'+'.join(outputs)}[numba]", case_engine,
+                          {"outputs": outputs, "options": {"backend": "numba"}}))
+    cases += [
+        ("engine/all", case_engine, {}),
+        ("engine/all[windowed]", case_engine, {"memory_limit_mb": 64}),
+        ("check/Freeze_Index+Thaw_Index", case_check_freeze_thaw, {}),
+        ("wap[numpy]", case_wap, {"backend": "numpy"}),
+        ("wap[numba]", case_wap, {"backend": "numba"}),
+        ("heat_index", case_heat_index, {}),
+        ("spei", case_spei, {}),
+    ]
+    return cases
+
+
+def _measure(func, ctx, kwargs, repeat):
+    """在子进程中运行一项并统计资源。"""
+    result = {"status": "ok", "times": []}
+    before = bytes_read()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(ctx, **kwargs)
+            result["times"].append(time.perf_counter() - start)
+    except ImportError as error:
+        return {"status": "skipped", "error": str(error)}
+    except Exception as error:
+        return {"status": "failed", "error": f"{type(error).__name__}: {error}"}
+    after = bytes_read()
+    result.update({
+        "wall_time_s": min(result["times"]),
+        "peak_rss_mb": peak_rss_mb(),
+        "bytes_read": None if before is None or after is None else (after - before) // repeat,
+    })
+    return result
+
+
+def _run_isolated(func, ctx, kwargs, repeat):
+    """每一项使用新的进程，峰值内存互不影响。"""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_measure, func, ctx, kwargs, repeat).result()
+
+
+def prepare_dataset(data_root, grid, years):
+    """生成（已存在时复用）一个网格的合成数据，返回数据集信息。"""
+    root = os.path.join(data_root, grid)
+    input_dirs = {var: os.path.join(root, var) for var in FILE_PATTERNS}
+    complete = all(os.path.exists(path) for var in FILE_PATTERNS
+                   for path in [os.path.join(input_dirs[var], FILE_PATTERNS[var].format(year=year))
+                                for year in years])
+    if not complete:
+        input_dirs = generate_dataset(root, grid=grid, years=years)
+    heat_index_inputs = generate_heat_index_inputs(os.path.join(root, "heat_index"), grid=grid)
+    return {"input_dirs": input_dirs, "years": list(years), "heat_index_inputs": heat_index_inputs}
+
+
+def run_benchmark(data_root, work_root, results_dir, grids=("qtp", "china"), years=range(1961, 1967),
+                  repeat=1, select=None):
+    """
+    运行基准测试并写出 JSON。
+
+    参数：
+    data_root: 合成数据目录（按网格分子目录，已存在时复用）
+    work_root: 中间结果与指数输出目录
+    results_dir: JSON 结果目录
+    grids: 网格名（见 synthetic_cn051.GRIDS）
+    years: 年份（同时作为阈值基准期，应包含闰年）
+    repeat: 每项重复次数，耗时取最短值
+    select: 可选，只运行名称包含其中任一字符串的项（阈值等前置项总会运行）
+
+    返回：
+    path: 结果 JSON 路径
+    """
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "repeat": repeat,
+        "datasets": {},
+        "results": [],
+    }
+    for grid in grids:
+        ctx = prepare_dataset(data_root, grid, years)
+        ctx["work_dir"] = os.path.join(work_root, grid)
+        os.makedirs(ctx["work_dir"], exist_ok=True)
+        report["datasets"][grid] = {"height": GRIDS[grid]["height"], "width": GRIDS[grid]["width"],
+                                    "years": list(years)}
+
+        for name, func, kwargs in PREREQUISITE_CASES:
+            report["results"].append(_record(grid, name, _run_isolated(func, ctx, kwargs, repeat)))
+        for name, func, kwargs in benchmark_cases(ctx):
+            if select and not any(pattern in name for pattern in select):
+                continue
+            report["results"].append(_record(grid, name, _run_isolated(func, ctx, kwargs, repeat)))
+
+    os.makedirs(results_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(results_dir, f"benchmark_{commit or 'nogit'}_{stamp}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    return path
+
+
+def _record(grid, name, result):
+    result = {"dataset": grid, "case": name, **result}
+    if result["status"] == "ok":
+        print(f"[{grid}] {name}: {result['wall_time_s']:.2f} s, peak {result['peak_rss_mb']:.0f} MB")
+    else:
+        print(f"[{grid}] {name}: {result['status']} ({result['error']})")
+    return result
+
+
+def compare_results(baseline_path, current_path):
+    """
+    对比两次结果（如两个提交），打印每项的耗时与峰值内存之比（当前 / 基线）。
+
+    返回：
+    rows: list - (数据集, 项, 基线耗时, 当前耗时, 耗时比, 峰值内存比)
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(current_path, encoding="utf-8") as f:
+        current = json.load(f)
+    previous = {(r["dataset"], r["case"]): r for r in baseline["results"] if r["status"] == "ok"}
+
+    rows = []
+    print(f"{baseline['commit']} -> {current['commit']}")
+    for r in current["results"]:
+        old = previous.get((r["dataset"], r["case"]))
+        if r["status"] != "ok" or old is None:
+            continue
+        time_ratio = r["wall_time_s"] / old["wall_time_s"]
+        rss_ratio = r["peak_rss_mb"] / old["peak_rss_mb"] if r["peak_rss_mb"] and old["peak_rss_mb"] else None
+        rows.append((r["dataset"], r["case"], old["wall_time_s"], r["wall_time_s"], time_ratio, rss_ratio))
+        memory = "" if rss_ratio is None else f", memory x{rss_ratio:.2f}"
+        print(f"[{r['dataset']}] {r['case']:<45} {old['wall_time_s']:8.2f} s -> {r['wall_time_s']:8.2f} s "
+              f"(x{time_ratio:.2f}{memory})")
+    return rows
+
+
+if __name__ == "__main__":
+    # 合成数据、中间结果与 JSON 结果目录
+    data_root = r"F:\benchmark\synthetic"
+    work_root = r"F:\benchmark\work"
+    results_dir = r"F:\benchmark\results"
+
+    # 网格与年份（1964 为闰年）；repeat 为每项重复次数
+    grids = ["qtp", "china"]
+    years = range(1961, 1967)
+    repeat = 1
+
+    # 填入之前某个提交的结果 JSON，运行后自动对比
+    baseline = None
+
+    path = run_benchmark(data_root, work_root, results_dir, grids=grids, years=years, repeat=repeat)
+    print("Benchmark results saved to:", path)
+    if baseline:
+        compare_results(baseline, path)
@@ -0,0 +1,152 @@
+"""
+ETCCDI 指数的增量更新清单。
+
+CN05.1 新增年份（或个别年份的输入被替换）后，不必重算全部年份：清单（manifest.json）记录每年每个指数
+计算时依赖的文件指纹（大小、修改时间，可选 SHA-1），再次运行时只计算缺失或依赖已变化的指数：
+- 当年输入变化：该年用到这些变量的指数重算；
+- 跨年指数的依赖同样写入清单：读取下一年开头的指数（WSDI/CSDI）记录下一年输入，
+  原先作为最后一年计算（没有下一年数据、年末连续段未计入）的年份在新年份到达后只重算这些指数；
+  读取上一年末尾（跨年 RXnday）或依赖上一年状态（WSDI/CSDI 的 carry）的指数记录上一年输入；
+- 阈值文件（PRwn95、TXin90 等）只在变化时使对应指数全部重算，基准期阈值本身不重算；
+- 指数设置（settings）变化时全部重算。
+
+输入为分析立方体（.nc / .zarr）时以整个立方体文件为指纹，立方体变化后全部年份重算。
+"""
+
+import os
+import json
+import hashlib
+
+MANIFEST_NAME = "manifest.json"
+
+
+def file_sha1(path, block_size=16 * 1024 ** 2):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class IndexManifest:
+    """
+    指数输出及其依赖的清单。
+
+    参数：
+    path: 清单文件路径（通常为 <输出根目录>/manifest.json）
+    settings: 可选，可 JSON 序列化的指数设置（如 register_standard_indices 的参数）；与清单中不同时全部重算
+    checksum: 为 True 时文件大小或修改时间变化后再比较 SHA-1，内容未变（如重新拷贝）的文件不触发重算
+    """
+
+    def __init__(self, path, settings=None, checksum=False):
+        self.path = path
+        self.settings = settings
+        self.checksum = checksum
+        self.years = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored.get("settings") == settings:
+                self.years = {int(year): records for year, records in stored["years"].items()}
+        self._fingerprints = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings, "years": {str(year): records for year, records
+                                                            in sorted(self.years.items())}}, f, indent=1)
+
+    def _known_sha1(self, path, size, mtime):
+        """清单中同一文件、同一大小与修改时间的已有 SHA-1（避免重复计算）。"""
+        for records in self.years.values():
+            for deps in records.values():
+                for fingerprint in deps.values():
+                    if (fingerprint and fingerprint["path"] == path and fingerprint["size"] == size
+                            and fingerprint["mtime"] == mtime and "sha1" in fingerprint):
+                        return fingerprint["sha1"]
+        return None
+
+    def fingerprint(self, path):
+        """文件指纹：路径、大小、修改时间（checksum 时另含 SHA-1）；文件不存在时为 None。"""
+        if path is None or not os.path.exists(path):
+            return None
+        if path not in self._fingerprints:
+            stat = os.stat(path)
+            fingerprint = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+            if self.checksum:
+                fingerprint["sha1"] = (self._known_sha1(path, stat.st_size, stat.st_mtime)
+                                       or file_sha1(path))
+            self._fingerprints[path] = fingerprint
+        return self._fingerprints[path]
+
+    @staticmethod
+    def same(recorded, current):
+        if recorded is None or current is None:
+            return recorded is current
+        if recorded["size"] == current["size"] and recorded["mtime"] == current["mtime"]:
+            return True
+        return "sha1" in recorded and recorded.get("sha1") == current.get("sha1")
+
+    def _input_path(self, engine, var, year):
+        if engine.cube(var) is not None:
+            return engine.input_dirs[var] if engine.has_input(var, year) else None
+        return engine.input_file(var, year)
+
+    def dependencies(self, engine, index, year, years, aux_files=None):
+        """
+        某个（组）指数在某一年的依赖指纹：依赖名（"<变量>:<年份>" 或 "aux:<阈值名>"）-> 指纹。
+
+        参数：
+        engine: ETCCDIEngine
+        index: engine.indices 中的一项
+        year: 年份
+        years: 本次计算的年份（决定是否读取下一年、是否承接上一年状态，与 ETCCDIEngine.run 一致）
+        aux_files: dict - 辅助数组名 -> 文件路径（阈值），用于检测阈值变化
+        """
+        deps = {}
+        for var in index["variables"]:
+            deps[f"{var}:{year}"] = self.fingerprint(self._input_path(engine, var, year))
+            if index["lookahead"] and year + 1 in years:
+                deps[f"{var}:{year + 1}"] = self.fingerprint(self._input_path(engine, var, year + 1))
+            if index["lookbehind"] or (index["sequential"] and year - 1 in years):
+                deps[f"{var}:{year - 1}"] = self.fingerprint(self._input_path(engine, var, year - 1))
+        for name in index["aux"]:
+            if aux_files and name in aux_files:
+                deps[f"aux:{name}"] = self.fingerprint(aux_files[name])
+        return deps
+
+    def is_current(self, engine, year, name, deps):
+        recorded = self.years.get(year, {}).get(name)
+        if recorded is None or set(recorded) != set(deps) or not os.path.exists(engine.output_file(name, year)):
+            return False
+        return all(self.same(recorded[key], fingerprint) for key, fingerprint in deps.items())
+
+    def plan(self, engine, years, aux_files=None):
+        """
+        需要计算的年份与指数。
+
+        参数：
+        engine: 已注册指数的 ETCCDIEngine
+        years: 连续递增的目标年份（可比上次运行更长）
+        aux_files: dict - 辅助数组名 -> 文件路径，见 dependencies
+
+        返回：
+        plan: dict - 年份 -> {指数名: 依赖指纹}，只包含缺失或过期的指数（同一组共享计算的指数一并重算），
+              可直接传给 ETCCDIEngine.run(years, plan)；计算完成后用 record 写回清单
+        """
+        years = list(years)
+        plan = {}
+        for year in years:
+            if not any(engine.has_input(var, year) for var in engine.variables):
+                continue
+            for index in engine.indices:
+                if not all(engine.has_input(var, year) for var in index["variables"]):
+                    continue
+                deps = self.dependencies(engine, index, year, years, aux_files)
+                if not all(self.is_current(engine, year, name, deps) for name in index["outputs"]):
+                    plan.setdefault(year, {}).update(dict.fromkeys(index["outputs"], deps))
+        return plan
+
+    def record(self, year, outputs):
+        """记录某一年已写出的指数：outputs 为 plan[year]（指数名 -> 依赖指纹）。"""
+        self.years.setdefault(year, {}).update(outputs)
@@ -0,0 +1,126 @@
+"""
+NetCDF 时间轴的向量化解码与按年分组，nc2tiff.py 与 CN051_nc2tiff.py 共用。
+
+按 CF 约定解析 time 变量的 units（"<单位> since <参考时刻>"）与 calendar，用整数运算直接得到每个时间步的
+年、月、日：standard / gregorian / proleptic_gregorian 借助 numpy datetime64，noleap（365_day）、
+all_leap（366_day）与 360_day 按固定的月长度计算（360_day 中 2 月 30 日这类日期无法用 datetime64 表示）。
+不逐个生成 cftime 对象，也不逐元素拆分字符串；无法识别的 units 或其他日历（如 julian）退回 num2date。
+"""
+
+import re
+import numpy as np
+import netCDF4 as nc
+
+UNIT_SECONDS = {
+    "days": 86400, "day": 86400, "d": 86400,
+    "hours": 3600, "hour": 3600, "hr": 3600, "h": 3600,
+    "minutes": 60, "minute": 60, "min": 60,
+    "seconds": 1, "second": 1, "sec": 1, "s": 1,
+}
+UNITS_REGEX = re.compile(
+    r"^\s*(?P<unit>\w+)\s+since\s+(?P<year>-?\d{1,4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})"
+    r"(?:[ T](?P<hour>\d{1,2}):(?P<minute>\d{1,2})(?::(?P<second>\d{1,2}(?:\.\d*)?))?)?"
+    r"\s*(?:Z|UTC|[+-]0{1,2}(?::?00)?)?\s*$"
+)
+STANDARD_CALENDARS = {"standard", "gregorian", "proleptic_gregorian"}
+# 固定年长度的日历：每月天数
+MONTH_LENGTHS = {
+    "noleap": [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    "365_day": [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    "all_leap": [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    "366_day": [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    "360_day": [30] * 12,
+}
+
+
+def format_dates(years, months, days):
+    """年、月、日整数数组 -> "YYYY-MM-DD" 字符串列表（GeoTIFF 的波段描述）。"""
+    return [f"{y:04d}-{m:02d}-{d:02d}" for y, m, d in zip(years.tolist(), months.tolist(), days.tolist())]
+
+
+def _decode_with_cftime(values, units, calendar):
+    dates = nc.num2date(values, units, calendar=calendar)
+    years = np.array([d.year for d in dates], dtype=np.int64)
+    months = np.array([d.month for d in dates], dtype=np.int64)
+    days = np.array([d.day for d in dates], dtype=np.int64)
+    return years, months, days
+
+
+def decode_time(values, units, calendar="standard"):
+    """
+    把 CF 时间数值解码为年、月、日。
+
+    参数：
+    values: 1D数组，time 变量的数值
+    units: time 变量的 units 属性，如 "days since 1961-01-01"
+    calendar: time 变量的 calendar 属性
+
+    返回：
+    (years, months, days)：1D int64 数组
+    """
+    values = np.asarray(values, dtype=np.float64)
+    calendar = (calendar or "standard").lower()
+    match = UNITS_REGEX.match(units)
+    if match is None or match["unit"].lower() not in UNIT_SECONDS:
+        return _decode_with_cftime(values, units, calendar)
+    ref_year, ref_month, ref_day = int(match["year"]), int(match["month"]), int(match["day"])
+    # standard/gregorian 在 1582-10-15 之前为儒略历，与 datetime64 的公历不同
+    if calendar not in MONTH_LENGTHS and (calendar not in STANDARD_CALENDARS
+                                          or (calendar != "proleptic_gregorian" and ref_year < 1583)):
+        return _decode_with_cftime(values, units, calendar)
+
+    ref_seconds = (int(match["hour"] or 0) * 3600 + int(match["minute"] or 0) * 60
+                   + float(match["second"] or 0))
+    # 相对参考日 0 时的秒数，取到微秒以消除浮点误差（与 cftime 相同），再向下取整到日
+    seconds = np.round(ref_seconds + values * UNIT_SECONDS[match["unit"].lower()], 6)
+    day_offset = np.floor(seconds / 86400).astype(np.int64)
+
+    if calendar in STANDARD_CALENDARS:
+        dates = np.datetime64(f"{ref_year:04d}-{ref_month:02d}-{ref_day:02d}", "D") + day_offset
+        month_start = dates.astype("datetime64[M]")
+        years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+        months = month_start.astype(np.int64) % 12 + 1
+        days = (dates - month_start.astype("datetime64[D]")).astype(np.int64) + 1
+        return years, months, days
+
+    month_starts = np.concatenate([[0], np.cumsum(MONTH_LENGTHS[calendar])])
+    year_length = month_starts[-1]
+    total = month_starts[ref_month - 1] + ref_day - 1 + day_offset
+    years = ref_year + total // year_length
+    day_of_year = total % year_length
+    months = np.searchsorted(month_starts, day_of_year, side="right")
+    days = day_of_year - month_starts[months - 1] + 1
+    return years, months, days
+
+
+def read_time(dataset):
+    """
+    读取并解码 NetCDF 数据集的 time 变量。
+
+    返回：
+    years: 1D int64 数组，每个时间步的年份
+    dates: "YYYY-MM-DD" 字符串列表，可直接作为波段描述
+    """
+    time_var = dataset.variables['time']
+    calendar = time_var.calendar if 'calendar' in time_var.ncattrs() else "standard"
+    years, months, days = decode_time(np.ma.getdata(time_var[:]), time_var.units, calendar)
+    return years, format_dates(years, months, days)
+
+
+def year_groups(years):
+    """
+    按年份把时间轴分段（要求时间递增）。
+
+    参数：
+    years: 1D数组，每个时间步的年份
+
+    返回：
+    list of (year, start, stop)：该年在时间轴上的切片 [start, stop)
+    """
+    years = np.asarray(years)
+    if np.any(np.diff(years) < 0):
+        raise ValueError("Time axis is not monotonically increasing")
+    unique = np.unique(years)
+    starts = np.searchsorted(years, unique, side="left")
+    stops = np.searchsorted(years, unique, side="right")
+    return [(int(year), int(start), int(stop)) for year, start, stop in zip(unique, starts, stops)]
@@ -0,0 +1,132 @@
+"""
+分块（按行）计算基准期逐日百分位阈值（TXin90/TXin10/TNin90/TNin10）。
+
+与 TXin90p.py 等脚本的结果一致（以日序为中心的 5 天滑动窗口、跨年循环、np.percentile 线性插值），
+但不再把 54 年的逐日数据全部放入内存：每次只读取一个行块的全部基准期数据，
+同一变量的多个百分位数在一次读取中同时得到，并按块直接写入 366 波段的 GeoTIFF。
+"""
+
+import os
+from contextlib import ExitStack
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from tqdm import tqdm
+
+from etccdi_engine import band_day_of_year
+
+DAYS_OF_YEAR = 366
+
+
+def window_sample_indices(day_of_year, window_days=5):
+    """
+    计算每个日序的滑动窗口在拼接时间轴上对应的样本下标。
+
+    参数：
+    day_of_year: 1D整型数组，基准期所有波段（按年拼接）的 0-based 日序
+    window_days: 窗口长度（奇数，默认 5，即前后各 2 天，366 天循环）
+
+    返回：
+    samples: 长度 366 的列表，每个元素为该日序窗口内所有样本的下标数组
+    """
+    half = window_days // 2
+    by_day = [np.flatnonzero(day_of_year == d) for d in range(DAYS_OF_YEAR)]
+    samples = []
+    for day in range(DAYS_OF_YEAR):
+        offsets = [by_day[(day + offset) % DAYS_OF_YEAR] for offset in range(-half, half + 1)]
+        samples.append(np.concatenate(offsets))
+    return samples
+
+
+def lerp(a, b, gamma):
+    """与 np.percentile（linear，标量 q）逐位一致的插值：gamma 为 float64，按样本精度参与运算。"""
+    diff = b - a
+    lower = a + diff * gamma.astype(a.dtype)
+    upper = b - diff * (1 - gamma).astype(a.dtype)
+    return np.where(gamma >= 0.5, upper, lower)
+
+
+def rows_per_block(width, total_days, samples_per_window, n_outputs, memory_limit_mb):
+    """根据内存预算估算每块的行数（块数据 + 窗口样本及排序副本 + 输出阈值）。"""
+    bytes_per_row = width * 4 * (total_days + 3 * samples_per_window + n_outputs * DAYS_OF_YEAR)
+    return max(1, int(memory_limit_mb * 1024 ** 2 // bytes_per_row))
+
+
+def build_thresholds(input_files, outputs, years, window_days=5, memory_limit_mb=1024):
+    """
+    一次读取计算同一变量的多个逐日百分位阈值，并写出 366 波段 GeoTIFF。
+
+    参数：
+    input_files: list - 基准期逐年文件路径（与 years 一一对应）
+    outputs: dict - 输出文件路径 -> 百分位数，如 {r"...\\TXin90.tif": 90, r"...\\TXin10.tif": 10}
+    years: list - 基准期年份
+    window_days: 滑动窗口长度（默认 5）
+    memory_limit_mb: 每块可用的内存预算（MB）
+    """
+    output_files = list(outputs.keys())
+    percentiles = [outputs[path] for path in output_files]
+
+    with ExitStack() as stack:
+        sources = [stack.enter_context(rasterio.open(path)) for path in input_files]
+        height, width = sources[0].height, sources[0].width
+
+        # 所有年份的日序只解析一次
+        day_of_year = np.concatenate([band_day_of_year(src.descriptions, year)
+                                      for src, year in zip(sources, years)])
+        samples = window_sample_indices(day_of_year, window_days)
+        block_rows = rows_per_block(width, len(day_of_year), max(len(s) for s in samples),
+                                    len(output_files), memory_limit_mb)
+
+        meta = sources[0].meta.copy()
+        meta.update({"count": DAYS_OF_YEAR, "dtype": "float32", "compress": "lzw"})
+        destinations = []
+        for path in output_files:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            dst = stack.enter_context(rasterio.open(path, "w", **meta))
+            for day in range(DAYS_OF_YEAR):
+                dst.set_band_description(day + 1, f"Day-{day + 1}")
+            destinations.append(dst)
+
+        for row_start in tqdm(range(0, height, block_rows), desc="Computing thresholds"):
+            window = Window(0, row_start, width, min(block_rows, height - row_start))
+
+            # 读取当前块的全部基准期数据 (total_days, rows, width)
+            block = np.concatenate([src.read(window=window) for src in sources], axis=0)
+
+            thresholds = np.full((len(percentiles), DAYS_OF_YEAR, window.height, width), np.nan, dtype=np.float32)
+            for day in range(DAYS_OF_YEAR):
+                if len(samples[day]) == 0:  # 避免空数据计算
+                    continue
+                window_stack = block[samples[day]]
+                # 逐个以标量百分位数计算，使插值与原脚本一样保持 float32（列表形式会按 float64 插值）；
+                # 后一次调用复用前一次在 window_stack 上的部分排序
+                for i, q in enumerate(percentiles):
+                    thresholds[i, day] = np.percentile(window_stack, q, axis=0, overwrite_input=True)
+
+            for dst, values in zip(destinations, thresholds):
+                dst.write(values, window=window)
+
+
+if __name__ == "__main__":
+    # 基准期
+    start_year, end_year = 1961, 2014
+    years = list(range(start_year, end_year + 1))
+
+    # 每个变量一次读取得到 90 与 10 百分位阈值
+    variables = {
+        "tmax": {
+            r"F:\climate extremes\TX90p\threshold\TXin90.tif": 90,
+            r"F:\climate extremes\TX10p\threshold\TXin10.tif": 10,
+        },
+        "tmin": {
+            r"F:\climate extremes\TN90p\threshold\TNin90.tif": 90,
+            r"F:\climate extremes\TN10p\threshold\TNin10.tif": 10,
+        },
+    }
+    data_root = r"F:\QTP_CN05.1_converted"
+    memory_limit_mb = 2048  # 根据内存调整
+
+    for var, outputs in variables.items():
+        input_files = [os.path.join(data_root, var, f"{var}_{year}.tif") for year in years]
+        build_thresholds(input_files, outputs, years, memory_limit_mb=memory_limit_mb)
+        print(f"{var} thresholds completed:", ", ".join(outputs.keys()))
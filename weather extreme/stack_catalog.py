@@ -0,0 +1,172 @@
+"""
+CN051_nc2tiff.py 输出的逐年多波段 GeoTIFF（<变量>_<年份>.tif）的目录索引。
+
+每个数据目录下保存一个 catalog.json，记录每个文件的波段日期、0-based 日序、是否闰年以及栅格元数据
+（大小、数据类型、坐标系、仿射变换、nodata）。索引只需建立一次，之后直接加载，
+不必在每个脚本中逐波段解析 src.descriptions；阈值可按日序一次花式索引取出：threshold[day_of_year]。
+文件的大小或修改时间变化时，加载时自动重建对应条目。
+"""
+
+import os
+import re
+import json
+import numpy as np
+import rasterio
+
+CATALOG_NAME = "catalog.json"
+FILE_REGEX = re.compile(r"^(?P<prefix>.+)_(?P<year>\d{4})\.tif$")
+
+
+def dates_to_day_of_year(dates, year):
+    """把 "YYYY-MM-DD" 日期序列转换为 0-based 日序（1D int64 数组）。"""
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    return (dates - np.datetime64(f"{year:04d}-01-01")).astype(np.int64)
+
+
+def is_leap_year(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def describe_stack(path, year):
+    """读取一个逐年文件的波段日期与元数据，返回索引条目（dict）。"""
+    stat = os.stat(path)
+    with rasterio.open(path) as src:
+        dates = list(src.descriptions)
+        entry = {
+            "file": os.path.basename(path),
+            "year": year,
+            "bands": src.count,
+            "height": src.height,
+            "width": src.width,
+            "dtype": src.dtypes[0],
+            "crs": src.crs.to_wkt() if src.crs else None,
+            "transform": list(src.transform)[:6],
+            "nodata": None if src.nodata is None else float(src.nodata),
+        }
+    entry.update({
+        "dates": dates,
+        "day_of_year": dates_to_day_of_year(dates, year).tolist(),
+        "leap": is_leap_year(year),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+    })
+    return entry
+
+
+class StackCatalog:
+    """
+    一个数据目录的逐年文件索引。
+
+    参数：
+    data_dir: 数据目录
+    entries: dict - 年份 -> 索引条目（见 describe_stack）
+    """
+
+    def __init__(self, data_dir, entries):
+        self.data_dir = data_dir
+        self.entries = dict(sorted(entries.items()))
+        self._day_of_year = {}
+
+    @property
+    def years(self):
+        return list(self.entries)
+
+    def __contains__(self, year):
+        return year in self.entries
+
+    def path(self, year):
+        return os.path.join(self.data_dir, self.entries[year]["file"])
+
+    def dates(self, year):
+        """波段日期（datetime64[D] 数组）。"""
+        return np.asarray(self.entries[year]["dates"], dtype="datetime64[D]")
+
+    def day_of_year(self, year):
+        """波段对应的 0-based 日序（1D int64 数组，0-365）。"""
+        if year not in self._day_of_year:
+            self._day_of_year[year] = np.asarray(self.entries[year]["day_of_year"], dtype=np.int64)
+        return self._day_of_year[year]
+
+    def is_leap(self, year):
+        return self.entries[year]["leap"]
+
+    def gather(self, daily, year):
+        """按波段日序取出 366 天数组中对应的层：daily[day_of_year]，形状 (bands, ...)。"""
+        return daily[self.day_of_year(year)]
+
+    def save(self):
+        with open(os.path.join(self.data_dir, CATALOG_NAME), "w", encoding="utf-8") as f:
+            json.dump({str(year): entry for year, entry in self.entries.items()}, f)
+
+
+def _scan(data_dir, prefix=None):
+    """目录中符合 <变量>_<年份>.tif 命名的文件：年份 -> 路径。"""
+    files = {}
+    for name in os.listdir(data_dir):
+        match = FILE_REGEX.match(name)
+        if match and (prefix is None or match.group("prefix") == prefix):
+            files[int(match.group("year"))] = os.path.join(data_dir, name)
+    return files
+
+
+def build_catalog(data_dir, prefix=None):
+    """
+    扫描目录并（重新）建立索引，写出 data_dir/catalog.json。
+
+    参数：
+    data_dir: 数据目录
+    prefix: 可选，只收录指定变量前缀的文件（如 "tmax"）；None 收录全部
+
+    返回：
+    catalog: StackCatalog
+    """
+    entries = {year: describe_stack(path, year) for year, path in _scan(data_dir, prefix).items()}
+    catalog = StackCatalog(data_dir, entries)
+    catalog.save()
+    return catalog
+
+
+def load_catalog(data_dir, prefix=None, refresh=True):
+    """
+    加载目录索引；不存在时建立。
+
+    参数：
+    data_dir: 数据目录
+    prefix: 可选，只收录指定变量前缀的文件
+    refresh: 为 True 时检查文件的大小与修改时间，只重建新增或变化的条目（有变化时写回 catalog.json）
+
+    返回：
+    catalog: StackCatalog
+    """
+    catalog_file = os.path.join(data_dir, CATALOG_NAME)
+    if not os.path.exists(catalog_file):
+        return build_catalog(data_dir, prefix)
+
+    with open(catalog_file, encoding="utf-8") as f:
+        entries = {int(year): entry for year, entry in json.load(f).items()}
+    if not refresh:
+        return StackCatalog(data_dir, entries)
+
+    files = _scan(data_dir, prefix)
+    changed = set(entries) - set(files)
+    for year in changed:
+        del entries[year]
+    for year, path in files.items():
+        stat = os.stat(path)
+        entry = entries.get(year)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            entries[year] = describe_stack(path, year)
+            changed.add(year)
+
+    catalog = StackCatalog(data_dir, entries)
+    if changed:
+        catalog.save()
+    return catalog
+
+
+if __name__ == "__main__":
+    # 为转换后的各变量目录建立索引
+    data_root = r"F:\QTP_CN05.1_converted"
+    for var in ["pre", "tmax", "tmin", "tmean"]:
+        catalog = build_catalog(os.path.join(data_root, var))
+        print(f"{var}: {len(catalog.years)} files indexed")
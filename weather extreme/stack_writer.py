@@ -0,0 +1,146 @@
+"""
+按指数输出多波段云优化 GeoTIFF（COG）：每个指数一个文件，每年一个波段（波段描述为 "<指数>_<年份>"），
+代替每个指数每年一个单波段文件，趋势分析与制图只需打开一个文件。
+
+写出在后台线程中进行：计算线程把结果放入队列后即可继续计算下一年，后台线程写入分块的临时 GeoTIFF；
+全部年份写完后由 GDAL 的 COG 驱动复制为最终文件（DEFLATE 压缩 + 浮点预测、内部概览、256×256 分块）。
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import rasterio
+from rasterio.shutil import copy as copy_dataset
+
+# COG 驱动的默认创建选项
+COG_OPTIONS = {
+    "COMPRESS": "DEFLATE",
+    "PREDICTOR": "YES",  # 浮点数据使用浮点预测（PREDICTOR=3）
+    "BLOCKSIZE": 256,
+    "OVERVIEWS": "AUTO",
+    "OVERVIEW_RESAMPLING": "AVERAGE",
+    "BIGTIFF": "IF_SAFER",
+}
+
+
+class StackWriter:
+    """
+    多个指数的多波段 COG 的后台写出。
+
+    参数：
+    output_file: callable - 指数名 -> 最终 COG 路径
+    years: 年份序列，决定波段顺序（第 i 个年份写入第 i + 1 个波段）
+    queue_size: 队列中最多等待写出的数组个数（超过时 write 阻塞，限制内存）
+    cog_options: 可选，覆盖 COG_OPTIONS 中的创建选项
+    finalize_workers: 写完后并行转换为 COG 的线程数
+    """
+
+    def __init__(self, output_file, years, queue_size=16, cog_options=None, finalize_workers=4):
+        self.output_file = output_file
+        self.years = list(years)
+        self.band_of_year = {year: band for band, year in enumerate(self.years, start=1)}
+        self.cog_options = {**COG_OPTIONS, **(cog_options or {})}
+        self.finalize_workers = finalize_workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._datasets = {}
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="StackWriter", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(finalize=exc_type is None)
+
+    def temporary_file(self, name):
+        return os.path.splitext(self.output_file(name))[0] + ".partial.tif"
+
+    def write(self, name, year, array, meta, window=None):
+        """
+        把某个指数某一年的结果（整幅或一个窗口）放入写出队列。
+
+        参数：
+        name: 指数名
+        year: 年份（须在 years 中）
+        array: 2D数组
+        meta: 整幅栅格的元数据（width、height、crs、transform）
+        window: rasterio Window，array 对应的窗口（None 为整幅）
+        """
+        if self._error is not None:
+            raise RuntimeError("Background stack writer failed") from self._error
+        self._queue.put((name, year, array, meta, window))
+
+    def _open(self, name, meta):
+        path = self.temporary_file(name)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        block = self.cog_options["BLOCKSIZE"]
+        profile = {
+            "driver": "GTiff", "dtype": "float32", "nodata": np.nan, "count": len(self.years),
+            "width": meta["width"], "height": meta["height"], "crs": meta["crs"], "transform": meta["transform"],
+            "tiled": True, "blockxsize": block, "blockysize": block, "BIGTIFF": "IF_SAFER",
+            # 按波段存储且不预先写入空块：未写入的年份（如缺少输入）读出为 nodata（NaN）
+            "interleave": "band", "SPARSE_OK": True,
+        }
+        dst = rasterio.open(path, "w", **profile)
+        for year, band in self.band_of_year.items():
+            dst.set_band_description(band, f"{name}_{year}")
+        return dst
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                continue  # 出错后只清空队列，避免计算线程阻塞
+            name, year, array, meta, window = item
+            try:
+                if name not in self._datasets:
+                    self._datasets[name] = self._open(name, meta)
+                self._datasets[name].write(np.asarray(array, dtype=np.float32), self.band_of_year[year],
+                                           window=window)
+            except Exception as error:
+                self._error = error
+        for dst in self._datasets.values():
+            dst.close()
+
+    def _finalize(self, name):
+        temporary = self.temporary_file(name)
+        with rasterio.open(temporary) as src:
+            copy_dataset(src, self.output_file(name), driver="COG", **self.cog_options)
+        os.remove(temporary)
+
+    def close(self, finalize=True):
+        """等待队列写完；finalize 为 True 时把临时文件转换为 COG，否则删除临时文件。"""
+        self._queue.put(None)
+        self._thread.join()
+        names = list(self._datasets)
+        if self._error is not None or not finalize:
+            for name in names:
+                if os.path.exists(self.temporary_file(name)):
+                    os.remove(self.temporary_file(name))
+            if self._error is not None:
+                raise RuntimeError("Background stack writer failed") from self._error
+            return
+        with ThreadPoolExecutor(max_workers=max(1, min(self.finalize_workers, len(names)))) as pool:
+            list(pool.map(self._finalize, names))
+
+
+def stack_yearly_files(name, yearly_files, output_path, cog_options=None):
+    """
+    把已有的逐年单波段结果合并为一个多波段 COG。
+
+    参数：
+    name: 指数名（用于波段描述）
+    yearly_files: dict - 年份 -> 单波段文件路径
+    output_path: 输出 COG 路径
+    cog_options: 可选，覆盖 COG_OPTIONS
+    """
+    years = sorted(yearly_files)
+    with StackWriter(lambda _: output_path, years, cog_options=cog_options) as writer:
+        for year in years:
+            with rasterio.open(yearly_files[year]) as src:
+                writer.write(name, year, src.read(1), src.meta)
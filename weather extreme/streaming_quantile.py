@@ -0,0 +1,224 @@
+"""
+逐像元湿日降水百分位数（PRwn95/PRwn99）的流式计算。
+
+PRwn95CN051.py 原先把基准期所有年份的湿日降水拼接后调用 np.nanpercentile，内存随年份数线性增长。
+这里按行窗口、逐年读取数据，每次只持有一年的窗口数据和固定大小的统计量：
+- "exact"：两遍扫描。第一遍统计每个像元在对数分箱中的湿日个数，确定目标次序统计量所在的分箱；
+           第二遍只收集落在这些分箱内的降水值并排序，得到与 np.nanpercentile（linear）逐位一致的结果；
+           收集缓冲超过内存预算时按像元分组，逐组重新读取窗口收集，内存不随湿日数无界增长；
+- "sketch"：一遍扫描。只统计细分的对数分箱直方图，在目标次序所在的分箱内插值，
+           相对误差不超过分箱宽度（默认约 0.5%），适合快速预览或超大区域。
+多个百分位数（如 95 与 99）共用同一次扫描。
+"""
+
+from contextlib import ExitStack
+from functools import partial
+import numpy as np
+import rasterio
+from tqdm import tqdm
+
+from etccdi_engine import STACK_OVERHEAD, rows_per_window, row_windows, single_band_meta
+from etccdi_kernels import WET_DAY_THRESHOLD
+from percentile_thresholds import lerp
+
+MAX_PRECIP = 10000.0  # 分箱上界（mm），更大的值归入最后一个分箱
+EXACT_BINS = 256  # exact 模式第一遍的分箱数
+SKETCH_BINS = 2048  # sketch 模式的分箱数
+
+
+def log_bin_edges(n_bins, threshold=WET_DAY_THRESHOLD):
+    """湿日阈值到 MAX_PRECIP 之间的对数等距分箱边界（n_bins + 1 个）。"""
+    return np.geomspace(threshold, MAX_PRECIP, n_bins + 1)
+
+
+def _wet_bins(data, edges, threshold):
+    """
+    湿日降水所在的分箱序号。
+
+    返回：
+    bins: 与 data 同形状的整型数组，非湿日（含 NaN）为 -1
+    """
+    bins = np.searchsorted(edges, data, side="right") - 1
+    np.clip(bins, 0, len(edges) - 2, out=bins)
+    bins[~(data >= threshold)] = -1
+    return bins
+
+
+def _accumulate_histogram(histogram, bins):
+    """把一年的分箱序号 (days, P) 累加到直方图 (n_bins, P)。"""
+    n_bins, n_pixels = histogram.shape
+    wet = bins >= 0
+    flat = bins[wet] * n_pixels + np.nonzero(wet)[1]
+    histogram += np.bincount(flat, minlength=n_bins * n_pixels).reshape(n_bins, n_pixels).astype(histogram.dtype)
+
+
+def _target_ranks(counts, q):
+    """与 np.percentile（linear）一致的相邻次序及插值权重；counts 为每个像元的湿日数。"""
+    quantile = q / 100
+    virtual = counts * quantile + (1 - quantile) - 1
+    lower = np.floor(virtual).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    return np.maximum(lower, 0), np.maximum(upper, 0), virtual - lower
+
+
+def _rank_bin(cumulative, rank):
+    """次序 rank（0-based）所在的分箱：第一个累计个数 > rank 的分箱。"""
+    return np.argmax(cumulative > rank[None], axis=0)
+
+
+def _read_windows(sources, window):
+    """逐年读取同一窗口，返回 (days, P) 的 float32 数组。"""
+    for src in sources:
+        yield src.read(window=window).astype(np.float32).reshape(src.count, -1)
+
+
+def _pixel_groups(sizes, budget_bytes):
+    """
+    把像元划分为连续的组，使每组的收集缓冲（各百分位数的最大收集个数之和 × 组内像元数 × 4 字节）
+    不超过 budget_bytes（单个像元超出时单独成组）。
+
+    参数：
+    sizes: (n_quantiles, P) 每个百分位数每个像元需收集的值的个数
+
+    返回：
+    list of slice
+    """
+    n_pixels = sizes.shape[1]
+    groups, start = [], 0
+    while start < n_pixels:
+        # 从 start 起各百分位数收集个数的累计最大值，缓冲大小随组长单调不减
+        padded = np.maximum.accumulate(np.maximum(sizes[:, start:], 1), axis=1).sum(axis=0)
+        cost = padded * np.arange(1, n_pixels - start + 1) * 4
+        stop = start + max(1, int(np.searchsorted(cost, budget_bytes, side="right")))
+        groups.append(slice(start, stop))
+        start = stop
+    return groups
+
+
+def _exact_window(sources, window, quantiles, threshold, memory_limit_mb=None):
+    """exact 模式：两遍扫描得到一个窗口内的精确百分位数（第二遍的收集缓冲受 memory_limit_mb 限制）。"""
+    edges = log_bin_edges(EXACT_BINS, threshold)
+    n_pixels = window.height * window.width
+    histogram = np.zeros((EXACT_BINS, n_pixels), dtype=np.int64)
+    for data in _read_windows(sources, window):
+        _accumulate_histogram(histogram, _wet_bins(data, edges, threshold))
+
+    counts = histogram.sum(axis=0)
+    cumulative = np.cumsum(histogram, axis=0)
+    pixels = np.arange(n_pixels)
+
+    # 每个百分位数需要的分箱范围、其前面的湿日数与需收集的值的个数
+    targets = []
+    for q in quantiles:
+        lower, upper, gamma = _target_ranks(counts, q)
+        first_bin = _rank_bin(cumulative, lower)
+        last_bin = _rank_bin(cumulative, upper)
+        below = cumulative[first_bin, pixels] - histogram[first_bin, pixels]
+        size = cumulative[last_bin, pixels] - below
+        targets.append((lower - below, upper - below, gamma, first_bin, last_bin, size))
+
+    sizes = np.stack([target[5] for target in targets])
+    if memory_limit_mb is None:
+        groups = [slice(0, n_pixels)]
+    else:
+        groups = _pixel_groups(sizes, memory_limit_mb * 1024 ** 2)
+
+    results = [np.full(n_pixels, np.nan, dtype=np.float32) for _ in quantiles]
+    for group in groups:
+        group_pixels = np.arange(group.stop - group.start)
+        buffers = [(np.full((max(int(size[group].max()), 1), len(group_pixels)), np.inf, dtype=np.float32),
+                    np.zeros(len(group_pixels), dtype=np.int64)) for *_, size in targets]
+
+        # 第二遍：只收集目标分箱内的降水值
+        for data in _read_windows(sources, window):
+            data = data[:, group]
+            bins = _wet_bins(data, edges, threshold)
+            for (_, _, _, first_bin, last_bin, _), (buffer, filled) in zip(targets, buffers):
+                selected = (bins >= first_bin[group]) & (bins <= last_bin[group])
+                positions = filled + np.cumsum(selected, axis=0) - 1
+                day_index, pixel_index = np.nonzero(selected)
+                buffer[positions[day_index, pixel_index], pixel_index] = data[day_index, pixel_index]
+                filled += selected.sum(axis=0)
+
+        for values, (lower, upper, gamma, *_), (buffer, _) in zip(results, targets, buffers):
+            buffer.sort(axis=0)
+            last = buffer.shape[0] - 1
+            lower_values = buffer[np.clip(lower[group], 0, last), group_pixels]
+            upper_values = buffer[np.clip(upper[group], 0, last), group_pixels]
+            with np.errstate(invalid="ignore"):
+                values[group] = lerp(lower_values, upper_values, gamma[group])
+
+    for values in results:
+        values[counts == 0] = np.nan
+    return results
+
+
+def _sketch_window(sources, window, quantiles, threshold, n_bins=SKETCH_BINS):
+    """sketch 模式：一遍扫描的分箱直方图，在目标次序所在的分箱内插值。"""
+    edges = log_bin_edges(n_bins, threshold)
+    n_pixels = window.height * window.width
+    histogram = np.zeros((n_bins, n_pixels), dtype=np.int32)
+    for data in _read_windows(sources, window):
+        _accumulate_histogram(histogram, _wet_bins(data, edges, threshold))
+
+    counts = histogram.sum(axis=0)
+    cumulative = np.cumsum(histogram, axis=0)
+    pixels = np.arange(n_pixels)
+
+    def estimate(rank):
+        # 次序 rank 的值：假设分箱内的值在对数尺度上均匀分布
+        target_bin = _rank_bin(cumulative, rank)
+        below = cumulative[target_bin, pixels] - histogram[target_bin, pixels]
+        fraction = (rank - below + 0.5) / np.maximum(histogram[target_bin, pixels], 1)
+        return edges[target_bin] * (edges[target_bin + 1] / edges[target_bin]) ** np.clip(fraction, 0, 1)
+
+    results = []
+    for q in quantiles:
+        # 相邻两个次序分别在各自分箱内估计，相对误差不超过一个分箱宽度
+        lower, upper, gamma = _target_ranks(counts, q)
+        values = (estimate(lower) * (1 - gamma) + estimate(upper) * gamma).astype(np.float32)
+        values[counts == 0] = np.nan
+        results.append(values)
+    return results
+
+
+def wet_day_quantiles(input_files, quantiles=(95, 99), method="exact", memory_limit_mb=1024,
+                      threshold=WET_DAY_THRESHOLD):
+    """
+    逐像元计算基准期湿日降水的多个百分位数。
+
+    参数：
+    input_files: list - 基准期逐年降水文件路径
+    quantiles: 百分位数序列，如 (95, 99)
+    method: "exact"（两遍扫描，与 np.nanpercentile 逐位一致）或 "sketch"（一遍扫描，近似）
+    memory_limit_mb: 每个行窗口可用的内存预算（MB）；exact 模式第二遍的收集缓冲也不超过该预算
+    threshold: 湿日阈值（mm）
+
+    返回：
+    results: dict - 百分位数 -> 2D float32 数组（无湿日的像元为 NaN）
+    meta: 单波段输出元数据
+    """
+    if method == "exact":
+        compute_window, n_bins = partial(_exact_window, memory_limit_mb=memory_limit_mb), EXACT_BINS
+    elif method == "sketch":
+        compute_window, n_bins = _sketch_window, SKETCH_BINS
+    else:
+        raise ValueError(f"Unknown method: {method}")
+
+    with ExitStack() as stack:
+        sources = [stack.enter_context(rasterio.open(path)) for path in input_files]
+        height, width = sources[0].height, sources[0].width
+        meta = single_band_meta(sources[0].meta)
+
+        # 每个像元：一年的数据栈及临时数组 + 直方图（exact 模式的收集缓冲在 _exact_window 中按预算分组）
+        max_days = max(src.count for src in sources)
+        bytes_per_pixel = STACK_OVERHEAD * 4 * max_days + 2 * 8 * n_bins
+        rows = rows_per_window(width, bytes_per_pixel, memory_limit_mb)
+
+        results = {q: np.full((height, width), np.nan, dtype=np.float32) for q in quantiles}
+        for window in tqdm(list(row_windows(height, width, rows)), desc=f"Computing wet-day quantiles ({method})"):
+            values = compute_window(sources, window, quantiles, threshold)
+            for q, array in zip(quantiles, values):
+                results[q][window.toslices()] = array.reshape(window.height, window.width)
+    return results, meta
+
@@ -0,0 +1,161 @@
+"""
+生成与 CN05.1 转换结果同样组织的合成逐日数据（基准测试用）。
+
+每个变量一个目录、每年一个多波段 GeoTIFF（pre_<年份>.tif、tmax_<年份>.tif、tmin_<年份>.tif、tm_<年份>.tif），
+波段描述为 "YYYY-MM-DD"，闰年 366 个波段，区域外为 NaN（不规则的研究区掩膜），与 CN051_nc2tiff.py 的输出一致，
+并为每个目录建立 catalog.json。栅格大小取 0.25° 的青藏高原裁剪区与全国范围两种。
+数值只求量级与季节变化合理（气温带季节循环与自相关扰动，降水为季节性湿日概率与偏态雨量），不代表真实气候。
+"""
+
+import os
+import datetime
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from tqdm import tqdm
+
+from etccdi_engine import FILE_PATTERNS
+from stack_catalog import build_catalog, is_leap_year
+
+# 0.25° 网格：行数、列数、左上角经纬度
+GRIDS = {
+    "qtp": {"height": 56, "width": 128, "west": 73.0, "north": 40.0},
+    "china": {"height": 163, "width": 283, "west": 69.625, "north": 55.375},
+}
+RESOLUTION = 0.25
+VARIABLES = ["pre", "tmax", "tmin", "tmean"]
+
+
+def region_mask(height, width, rng, coverage=0.7):
+    """
+    不规则的研究区掩膜（True 为区域外）：低分辨率随机场放大、平滑后取分位数，外加椭圆包络。
+    """
+    coarse = rng.normal(size=(height // 8 + 2, width // 8 + 2))
+    field = np.kron(coarse, np.ones((8, 8)))[:height, :width]
+    for axis in (0, 1):
+        field = (np.roll(field, 3, axis) + field + np.roll(field, -3, axis)) / 3
+    rows, cols = np.mgrid[0:height, 0:width]
+    ellipse = ((rows - height / 2) / (height / 2)) ** 2 + ((cols - width / 2) / (width / 2)) ** 2
+    score = field - 2 * ellipse
+    return score < np.quantile(score, 1 - coverage)
+
+
+def year_dates(year):
+    days = 366 if is_leap_year(year) else 365
+    start = datetime.date(year, 1, 1)
+    return [(start + datetime.timedelta(days=i)).isoformat() for i in range(days)]
+
+
+def _temperature_fields(height, width, rng):
+    """逐像元的年平均气温（随纬度与随机"地形"降低）及日较差。"""
+    latitude = np.linspace(1, 0, height)[:, None]
+    relief = np.kron(rng.normal(size=(height // 4 + 1, width // 4 + 1)), np.ones((4, 4)))[:height, :width]
+    mean = 12 - 18 * latitude - 4 * np.abs(relief)
+    dtr = 10 + 2 * rng.normal(size=(height, width))
+    return mean.astype(np.float32), np.clip(dtr, 4, 18).astype(np.float32)
+
+
+def _temperature_year(day_count, mean, rng, persistence=0.8):
+    """一年的日平均气温：季节循环 + AR(1) 扰动。"""
+    t = np.arange(day_count)[:, None, None]
+    seasonal = mean + 13 * np.sin((t - 105) / day_count * 2 * np.pi)
+    noise = rng.normal(0, 2.5, (day_count,) + mean.shape).astype(np.float32)
+    for day in range(1, day_count):
+        noise[day] += persistence * noise[day - 1]
+    return (seasonal + noise).astype(np.float32)
+
+
+def _precipitation_year(day_count, shape, rng):
+    """一年的日降水：季风季节湿日概率较高，雨量为伽马分布。"""
+    t = np.arange(day_count)[:, None, None]
+    wet_probability = 0.12 + 0.4 * np.exp(-((t - 200) / 60.0) ** 2)
+    wet = rng.random((day_count,) + shape) < wet_probability
+    return np.where(wet, rng.gamma(0.6, 9, (day_count,) + shape), 0).astype(np.float32)
+
+
+def _write_stack(path, data, dates, grid):
+    meta = {
+        "driver": "GTiff", "dtype": "float32", "nodata": np.nan, "count": data.shape[0],
+        "height": data.shape[1], "width": data.shape[2], "crs": "EPSG:4326", "compress": "lzw",
+        "transform": from_origin(grid["west"], grid["north"], RESOLUTION, RESOLUTION),
+    }
+    with rasterio.open(path, "w", **meta) as dst:
+        dst.write(data)
+        for band, date in enumerate(dates, start=1):
+            dst.set_band_description(band, date)
+
+
+def generate_dataset(root, grid="qtp", years=range(1961, 1967), seed=0, missing_rate=0.0005):
+    """
+    生成合成数据集：root/<变量>/<文件名>，并建立各目录的 catalog.json。
+
+    参数：
+    root: 输出根目录
+    grid: "qtp" 或 "china"（见 GRIDS），也可直接传入同结构的 dict
+    years: 年份序列（应包含闰年）
+    seed: 随机种子
+    missing_rate: 区域内随机缺测（NaN）日的比例
+
+    返回：
+    input_dirs: dict - 变量名 -> 目录（可直接作为 ETCCDIEngine 的 input_dirs）
+    """
+    grid = GRIDS[grid] if isinstance(grid, str) else grid
+    height, width = grid["height"], grid["width"]
+    rng = np.random.default_rng(seed)
+    outside = region_mask(height, width, rng)
+    mean, dtr = _temperature_fields(height, width, rng)
+
+    input_dirs = {var: os.path.join(root, var) for var in VARIABLES}
+    for path in input_dirs.values():
+        os.makedirs(path, exist_ok=True)
+
+    for year in tqdm(list(years), desc=f"Generating synthetic {height}x{width} data"):
+        dates = year_dates(year)
+        tmean = _temperature_year(len(dates), mean, rng)
+        stacks = {
+            "tmean": tmean,
+            "tmax": tmean + dtr / 2,
+            "tmin": tmean - dtr / 2,
+            "pre": _precipitation_year(len(dates), (height, width), rng),
+        }
+        for var, data in stacks.items():
+            data[:, outside] = np.nan
+            data[rng.random(data.shape) < missing_rate] = np.nan
+            _write_stack(os.path.join(input_dirs[var], FILE_PATTERNS[var].format(year=year)), data, dates, grid)
+
+    for var, path in input_dirs.items():
+        build_catalog(path, prefix=FILE_PATTERNS[var].split("_")[0])
+    return input_dirs
+
+
+def generate_heat_index_inputs(root, grid="qtp", year=2000, month=7, seed=0):
+    """
+    生成 get_heat_index(HI).py 所需的一个月的日最高气温（K）与最小相对湿度（%）文件。
+
+    返回：
+    (tasmax_folder, hurs_folder)：以路径分隔符结尾，与脚本中的拼接方式一致
+    """
+    grid = GRIDS[grid] if isinstance(grid, str) else grid
+    height, width = grid["height"], grid["width"]
+    rng = np.random.default_rng(seed)
+    outside = region_mask(height, width, rng)
+    days = (datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.date(year, month, 1)).days
+    dates = [datetime.date(year, month, day + 1).isoformat() for day in range(days)]
+
+    tasmax = (273.15 + 28 + 6 * rng.normal(size=(days, height, width))).astype(np.float32)
+    hurs = np.clip(45 + 25 * rng.normal(size=(days, height, width)), 1, 100).astype(np.float32)
+    folders = []
+    for name, data, file_name in [("tasmax", tasmax, f"ERA5_T2mMax_Daily_{year}_{month}.tif"),
+                                  ("hurs", hurs, f"RHmin_{year}-{month}.tif")]:
+        folder = os.path.join(root, name)
+        os.makedirs(folder, exist_ok=True)
+        data[:, outside] = np.nan
+        _write_stack(os.path.join(folder, file_name), data, dates, grid)
+        folders.append(folder + os.sep)
+    return tuple(folders)
+
+
+if __name__ == "__main__":
+    # 两种网格各生成一套（含闰年 1964）
+    for name in GRIDS:
+        generate_dataset(os.path.join(r"F:\benchmark\synthetic", name), grid=name, years=range(1961, 1967))
@@ -6,9 +6,113 @@ Created on Sat Feb  8 21:42:44 2025
 """
 
 import os
-from osgeo import gdal
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import netCDF4 as nc
+import rasterio
+from rasterio.transform import Affine
+from rasterio.windows import Window
+from osgeo import gdal, osr, ogr
+from nc_time import read_time, year_groups
+from stack_catalog import build_catalog
 
-def batch_clip_raster_with_shapefile(input_folder, output_folder, mask_shapefile):
+# 青藏高原裁剪范围 (west, south, east, north)
+QTP_BOUNDS = (74.4552245904425689, 26.8719972341850593, 104.9324823737625536, 39.9207261153180610)
+
+
+def clip_window(geotransform, width, height, bounds):
+    """
+    求覆盖 bounds 的源网格窗口（向外取整到整像元，不重采样）。
+
+    参数：
+    geotransform: 源栅格的 GDAL GeoTransform（北向上）
+    width, height: 源栅格列数、行数
+    bounds: (west, south, east, north)
+
+    返回：
+    (row0, row1, col0, col1), 窗口的 GeoTransform
+    """
+    x0, dx, _, y0, _, dy = geotransform
+    dy = abs(dy)
+    west, south, east, north = bounds
+    # round 去掉浮点误差，避免恰好落在像元边界上的范围多取一行/列
+    col0 = max(0, math.floor(round((west - x0) / dx, 6)))
+    col1 = min(width, math.ceil(round((east - x0) / dx, 6)))
+    row0 = max(0, math.floor(round((y0 - north) / dy, 6)))
+    row1 = min(height, math.ceil(round((y0 - south) / dy, 6)))
+    if col0 >= col1 or row0 >= row1:
+        raise ValueError(f"Bounds {bounds} do not overlap the raster")
+    return (row0, row1, col0, col1), (x0 + col0 * dx, dx, 0, y0 - row0 * dy, 0, -dy)
+
+
+def rasterize_cutline(mask_shapefile, geotransform, width, height):
+    """
+    把掩膜 Shapefile 栅格化到给定网格（像元中心落在多边形内为 True，与 gdal.Warp 的 cutline 规则一致）。
+
+    返回：
+    inside: 2D bool 数组 (height, width)
+    """
+    mem = gdal.GetDriverByName("MEM").Create("", width, height, 1, gdal.GDT_Byte)
+    mem.SetGeoTransform(geotransform)
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    mem.SetProjection(srs.ExportToWkt())
+    shapes = ogr.Open(mask_shapefile)
+    gdal.RasterizeLayer(mem, [1], shapes.GetLayer(), burn_values=[1])
+    inside = mem.GetRasterBand(1).ReadAsArray().astype(bool)
+    del shapes, mem
+    return inside
+
+
+# 掩膜缓存：(Shapefile, 源网格 GeoTransform, 宽, 高, 裁剪范围) -> (窗口, 窗口 GeoTransform, 掩膜)
+_mask_cache = {}
+_mask_lock = threading.Lock()
+
+
+def cached_cutline_mask(mask_shapefile, geotransform, width, height, bounds=QTP_BOUNDS):
+    """
+    某个源网格上的裁剪窗口与掩膜，同一网格只栅格化一次（所有逐年文件共用一个网格）。
+
+    返回：
+    (row0, row1, col0, col1), 窗口的 GeoTransform, inside（窗口大小的 2D bool 数组）
+    """
+    key = (os.path.abspath(mask_shapefile), tuple(geotransform), width, height, tuple(bounds))
+    with _mask_lock:
+        if key not in _mask_cache:
+            window, clip_transform = clip_window(geotransform, width, height, bounds)
+            row0, row1, col0, col1 = window
+            inside = rasterize_cutline(mask_shapefile, clip_transform, col1 - col0, row1 - row0)
+            _mask_cache[key] = (window, clip_transform, inside)
+        return _mask_cache[key]
+
+
+def clip_raster_with_mask(input_raster, output_raster, mask_shapefile, bounds=QTP_BOUNDS):
+    """
+    只读取裁剪窗口内的数据，用缓存的掩膜把多边形外的像元设为 np.nan 后写出（保持源网格，不重采样）。
+    """
+    with rasterio.open(input_raster) as src:
+        (row0, row1, col0, col1), clip_transform, inside = cached_cutline_mask(
+            mask_shapefile, src.transform.to_gdal(), src.width, src.height, bounds)
+        data = src.read(window=Window(col0, row0, col1 - col0, row1 - row0)).astype(np.float32)
+        if src.nodata is not None and not np.isnan(src.nodata):
+            data[data == src.nodata] = np.nan
+        descriptions = src.descriptions
+        profile = src.profile
+    data[:, ~inside] = np.nan
+    profile.update(driver="GTiff", dtype="float32", nodata=np.nan, width=data.shape[2], height=data.shape[1],
+                   transform=Affine.from_gdal(*clip_transform), compress="lzw")
+    for key in ("blockxsize", "blockysize", "tiled", "interleave"):
+        profile.pop(key, None)
+    with rasterio.open(output_raster, "w", **profile) as dst:
+        dst.write(data)
+        for band, description in enumerate(descriptions, start=1):
+            if description:
+                dst.set_band_description(band, description)
+
+
+def batch_clip_raster_with_shapefile(input_folder, output_folder, mask_shapefile, mode="warp", workers=4):
     """
     批量按掩膜提取栅格数据（裁剪）。
 
@@ -16,7 +120,14 @@ def batch_clip_raster_with_shapefile(input_folder, output_folder, mask_shapefile
     input_folder: str - 输入栅格文件夹路径
     output_folder: str - 输出文件夹路径
     mask_shapefile: str - 掩膜 Shapefile 文件路径
+    mode: "warp"（默认）逐个文件调用 gdal.Warp（按 QTP_BOUNDS 双线性重采样，每次重新解析掩膜）；
+          "mask" 掩膜只栅格化一次并缓存，按窗口读取、数组运算置空，多线程并行处理。
+          注意 "mask" 的输出网格不同：窗口在源 0.25° 网格上向外取整、不重采样到 QTP_BOUNDS，
+          与 "warp" 的结果（及由其计算的阈值等）不能逐像元对齐，两种模式的输出不要混用
+    workers: mode="mask" 时的线程数
     """
+    if mode not in ("warp", "mask"):
+        raise ValueError(f"Unknown clip mode: {mode}")
     # 确保输出文件夹存在
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
@@ -24,6 +135,16 @@ def batch_clip_raster_with_shapefile(input_folder, output_folder, mask_shapefile
     # 获取输入文件夹中的所有 .tif 文件
     tif_files = [f for f in os.listdir(input_folder) if f.endswith('.tif')]
 
+    if mode == "mask":
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(clip_raster_with_mask, os.path.join(input_folder, f),
+                                   os.path.join(output_folder, f), mask_shapefile): f for f in tif_files}
+            for future, tif_file in futures.items():
+                future.result()
+                print(f"已保存到: {os.path.join(output_folder, tif_file)}")
+        print("批量裁剪完成！")
+        return
+
     # 遍历所有 .tif 文件并进行裁剪
     for tif_file in tif_files:
         input_raster = os.path.join(input_folder, tif_file)
@@ -35,7 +156,7 @@ def batch_clip_raster_with_shapefile(input_folder, output_folder, mask_shapefile
         gdal.Warp(
             output_raster,  # 输出文件路径
             input_raster,   # 输入文件路径
-            outputBounds=(74.4552245904425689, 26.8719972341850593, 104.9324823737625536, 39.9207261153180610),
+            outputBounds=QTP_BOUNDS,
             xRes=0.25,
             yRes=0.25,
             resampleAlg="bilinear",
@@ -49,6 +170,77 @@ def batch_clip_raster_with_shapefile(input_folder, output_folder, mask_shapefile
     print("批量裁剪完成！")
 
 
+def netcdf_year_vrts(nc_path, var):
+    """
+    按年生成原始 NetCDF 的虚拟数据集（内存中的 VRT，只记录当年的波段子集，不复制数据）。
+
+    GDAL 的 netCDF 驱动由 lon / lat 坐标向量得到地理参考，并把自南向北存储的数据翻转为北向上；
+    _FillValue / missing_value 作为 nodata。波段描述设为 "YYYY-MM-DD"，与转换后的 GeoTIFF 一致。
+
+    参数：
+    nc_path: NetCDF 文件路径
+    var: 变量名
+
+    返回：
+    生成器，逐年给出 (year, vrt)
+    """
+    with nc.Dataset(nc_path) as data:
+        years, dates = read_time(data)
+    source = gdal.Open(f'NETCDF:"{nc_path}":{var}')
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    for year, start, stop in year_groups(years):
+        vrt = gdal.Translate("", source, format="VRT", bandList=list(range(start + 1, stop + 1)),
+                             outputSRS=srs.ExportToWkt())
+        for i, date in enumerate(dates[start:stop], start=1):
+            vrt.GetRasterBand(i).SetDescription(date)
+        yield year, vrt
+        del vrt
+    del source
+
+
+def clip_netcdf_with_shapefile(nc_path, var, output_folder, mask_shapefile, prefix=None):
+    """
+    直接从原始 NetCDF 按年裁剪（经 netcdf_year_vrts 的虚拟数据集读取源文件），
+    不需要先用 CN051_nc2tiff.py 生成全区域的逐年 GeoTIFF。裁剪参数与 batch_clip_raster_with_shapefile 相同。
+
+    参数：
+    nc_path: NetCDF 文件路径
+    var: 变量名
+    output_folder: 输出文件夹，输出 <prefix>_<年份>.tif 并建立 catalog.json
+    mask_shapefile: 掩膜 Shapefile 文件路径
+    prefix: 输出文件名前缀（默认为变量名）
+    """
+    prefix = prefix or var
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    for year, vrt in netcdf_year_vrts(nc_path, var):
+        output_raster = os.path.join(output_folder, f"{prefix}_{year}.tif")
+        print(f"正在处理: {nc_path} {year}")
+        out = gdal.Warp(
+            output_raster,
+            vrt,
+            outputBounds=QTP_BOUNDS,
+            xRes=0.25,
+            yRes=0.25,
+            resampleAlg="bilinear",
+            cutlineDSName=mask_shapefile,
+            cropToCutline=True,
+            outputType=gdal.GDT_Float32,
+            dstNodata=np.nan,  # 源文件的缺测值在输出中为 NaN，与转换后的 GeoTIFF 一致
+            creationOptions=["COMPRESS=LZW"],
+        )
+        # gdal.Warp 不复制波段描述
+        for i in range(1, vrt.RasterCount + 1):
+            out.GetRasterBand(i).SetDescription(vrt.GetRasterBand(i).GetDescription())
+        out.FlushCache()
+        del out
+
+    build_catalog(output_folder, prefix=prefix)
+    print(f"已保存到: {output_folder}")
+
+
 # 示例用法
 if __name__ == "__main__":
     input_folder = r"F:\CN05.1_converted\tmax"  # 输入栅格文件夹路径
@@ -56,4 +248,10 @@ if __name__ == "__main__":
     mask_shapefile = r"E:\CMIP5&6 comparison\QTP_region\regions\QTP.shp"  # 掩膜 Shapefile 文件路径
 
     # 调用函数进行批量裁剪
-    batch_clip_raster_with_shapefile(input_folder, output_folder, mask_shapefile)
\ No newline at end of file
+    batch_clip_raster_with_shapefile(input_folder, output_folder, mask_shapefile)
+    # 可选 mode="mask"（掩膜只栅格化一次，多线程按窗口裁剪）；输出保持源网格，与 warp 的结果网格不同
+    # batch_clip_raster_with_shapefile(input_folder, output_folder, mask_shapefile, mode="mask", workers=8)
+
+    # 或不经转换，直接从原始 NetCDF 裁剪
+    # clip_netcdf_with_shapefile(r"F:\CN05.1\00 - CN051-2021\1961-2021\CN05.1_Tmax_1961_2021_daily_025x025.nc",
+    #                            "tmax", output_folder, mask_shapefile)
\ No newline at end of file